@@ -1,40 +1,56 @@
 import os
-import tempfile
-import datetime
 import logging
-import re
 import base64
+import hashlib
 import time
-from typing import Optional, Tuple
+from typing import Callable, Optional
 from PIL import Image as PILImage
 import io
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import cv2
 from dotenv import load_dotenv
 import streamlit as st
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-import plotly.express as px
-from openai import OpenAI
-import concurrent.futures
-import sqlite3
 import json
-import dlib
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as ReportLabImage
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
-from fpdf import FPDF
-import shutil
+from config.settings import STRUCTURED_OUTPUT, REPORT_WORKERS, WARM_UP_ON_START, XAI_BASE_URL, DEEPSEEK_BASE_URL
+from src.analysis_schema import (
+    ANALYSIS_SCHEMA, ANALYSIS_PROMPT, REPORT_SCHEMA, REPORT_PROMPT,
+    response_format, schema_prompt, parse_structured, render_analysis, render_report,
+)
+from src.report_jobs import ReportJobQueue, QUEUED, RUNNING, FAILED
+from src.score_extractor import extract_scores, response_hash, HEATMAP_REGIONS
+from src.response_logger import get_response_logger
+from src.blob_store import get_blob_store
+from src.single_flight import analysis_key, get_single_flight
+from src.skin_metrics import SkinMetrics, metrics_for_blob
+from src.ui_components import UIComponents
+from src.image_analyzer import get_face_detector
+from src import warmup
+from utils.helpers import lazy_import
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def configure_matplotlib(pyplot):
+    """設置中文字體（matplotlib 第一次使用時執行）"""
+    try:
+        # 使用更通用的字体设置，不依赖于SimHei
+        pyplot.rcParams['font.family'] = ['DejaVu Sans', 'Arial', 'sans-serif']
+        pyplot.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        
+        # 添加警告信息，告知用户中文可能无法正确显示
+        logger.info("已设置通用字体，中文字符可能无法正确显示")
+    except Exception as e:
+        logger.warning(f"设置字體失敗: {str(e)}，將使用默認字體")
+
+# 重量級套件延遲到第一次使用時才匯入：冷啟動與未進入分析／報告步驟的會話不需載入
+plt = lazy_import("matplotlib.pyplot", on_load=configure_matplotlib)
+cv2 = lazy_import("cv2")
+dlib = lazy_import("dlib")
+openai = lazy_import("openai")
+report_engine = lazy_import("src.report_engine")
+vector_charts = lazy_import("src.vector_charts")
+
 # 環境變量加載
 load_dotenv()
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
@@ -47,11 +63,16 @@ if not DEEPSEEK_API_KEY or not XAI_API_KEY:
     logger.info(f"XAI_API_KEY: {XAI_API_KEY}")
     st.stop()
 
-# 初始化 OpenAI 客戶端（用於 DeepSeek R1）
-deepseek_client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+# OpenAI 客戶端在第一次呼叫 API 時才建立（每個伺服器行程一份）
+@st.cache_resource
+def get_deepseek_client():
+    """DeepSeek 客戶端（用於 DeepSeek R1）"""
+    return openai.OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
 
-# 初始化 xAI 客戶端（用於 Grok-2-Vision-1212）
-xai_client = OpenAI(api_key=XAI_API_KEY, base_url="https://api.x.ai/v1")
+@st.cache_resource
+def get_xai_client():
+    """xAI 客戶端（用於 Grok-2-Vision-1212）"""
+    return openai.OpenAI(api_key=XAI_API_KEY, base_url=XAI_BASE_URL)
 
 # Streamlit 頁面配置
 st.set_page_config(
@@ -494,17 +515,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 設置中文字體
-try:
-    # 使用更通用的字体设置，不依赖于SimHei
-    plt.rcParams['font.family'] = ['DejaVu Sans', 'Arial', 'sans-serif']
-    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
-    
-    # 添加警告信息，告知用户中文可能无法正确显示
-    logger.info("已设置通用字体，中文字符可能无法正确显示")
-except Exception as e:
-    logger.warning(f"设置字體失敗: {str(e)}，將使用默認字體")
-
 # 支持多語言版本
 TRANSLATIONS = {
     "zh": {
@@ -528,8 +538,23 @@ def get_text(key, lang="zh"):
 def encode_image_to_base64(image_file: io.BytesIO) -> str:
     return base64.b64encode(image_file.getvalue()).decode('utf-8')
 
+# 分析流程使用的模型（single-flight 鍵的一部分）
+ANALYSIS_MODELS = "grok-2-vision-1212+deepseek-vision-v3"
+
 @st.cache_data(ttl=3600)
-def analyze_image(image_file: io.BytesIO) -> dict:
+def analyze_image(image_file: io.BytesIO, client_id: Optional[str] = None,
+                  _on_wait: Optional[Callable[[], None]] = None) -> dict:
+    # st.cache_data 不會合併同時發生的未命中：重複點擊或多個分頁分析同一張照片時，
+    # 只有一個會話呼叫 API，其他會話等待並共用結果
+    # _on_wait 以底線開頭，不納入快取鍵；等待提示的元件由呼叫端建立，避免在快取函式內產生元件
+    image_hash = hashlib.sha256(image_file.getvalue()).hexdigest()
+    return get_single_flight().do(
+        analysis_key(image_hash, ANALYSIS_MODELS),
+        lambda: run_image_analysis(image_file, image_hash, client_id),
+        on_wait=_on_wait
+    )
+
+def run_image_analysis(image_file: io.BytesIO, image_hash: str, client_id: Optional[str] = None) -> dict:
     try:
         logger.info("調用 Grok-2-Vision-1212 進行圖片分析")
         base64_image = encode_image_to_base64(image_file)
@@ -551,7 +576,23 @@ def analyze_image(image_file: io.BytesIO) -> dict:
             status_text.text("正在分析面部特徵...")
             time.sleep(0.5)
             
-            grok_response = xai_client.chat.completions.create(
+            if STRUCTURED_OUTPUT:
+                # 結構化模式：以 JSON schema 約束評分輸出，省去自由文本與正則解析
+                grok_prompt = ANALYSIS_PROMPT
+                grok_extra = {"response_format": response_format("face_analysis", ANALYSIS_SCHEMA, "xai")}
+            else:
+                grok_prompt = """
+                                    請對此面部照片進行詳細分析，提供結構化報告。針對以下區域：額頭、眼周、鼻子、頰骨、嘴唇、下巴，評估：
+                                    1. 皮膚狀況（乾燥、油性、痤瘡等）
+                                    2. 皺紋（深度、分布）
+                                    3. 色斑（類型、範圍）
+                                    4. 緊致度（鬆弛程度）
+                                    5. 其他特徵（毛孔、黑眼圈等）
+                                    對每個維度給出 0-5 分評分（0 表示嚴重問題，5 表示完美），並附上簡短描述。
+                                """
+                grok_extra = {}
+            
+            grok_response = get_xai_client().chat.completions.create(
                 model="grok-2-vision-1212",
                 messages=[
                     {
@@ -563,15 +604,7 @@ def analyze_image(image_file: io.BytesIO) -> dict:
                         "content": [
                             {
                                 "type": "text",
-                                "text": """
-                                    請對此面部照片進行詳細分析，提供結構化報告。針對以下區域：額頭、眼周、鼻子、頰骨、嘴唇、下巴，評估：
-                                    1. 皮膚狀況（乾燥、油性、痤瘡等）
-                                    2. 皺紋（深度、分布）
-                                    3. 色斑（類型、範圍）
-                                    4. 緊致度（鬆弛程度）
-                                    5. 其他特徵（毛孔、黑眼圈等）
-                                    對每個維度給出 0-5 分評分（0 表示嚴重問題，5 表示完美），並附上簡短描述。
-                                """
+                                "text": grok_prompt
                             },
                             {
                                 "type": "image_url",
@@ -581,7 +614,8 @@ def analyze_image(image_file: io.BytesIO) -> dict:
                             }
                         ]
                     }
-                ]
+                ],
+                **grok_extra
             )
             
             # 更新進度條 - 50%
@@ -590,13 +624,16 @@ def analyze_image(image_file: io.BytesIO) -> dict:
             time.sleep(0.5)
             
             # 儲存 Grok 回應
-            grok_filename = save_api_response("grok", grok_response.dict())
-            grok_analysis = grok_response.choices[0].message.content
+            grok_filename = save_api_response(grok_response, "grok", image_hash, client_id)
+            grok_raw = grok_response.choices[0].message.content
+            grok_structured = parse_structured(grok_raw) if STRUCTURED_OUTPUT else None
+            grok_analysis = render_analysis(grok_structured) if grok_structured else grok_raw
             logger.info(f"Grok分析成功，內容長度：{len(grok_analysis)}")
         except Exception as e:
             logger.error(f"Grok API調用失敗: {str(e)}")
             grok_filename = None
             grok_analysis = "Grok API調用失敗，無法提供分析。"
+            grok_raw = grok_analysis
             
             # 更新進度條 - 顯示錯誤但繼續
             progress_bar.progress(50)
@@ -610,7 +647,7 @@ def analyze_image(image_file: io.BytesIO) -> dict:
             status_text.text("正在進行深度皮膚分析...")
             time.sleep(0.5)
             
-            deepseek_response = deepseek_client.chat.completions.create(
+            deepseek_response = get_deepseek_client().chat.completions.create(
                 model="deepseek-vision-v3",  # 更新為 V3 版本
                 messages=[
                     {
@@ -648,7 +685,7 @@ def analyze_image(image_file: io.BytesIO) -> dict:
             time.sleep(0.5)
             
             # 儲存 DeepSeek 回應
-            deepseek_filename = save_api_response("deepseek", deepseek_response.dict())
+            deepseek_filename = save_api_response(deepseek_response, "deepseek", image_hash, client_id)
             deepseek_analysis = deepseek_response.choices[0].message.content
             logger.info(f"DeepSeek分析成功，內容長度：{len(deepseek_analysis)}")
         except Exception as e:
@@ -665,6 +702,7 @@ def analyze_image(image_file: io.BytesIO) -> dict:
         combined_analysis = {
             "grok_analysis": grok_analysis,
             "deepseek_analysis": deepseek_analysis,
+            "grok_raw": grok_raw,
             "grok_file": grok_filename,
             "deepseek_file": deepseek_filename,
             "status": "success"
@@ -710,7 +748,27 @@ def generate_report(analysis_result: str) -> str:
             return "無法生成報告：分析結果為空。請重新上傳照片進行分析。"
             
         try:
-            response = deepseek_client.chat.completions.create(
+            if STRUCTURED_OUTPUT:
+                # 結構化模式：JSON 輸出治療方案與優先級，輸出 token 更少，再轉為 Markdown 報告
+                response = get_deepseek_client().chat.completions.create(
+                    model="deepseek-chat",
+                    messages=[
+                        {"role": "system", "content": schema_prompt(REPORT_PROMPT, REPORT_SCHEMA)},
+                        {"role": "user", "content": f"面部分析結果：\n{analysis_result}"}
+                    ],
+                    response_format=response_format("treatment_report", REPORT_SCHEMA, "deepseek"),
+                    temperature=0.3,
+                    max_tokens=1200,
+                    stream=False
+                )
+                report_data = parse_structured(response.choices[0].message.content)
+                if report_data:
+                    report = render_report(report_data)
+                    logger.info(f"DeepSeek 結構化報告生成成功，治療方案數: {len(report_data.get('treatments', []))}")
+                    return report + "\n\n**免責聲明**：本報告由 DeepSeek R1 AI 生成，僅供參考，具體治療需諮詢專業醫生。"
+                logger.warning("結構化報告解析失敗，改用自由文本報告")
+
+            response = get_deepseek_client().chat.completions.create(
                 model="deepseek-chat",
                 messages=[
                     {"role": "system", "content": """
@@ -770,14 +828,15 @@ def generate_report(analysis_result: str) -> str:
         logger.error(f"DeepSeek R1 報告生成流程整體失敗: {str(e)}")
         return f"錯誤: 無法生成報告 ({str(e)})\n\n請稍後再試或聯繫技術支持。"
 
-@st.cache_data
-def create_visualizations(_image: PILImage.Image, analysis_result: str, report: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    """创建可视化图表"""
-    temp_dir = "temp"
-    os.makedirs(temp_dir, exist_ok=True)
-    heatmap_path = os.path.join(temp_dir, "face_heatmap.png")
-    radar_path = os.path.join(temp_dir, "radar_chart.png")
-    priority_path = os.path.join(temp_dir, "treatment_priority.png")
+def render_heatmap(_image: PILImage.Image, analysis_result: str, report: str) -> Optional[bytes]:
+    """生成面部问题热力图（不依赖 Streamlit，可在背景任务中执行）
+
+    熱力圖為點陣圖（以印刷解析度輸出的 PNG 內容），全程不寫入暫存檔；
+    雷達圖與優先級圖由報告引擎依同一份評分以向量圖形繪製。
+    """
+
+    # 评分解析结果由 score_extractor 快取，与报告引擎的图表共用
+    score_sheet = extract_scores(analysis_result, report)
 
     # 热力图
     try:
@@ -791,15 +850,9 @@ def create_visualizations(_image: PILImage.Image, analysis_result: str, report:
             y1, y2 = max(0, y1), min(h, y2)
             x1, x2 = max(0, x1), min(w, x2)
             
-            # 查找评分
-            score_match = re.search(rf"{region}.*?皮膚狀況\s*(\d)/5", analysis_result)
-            if score_match:
-                score = int(score_match.group(1))
-                severity = (5 - score) / 5
-                mask[y1:y2, x1:x2] = severity
-            else:
-                # 默认值
-                mask[y1:y2, x1:x2] = 0.5
+            # 查找评分，没有评分的区域以中性值显示
+            severity = score_sheet.region_severity(HEATMAP_REGIONS.get(region, region))
+            mask[y1:y2, x1:x2] = 0.5 if severity is None else severity
                 
         # 应用高斯模糊使热力图更平滑
         mask = cv2.GaussianBlur(mask, (51, 51), 0)
@@ -809,80 +862,22 @@ def create_visualizations(_image: PILImage.Image, analysis_result: str, report:
         plt.imshow(mask, cmap='RdYlGn_r', alpha=0.5)
         plt.axis('off')
         plt.tight_layout()
-        plt.savefig(heatmap_path, dpi=300, bbox_inches='tight')
+        heatmap_buffer = BytesIO()
+        plt.savefig(heatmap_buffer, format='png', dpi=vector_charts.PRINT_DPI, bbox_inches='tight')
         plt.close()
-        logger.info(f"熱力圖生成成功: {heatmap_path}")
+        heatmap_png = heatmap_buffer.getvalue()
+        logger.info(f"熱力圖生成成功: {len(heatmap_png) / 1024:.1f} KB")
     except Exception as e:
         logger.error(f"熱力圖生成失敗: {str(e)}", exc_info=True)
-        heatmap_path = None
+        heatmap_png = None
 
-    # 雷達圖
-    try:
-        categories = ['Skin Quality', 'Elasticity', 'Firmness', 'Radiance', 'Evenness']
-        current_scores = []
-        ideal_scores = [5] * len(categories)
-        for category in categories:
-            match = re.search(rf"{category}.*?(\d)/5", analysis_result, re.IGNORECASE)
-            score = int(match.group(1)) if match else 4
-            current_scores.append(score)
-        angles = np.linspace(0, 2 * np.pi, len(categories), endpoint=False).tolist()
-        current_scores += current_scores[:1]
-        ideal_scores += ideal_scores[:1]
-        angles += angles[:1]
-        fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(polar=True))
-        ax.fill(angles, current_scores, color='#4A90E2', alpha=0.5, label='Rating', edgecolor='black')
-        ax.fill(angles, ideal_scores, color='#D3E4F5', alpha=0.2, label='Ideal')
-        ax.set_yticks([1, 2, 3, 4, 5])
-        ax.set_xticks(angles[:-1])
-        ax.set_xticklabels(categories[:-1])
-        ax.legend(loc='upper right', bbox_to_anchor=(1.1, 1.1))
-        plt.savefig(radar_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        logger.info(f"雷達圖生成成功: {radar_path}")
-    except Exception as e:
-        logger.error(f"雷達圖生成失敗: {str(e)}")
-        radar_path = None
-
-    # 優先級圖
-    try:
-        treatments = []
-        priorities = []
-        for line in report.split('\n'):
-            match = re.search(r'(\d+)\)\s*([^0-5].*?)(?=\s*\d|\n|$)', line)
-            if match:
-                priority = int(match.group(1))
-                treatment = match.group(2).strip()
-                treatments.append(treatment)
-                priorities.append(6 - priority)
-        if not treatments:
-            treatments = ["玻尿酸填充", "肉毒素注射", "激光治療"]
-            priorities = [5, 4, 3]
-        fig = px.bar(
-            x=priorities, y=treatments, orientation='h',
-            labels={'x': 'Priority', 'y': 'Treatment'},
-            title="Treatment Priority",
-            color=priorities, color_continuous_scale='Blues',
-            text=priorities
-        )
-        fig.update_traces(textposition='auto')
-        fig.update_layout(showlegend=False, width=600, height=400)
-        fig.write_image(priority_path, scale=2)
-        logger.info(f"優先級圖生成成功: {priority_path}")
-    except Exception as e:
-        logger.error(f"優先級圖生成失敗: {str(e)}")
-        priority_path = None
-
-    return heatmap_path, radar_path, priority_path
+    return heatmap_png
 
 def detect_face_regions(image):
     """检测人脸区域，返回额头、脸颊和下巴区域"""
     try:
-        # 转换到灰度图
-        import cv2
-        import dlib
-        
-        # 加载dlib人脸检测器
-        face_detector = dlib.get_frontal_face_detector()
+        # 加载dlib人脸检测器（每个执行绪一个，检测器不是执行绪安全的）
+        face_detector = get_face_detector()
         
         # 转换图像为numpy数组并转为灰度
         img_array = np.array(image)
@@ -922,360 +917,111 @@ def detect_face_regions(image):
             'chin': (2*h//3, h, 0, w)
         }
 
-def generate_better_pdf(report_text, images):
-    """生成PDF报告，确保支持中文"""
-    try:
-        # 注册中文字体
-        font_path = os.path.join(os.path.dirname(__file__), 'fonts')
-        os.makedirs(font_path, exist_ok=True)
-        
-        # 下载中文字体
-        font_file = os.path.join(font_path, 'simsun.ttf')
-        
-        # 检查字体文件是否存在
-        if not os.path.exists(font_file):
-            # 使用临时内置字体
-            logger.info("使用内置中文字体")
-            temp_font_path = os.path.join(tempfile.gettempdir(), "simsun.ttf")
-            
-            # 如果您有办法将宋体嵌入应用中，可以尝试以下方式
-            try:
-                from fontTools.ttLib import TTFont as FontToolsTTFont
-                # 创建一个简单的字体
-                font = FontToolsTTFont()
-                font.save(temp_font_path)
-                font_file = temp_font_path
-            except:
-                # 如果无法创建字体，使用reportlab提供的基本字体
-                logger.warning("无法创建中文字体，将使用基本字体")
-        
-        # 使用 session_state 來追踪字體註冊狀態
-        if 'app_fonts_registered' not in st.session_state:
-            st.session_state.app_fonts_registered = False
-            
-        # 注册字体，但只在第一次註冊
-        if not st.session_state.app_fonts_registered:
-            try:
-                pdfmetrics.registerFont(TTFont('SimSun', font_file))
-                logger.info("成功注册中文字体")
-                st.session_state.app_fonts_registered = True
-            except Exception as e:
-                logger.error(f"注册字体失败: {str(e)}")
-        else:
-            logger.debug("字體已註冊，跳過註冊過程")
-        
-        # 创建一个内存中的PDF，而不是直接写入文件
-        buffer = BytesIO()
-        
-        # 创建PDF文档
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        
-        # 自定义样式以使用中文字体
-        for style_name in styles.byName:
-            styles[style_name].fontName = 'SimSun'
-        
-        story = []
-        
-        # 添加标题
-        title_style = styles['Heading1']
-        title_style.alignment = 1  # 居中对齐
-        story.append(Paragraph("醫美智能評估報告", title_style))
-        story.append(Spacer(1, 12))
-        
-        # 添加日期
-        date_style = styles['Normal']
-        date_style.alignment = 1  # 居中对齐
-        current_date = datetime.datetime.now().strftime("%Y年%m月%d日")
-        story.append(Paragraph(f"生成日期：{current_date}", date_style))
-        story.append(Spacer(1, 20))
-        
-        # 处理报告内容
-        normal_style = styles['Normal']
-        normal_style.leading = 14  # 行间距
-        
-        # 确保报告文本不为空
-        if not report_text or len(report_text.strip()) == 0:
-            report_text = "無法生成報告內容，請重試。"
-        
-        # 分段处理报告文本
-        paragraphs = report_text.split('\n\n')
-        for para in paragraphs:
-            if para.strip():
-                # 检查是否为标题行
-                if re.match(r'^[0-9]+\.\s+\w+', para.strip()):
-                    heading_style = styles['Heading2']
-                    story.append(Paragraph(para, heading_style))
-                else:
-                    # 处理普通段落，保留换行
-                    lines = para.split('\n')
-                    for line in lines:
-                        if line.strip():
-                            story.append(Paragraph(line, normal_style))
-                story.append(Spacer(1, 10))
-        
-        # 添加图片 - 先验证图片是否可用
-        valid_images = []
-        for img_path in images:
-            if img_path and os.path.exists(img_path):
-                try:
-                    # 测试是否可以打开图片
-                    PILImage.open(img_path)
-                    valid_images.append(img_path)
-                except Exception as e:
-                    logger.error(f"无法打开图片 {img_path}: {str(e)}")
-            else:
-                logger.warning(f"图片路径不存在: {img_path}")
-        
-        if valid_images:  # 只有当有有效图片时才添加图表标题
-            story.append(Spacer(1, 20))
-            story.append(Paragraph("分析圖表", styles['Heading2']))
-            story.append(Spacer(1, 10))
-            
-            # 图片处理
-            captions = ["面部問題熱力圖", "面部狀況評分", "治療方案優先級"]
-            for i, img_path in enumerate(valid_images):
-                try:
-                    # 添加图片标题
-                    if i < len(captions):
-                        story.append(Paragraph(captions[i], styles['Heading3']))
-                    
-                    # 打开并处理图片
-                    img = PILImage.open(img_path)
-                    img_width, img_height = img.size
-                    
-                    # 计算适合A4页面的图片尺寸
-                    max_width = 450
-                    aspect = img_height / img_width
-                    new_width = min(max_width, img_width)
-                    new_height = new_width * aspect
-                    
-                    # 添加图片到PDF
-                    img = ReportLabImage(img_path, width=new_width, height=new_height)
-                    story.append(img)
-                    story.append(Spacer(1, 15))
-                except Exception as e:
-                    logger.error(f"处理图片失败: {str(e)}", exc_info=True)
-        
-        # 添加免责声明
-        story.append(Spacer(1, 30))
-        disclaimer_style = styles['Italic']
-        disclaimer_style.textColor = colors.gray
-        story.append(Paragraph("免責聲明：本報告由AI系統生成，僅供參考，具體治療方案請諮詢專業醫生。", disclaimer_style))
-        
-        # 构建PDF
+REPORT_TITLE = "醫美智能評估報告"
+REPORT_POLL_INTERVAL = 1  # 秒
+
+@st.cache_resource
+def get_report_queue() -> ReportJobQueue:
+    """行程内共用的报告任务队列（所有会话共用同一个工作池与成品快取）"""
+    return ReportJobQueue(max_workers=REPORT_WORKERS)
+
+def warm_up_heatmap():
+    """以样本照片生成一次热力图（matplotlib 字型快取、OpenCV 与人脸检测器）"""
+    render_heatmap(PILImage.open(warmup.sample_photo()), warmup.SAMPLE_ANALYSIS, warmup.SAMPLE_REPORT)
+
+@st.cache_resource
+def start_warm_up():
+    """伺服器行程第一次执行脚本时在背景预热（客户端、热力图与报告 PDF），之后的会话不再执行"""
+    steps = [("openai_clients", lambda: (get_deepseek_client(), get_xai_client())),
+             ("heatmap", warm_up_heatmap)] + warmup.default_steps([warmup.REPORT], title=REPORT_TITLE)
+    return warmup.start_warm_up(steps)
+
+def build_report_pdf(kind, image_bytes, analysis_text, report) -> Optional[dict]:
+    """背景任务：生成图表与报告 PDF（不使用 Streamlit API），回传 PDF 与大小／时间预算报告"""
+    start = time.perf_counter()
+    label = report_engine.LAYOUTS[kind].label
+    heatmap = None
+    if image_bytes:
         try:
-            doc.build(story)
-            buffer.seek(0)
-            
-            # 保存到临时文件
-            temp_pdf = os.path.join(tempfile.gettempdir(), "medical_report.pdf")
-            with open(temp_pdf, 'wb') as f:
-                f.write(buffer.getvalue())
-            
-            logger.info(f"PDF生成成功: {temp_pdf}")
-            return temp_pdf
+            heatmap = render_heatmap(PILImage.open(BytesIO(image_bytes)), analysis_text, report)
         except Exception as e:
-            logger.error(f"构建PDF失败: {str(e)}", exc_info=True)
-            return None
-    except Exception as e:
-        logger.error(f"PDF生成失败: {str(e)}", exc_info=True)
+            logger.error(f"熱力圖生成失敗，{label}將不含熱力圖: {str(e)}")
+    else:
+        logger.warning(f"未找到上傳的圖片，{label}將不含熱力圖")
+    data = report_engine.ReportData(report, analysis_text=analysis_text, heatmap=heatmap, title=REPORT_TITLE)
+    pdf_bytes, budget = report_engine.render_with_budget(kind, data, start)
+    if not pdf_bytes:
         return None
+    return {"pdf": pdf_bytes, "budget": budget}
 
-def generate_simple_pdf(report_text, images):
-    """使用更简单的方法生成PDF，确保支持中文"""
-    try:
-        # 创建PDF对象
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # 使用Arial Unicode MS字体，这是一个通用的Unicode字体
-        # 注意：FPDF默认不支持中文，我们需要使用特殊方法
-        
-        # 添加标题（使用英文避免字体问题）
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(0, 10, 'Medical Beauty Assessment Report', 0, 1, 'C')
-        
-        # 添加日期
-        pdf.set_font('Arial', '', 12)
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        pdf.cell(0, 10, f'Date: {current_date}', 0, 1, 'C')
-        
-        # 添加中文报告内容的提示
-        pdf.set_font('Arial', '', 10)
-        pdf.multi_cell(0, 5, "Due to font limitations in PDF, Chinese characters cannot be displayed properly.")
-        pdf.multi_cell(0, 5, "Below is the analysis visualization. For full report, please download the text report.")
-        
-        # 添加图片（这部分应该正常工作）
-        valid_images = []
-        for img_path in images:
-            if img_path and os.path.exists(img_path):
-                try:
-                    valid_images.append(img_path)
-                except Exception as e:
-                    logger.error(f"图片验证失败: {str(e)}")
-        
-        # 添加图片
-        for img_path in valid_images:
-            try:
-                pdf.add_page()
-                # 添加图片标题
-                if img_path.endswith("face_heatmap.png"):
-                    pdf.set_font('Arial', 'B', 12)
-                    pdf.cell(0, 10, "Face Problem Heat Map", 0, 1, 'C')
-                elif img_path.endswith("radar_chart.png"):
-                    pdf.set_font('Arial', 'B', 12)
-                    pdf.cell(0, 10, "Facial Condition Score", 0, 1, 'C')
-                elif img_path.endswith("treatment_priority.png"):
-                    pdf.set_font('Arial', 'B', 12)
-                    pdf.cell(0, 10, "Treatment Priority", 0, 1, 'C')
-                
-                # 添加图片，确保适合页面
-                pdf.image(img_path, x=10, y=30, w=190)
-            except Exception as e:
-                logger.error(f"添加图片失败: {str(e)}")
-        
-        # 添加免责声明
-        pdf.set_font('Arial', 'I', 8)
-        pdf.cell(0, 10, 'Disclaimer: This report is generated by AI for reference only.', 0, 1, 'C')
-        
-        # 保存PDF
-        temp_pdf = os.path.join(tempfile.gettempdir(), "medical_report.pdf")
-        pdf.output(temp_pdf)
-        
-        return temp_pdf
-    except Exception as e:
-        logger.error(f"简单PDF生成失败: {str(e)}", exc_info=True)
-        return None
+def build_report_from_blob(kind, image_digest, analysis_text, report) -> Optional[dict]:
+    """背景任务：生成期间持有上传图片的引用，避免被容量回收"""
+    if not image_digest:
+        return build_report_pdf(kind, None, analysis_text, report)
+    with get_blob_store().hold(image_digest) as image_bytes:
+        return build_report_pdf(kind, image_bytes, analysis_text, report)
 
-def generate_premium_report():
-    """生成高級評估報告"""
-    try:
-        # 获取当前分析结果和报告
-        if 'analysis_result' not in st.session_state or 'report' not in st.session_state:
-            st.error("請先完成面部分析")
-            return
-            
-        analysis_result = st.session_state.analysis_result
-        report = st.session_state.report
-        
-        # 创建可视化图表
-        if 'uploaded_image' in st.session_state and st.session_state.uploaded_image:
-            try:
-                image = PILImage.open(st.session_state.uploaded_image)
-                heatmap_path, radar_path, priority_path = create_visualizations(image, analysis_result["grok_analysis"], report)
-                images = [img for img in [heatmap_path, radar_path, priority_path] if img and os.path.exists(img)]
-                logger.info(f"可視化圖表生成成功，有效圖片數量: {len(images)}")
-            except Exception as e:
-                logger.error(f"可視化圖表生成失敗: {str(e)}")
-                images = []
-                st.warning("無法生成視覺化圖表，報告將只包含文字內容")
-        else:
-            images = []
-            st.warning("未找到上傳的圖片，報告將只包含文字內容")
-            
-        # 生成PDF报告
-        try:
-            pdf_path = generate_better_pdf(report, images)
-            
-            if pdf_path and os.path.exists(pdf_path):
-                # 保存为高级报告
-                premium_pdf_path = "premium_report.pdf"
-                shutil.copy(pdf_path, premium_pdf_path)
-                logger.info(f"高級報告生成成功: {premium_pdf_path}")
-                st.success("高級報告生成成功！")
-                return True
-            else:
-                st.error("PDF報告生成失敗，請重試")
-                return False
-        except Exception as e:
-            logger.error(f"PDF生成過程中出錯: {str(e)}")
-            st.error(f"PDF生成過程中出錯: {str(e)}")
-            return False
-    except Exception as e:
-        logger.error(f"高級報告生成失敗: {str(e)}")
-        st.error(f"報告生成失敗: {str(e)}")
-        return False
+def _report_key(kind, analysis_result, report):
+    """报告缓存键：报告类型 + 分析结果 + 报告内容的哈希"""
+    return response_hash(kind, json.dumps(analysis_result, ensure_ascii=False, sort_keys=True, default=str), report)
+
+def get_report_artifact(kind) -> Optional[dict]:
+    """取得本会话报告的 PDF 内容与预算报告（尚未完成时回传 None）"""
+    key = st.session_state.get(f"{kind}_report_key")
+    return get_report_queue().artifact(key) if key else None
 
-def generate_standard_report():
-    """生成標準評估報告"""
+def get_report_job(kind) -> Optional[dict]:
+    """取得本会话报告任务的状态"""
+    job_id = st.session_state.get(f"{kind}_report_job")
+    return get_report_queue().status(job_id) if job_id else None
+
+def submit_report_job(kind):
+    """提交报告生成任务到背景队列，相同内容的报告只会生成一次"""
     try:
         # 获取当前分析结果和报告
-        if 'analysis_result' not in st.session_state or 'report' not in st.session_state:
+        if not st.session_state.get('analysis_result') or not st.session_state.get('report'):
             st.error("請先完成面部分析")
             return False
             
         analysis_result = st.session_state.analysis_result
         report = st.session_state.report
-        
-        # 创建可视化图表
-        if 'uploaded_image' in st.session_state and st.session_state.uploaded_image:
-            try:
-                image = PILImage.open(st.session_state.uploaded_image)
-                heatmap_path, radar_path, priority_path = create_visualizations(image, analysis_result["grok_analysis"], report)
-                images = [img for img in [heatmap_path, radar_path, priority_path] if img and os.path.exists(img)]
-                logger.info(f"可視化圖表生成成功，有效圖片數量: {len(images)}")
-            except Exception as e:
-                logger.error(f"可視化圖表生成失敗: {str(e)}")
-                images = []
-                st.warning("無法生成視覺化圖表，報告將只包含文字內容")
-        else:
-            images = []
-            st.warning("未找到上傳的圖片，報告將只包含文字內容")
-            
-        # 生成简单PDF报告
-        try:
-            pdf_path = generate_simple_pdf(report, images)
-            
-            if pdf_path and os.path.exists(pdf_path):
-                # 保存为标准报告
-                standard_pdf_path = "standard_report.pdf"
-                shutil.copy(pdf_path, standard_pdf_path)
-                logger.info(f"標準報告生成成功: {standard_pdf_path}")
-                st.success("標準報告生成成功！")
-                return True
-            else:
-                st.error("PDF報告生成失敗，請重試")
-                return False
-        except Exception as e:
-            logger.error(f"PDF生成過程中出錯: {str(e)}")
-            st.error(f"PDF生成過程中出錯: {str(e)}")
-            return False
+        key = _report_key(kind, analysis_result, report)
+        
+        analysis_text = analysis_result.get("grok_raw") or analysis_result["grok_analysis"]
+        job_id = get_report_queue().submit(key, build_report_from_blob, kind, st.session_state.get('uploaded_blob'),
+                                           analysis_text, report)
+        st.session_state[f"{kind}_report_key"] = key
+        st.session_state[f"{kind}_report_job"] = job_id
+        logger.info(f"{report_engine.LAYOUTS[kind].label}任務已提交: {job_id}")
+        return True
     except Exception as e:
-        logger.error(f"標準報告生成失敗: {str(e)}")
+        logger.error(f"{report_engine.LAYOUTS[kind].label}提交失敗: {str(e)}")
         st.error(f"報告生成失敗: {str(e)}")
         return False
 
-def save_api_response(response_data: dict, response_type: str):
-    """保存 API 响应到数据库"""
+def save_api_response(response_data, response_type: str, image_hash: Optional[str] = None,
+                      client_id: Optional[str] = None):
+    """保存 API 响应（放入背景写入队列，序列化、压缩与写入数据库不在请求路径上）"""
+    get_response_logger().log(response_type, response_data, image_hash, client_id)
+
+def get_local_metrics() -> Optional[SkinMetrics]:
+    """上传照片的本地肤质指标（不调用 API，每张照片只计算一次）"""
+    if not st.session_state.get('uploaded_blob'):
+        return None
     try:
-        conn = sqlite3.connect('responses.db')
-        cursor = conn.cursor()
-        
-        # 创建表（如果不存在）
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS api_responses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            response_type TEXT,
-            response_data TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # 保存响应数据
-        cursor.execute(
-            'INSERT INTO api_responses (response_type, response_data) VALUES (?, ?)',
-            (response_type, json.dumps(response_data))
-        )
-        
-        conn.commit()
-        conn.close()
-        logger.info(f"{response_type} API响应保存成功")
+        return metrics_for_blob(st.session_state.uploaded_blob)
     except Exception as e:
-        logger.error(f"保存API响应失败: {str(e)}")
-        raise
+        logger.error(f"本地指标计算失败: {str(e)}")
+        return None
+
+def radar_values(metrics: SkinMetrics) -> dict:
+    """本地指标（0-5 分）转为雷达图的 0-100 分"""
+    summary = metrics.summary()
+    keys = {'skin_condition': 'redness', 'spots': 'pigmentation', 'wrinkles': 'texture',
+            'pores': 'pores', 'oil': 'shine'}
+    return {key: (summary[metric] or 0) * 20 for key, metric in keys.items()}
 
-def plot_radar_chart(analysis_data: dict) -> plt.Figure:
+def plot_radar_chart(analysis_data: dict) -> "plt.Figure":
     """生成雷达图"""
     try:
         # 设置中文字体
@@ -1314,7 +1060,7 @@ def plot_radar_chart(analysis_data: dict) -> plt.Figure:
         logger.error(f"生成雷达图失败: {str(e)}")
         raise
 
-def plot_skin_analysis(image: np.ndarray, regions: dict) -> plt.Figure:
+def plot_skin_analysis(image: np.ndarray, regions: dict) -> "plt.Figure":
     """生成皮肤分析图，标注不同区域"""
     try:
         # 创建图形
@@ -1350,6 +1096,9 @@ def plot_skin_analysis(image: np.ndarray, regions: dict) -> plt.Figure:
         raise
 
 def main():
+    if WARM_UP_ON_START:
+        start_warm_up()
+
     # 初始化 session state
     if 'current_step' not in st.session_state:
         st.session_state.current_step = 1
@@ -1357,8 +1106,8 @@ def main():
         st.session_state.analysis_complete = False
     if 'report_generated' not in st.session_state:
         st.session_state.report_generated = False
-    if 'uploaded_image' not in st.session_state:
-        st.session_state.uploaded_image = None
+    if 'uploaded_blob' not in st.session_state:
+        st.session_state.uploaded_blob = None
     if 'analysis_result' not in st.session_state:
         st.session_state.analysis_result = None
     if 'report' not in st.session_state:
@@ -1424,16 +1173,13 @@ def main():
             st.markdown('<div class="info-box">請上傳正面清晰的照片，確保光線充足且面部完整可見</div>', unsafe_allow_html=True)
             
             uploaded_file = st.file_uploader("選擇照片", type=['jpg', 'jpeg', 'png'])
+            # 選填：同一客戶的多次分析可在分析歷史頁面比較前後變化
+            st.session_state.client_id = st.text_input("客戶編號（選填）", value=st.session_state.get('client_id', '')).strip()
             
             if uploaded_file is not None:
                 try:
-                    # 保存上傳的圖片到 session state
-                    temp_dir = "temp"
-                    os.makedirs(temp_dir, exist_ok=True)
-                    temp_file = os.path.join(temp_dir, uploaded_file.name)
-                    with open(temp_file, "wb") as f:
-                        f.write(uploaded_file.getvalue())
-                    st.session_state.uploaded_image = temp_file
+                    # 上傳的圖片以內容雜湊儲存（重複上傳不再寫入），session state 只保存雜湊
+                    st.session_state.uploaded_blob = get_blob_store().put(uploaded_file.getvalue())
                     
                     # 顯示圖片預覽
                     image = PILImage.open(uploaded_file)
@@ -1473,17 +1219,29 @@ def main():
                 # 真實分析過程
                 with st.spinner("分析中..."):
                     # 檢查是否有上傳的圖片
-                    if st.session_state.uploaded_image and os.path.exists(st.session_state.uploaded_image):
+                    uploaded = get_blob_store().get(st.session_state.uploaded_blob) if st.session_state.uploaded_blob else None
+                    if uploaded:
+                        # AI 分析需時數十秒，先顯示本地指標
+                        metrics = get_local_metrics()
+                        if metrics is not None:
+                            UIComponents.create_local_metrics_section(metrics)
+
                         # 讀取圖片
-                        with open(st.session_state.uploaded_image, "rb") as f:
-                            image_bytes = io.BytesIO(f.read())
+                        image_bytes = io.BytesIO(uploaded)
                         
                         # 進行分析
                         progress_text = "正在生成分析報告..."
                         progress_bar = st.progress(0)
                         
                         # 分析圖片
-                        analysis_result = analyze_image(image_bytes)
+                        waiting = st.empty()
+                        try:
+                            analysis_result = analyze_image(
+                                image_bytes, st.session_state.get('client_id') or None,
+                                _on_wait=lambda: waiting.info("相同照片的分析正在進行中，等待結果...")
+                            )
+                        finally:
+                            waiting.empty()
                         # 存儲分析結果
                         st.session_state.analysis_result = analysis_result
                         
@@ -1566,7 +1324,11 @@ def main():
                         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
                         st.markdown('<div class="chart-title">面部特徵評分</div>', unsafe_allow_html=True)
                         try:
-                            plot_radar_chart()
+                            metrics = get_local_metrics()
+                            if metrics is None:
+                                st.info("未找到上傳的圖片，無法生成雷達圖")
+                            else:
+                                st.pyplot(plot_radar_chart(radar_values(metrics)))
                         except Exception as e:
                             st.error(f"無法生成雷達圖: {str(e)}")
                             logger.error(f"無法生成雷達圖: {str(e)}")
@@ -1619,28 +1381,7 @@ def main():
                         unsafe_allow_html=True
                     )
                     
-                    if not st.session_state.report_generated:
-                        if st.button("生成標準報告"):
-                            try:
-                                generate_standard_report()
-                                st.session_state.report_generated = True
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"標準報告生成失敗: {str(e)}")
-                                logger.error(f"標準報告生成失敗: {str(e)}")
-                    else:
-                        pdf_path = "standard_report.pdf"
-                        if os.path.exists(pdf_path):
-                            with open(pdf_path, "rb") as f:
-                                pdf_bytes = f.read()
-                            st.download_button(
-                                label="下載標準報告 ",
-                                data=pdf_bytes,
-                                file_name="醫美診所評估報告.pdf",
-                                mime="application/pdf",
-                            )
-                        else:
-                            st.error("報告文件未找到，請重新生成")
+                    standard_pending = render_report_option("standard", "生成標準報告", "下載標準報告 ", "醫美診所評估報告.pdf")
                     
                     st.markdown('</div>', unsafe_allow_html=True)
                 
@@ -1654,32 +1395,44 @@ def main():
                         unsafe_allow_html=True
                     )
                     
-                    if not st.session_state.report_generated:
-                        if st.button("生成高級報告"):
-                            try:
-                                generate_premium_report()
-                                st.session_state.report_generated = True
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"高級報告生成失敗: {str(e)}")
-                                logger.error(f"高級報告生成失敗: {str(e)}")
-                    else:
-                        premium_pdf_path = "premium_report.pdf"
-                        if os.path.exists(premium_pdf_path):
-                            with open(premium_pdf_path, "rb") as f:
-                                premium_pdf_bytes = f.read()
-                            st.download_button(
-                                label="下載高級報告 ",
-                                data=premium_pdf_bytes,
-                                file_name="醫美診所高級評估報告.pdf",
-                                mime="application/pdf",
-                            )
-                        else:
-                            st.error("高級報告文件未找到，請重新生成")
+                    premium_pending = render_report_option("premium", "生成高級報告", "下載高級報告 ", "醫美診所高級評估報告.pdf")
                     
                     st.markdown('</div>', unsafe_allow_html=True)
                 
                 st.markdown('</div>', unsafe_allow_html=True)
+                
+                # 背景任務進行中時輪詢狀態
+                if standard_pending or premium_pending:
+                    time.sleep(REPORT_POLL_INTERVAL)
+                    st.rerun()
+
+def render_report_option(kind, button_label, download_label, file_name):
+    """顯示報告生成按鈕、任務狀態或下載按鈕，回傳任務是否仍在進行"""
+    artifact = get_report_artifact(kind)
+    if artifact:
+        st.download_button(
+            label=download_label,
+            data=artifact["pdf"],
+            file_name=file_name,
+            mime="application/pdf",
+            key=f"download_{kind}_report",
+        )
+        budget = artifact["budget"]
+        st.caption(f"{budget['size_kb']} KB · {budget['pages']} 頁 · {budget['seconds']} 秒")
+        return False
+    
+    job = get_report_job(kind)
+    if job and job["state"] in (QUEUED, RUNNING):
+        st.info("報告生成中，請稍候...")
+        return True
+    if job and job["state"] == FAILED:
+        st.error(f"報告生成失敗: {job['error']}")
+    
+    if st.button(button_label if not job else f"重新{button_label}", key=f"generate_{kind}_report"):
+        if submit_report_job(kind):
+            st.session_state.report_generated = True
+            st.rerun()
+    return False
 
 # 步驟指示器樣式函數
 def get_step_color(step_num):
@@ -0,0 +1,293 @@
+"""熱路徑微基準測試：圖片驗證／壓縮、人臉偵測、圖表與各版面 PDF，依圖片尺寸矩陣量測並與基準結果比較
+
+以 temp/ 中的樣本照片縮放為各尺寸（0.3-12 MP）的 JPEG 作為輸入；與尺寸無關的圖表只量測一次。
+結果以 JSON 寫入 benchmarks/results/latest.json；--save-baseline 另存為基準，之後的執行會自動與基準比較。
+
+用法（於專案根目錄）：
+    python -m benchmarks.bench_hot_paths --save-baseline
+    python -m benchmarks.bench_hot_paths --check              # 中位數比基準慢超過 --threshold 時回傳非零結束碼
+    python -m benchmarks.bench_hot_paths --filter 'pdf.*' --sizes 1,6 --repeat 10
+"""
+import io
+import os
+import sys
+import json
+import time
+import fnmatch
+import logging
+import argparse
+import warnings
+import datetime
+import platform
+import statistics
+import subprocess
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_IMAGE = os.path.join(ROOT, "temp", "20200911150349c274.jpg")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, "latest.json")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+
+# 圖片尺寸矩陣（百萬像素）：手機縮圖到原始相機照片
+DEFAULT_SIZES_MP = (0.3, 1, 3, 6, 12)
+# 中位數比基準慢（或快）超過此比例才視為變化
+DEFAULT_THRESHOLD = 0.15
+
+
+class Case(NamedTuple):
+    name: str
+    # True 表示依尺寸矩陣執行，setup 會收到該尺寸的 JPEG 內容
+    sized: bool
+    # 準備輸入（不計時），回傳要計時的函式
+    setup: Callable[[Optional[bytes]], Callable[[], Any]]
+
+
+def _sample_texts():
+    from src.warmup import SAMPLE_ANALYSIS, SAMPLE_REPORT
+    return SAMPLE_ANALYSIS, SAMPLE_REPORT
+
+
+def _validate_image(jpeg: bytes) -> Callable[[], Any]:
+    from utils.helpers import validate_image
+    return lambda: validate_image(io.BytesIO(jpeg))
+
+
+def _compress_image(jpeg: bytes) -> Callable[[], Any]:
+    from src.image_analyzer import compress_image
+    image = Image.open(io.BytesIO(jpeg))
+    image.load()
+    # compress_image 會就地縮圖，每輪使用已解碼影像的複本（與 analyze_image 先 load 再壓縮一致）
+    return lambda: compress_image(image.copy())
+
+
+def _detect_analyzer(jpeg: bytes) -> Callable[[], Any]:
+    import numpy as np
+    from src.image_analyzer import ImageAnalyzer
+    analyzer = ImageAnalyzer()
+    pixels = np.array(Image.open(io.BytesIO(jpeg)))
+    return lambda: analyzer.detect_face_regions(pixels)
+
+
+def _detect_app(jpeg: bytes) -> Callable[[], Any]:
+    import app
+    image = Image.open(io.BytesIO(jpeg))
+    image.load()
+    return lambda: app.detect_face_regions(image)
+
+
+def _heatmap(jpeg: bytes) -> Callable[[], Any]:
+    import app
+    analysis, report = _sample_texts()
+    image = Image.open(io.BytesIO(jpeg))
+    image.load()
+    return lambda: app.render_heatmap(image, analysis, report)
+
+
+def _vector_chart(kind: str) -> Callable[[Optional[bytes]], Callable[[], Any]]:
+    def setup(_: Optional[bytes]) -> Callable[[], Any]:
+        from reportlab.graphics import renderPDF
+        from src.font_registry import get_report_font
+        from src.score_extractor import extract_scores
+        from src.vector_charts import build_drawing
+        sheet = extract_scores(*_sample_texts())
+        spec = sheet.radar_spec() if kind == "radar" else sheet.priority_spec()
+        font_name = get_report_font()
+        return lambda: renderPDF.drawToString(build_drawing(spec, font_name=font_name))
+    return setup
+
+
+def _radar_ui(_: Optional[bytes]) -> Callable[[], Any]:
+    import app
+
+    def run() -> bytes:
+        figure = app.plot_radar_chart({"skin_condition": 80, "spots": 60, "wrinkles": 70, "pores": 50, "oil": 65})
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png")
+        app.plt.close(figure)
+        return buffer.getvalue()
+    return run
+
+
+def _pdf(layout: str) -> Callable[[Optional[bytes]], Callable[[], Any]]:
+    def setup(jpeg: bytes) -> Callable[[], Any]:
+        import app
+        from src import pdf_optimizer, report_engine
+        analysis, report = _sample_texts()
+        image = Image.open(io.BytesIO(jpeg))
+        heatmap = app.render_heatmap(image, analysis, report)
+
+        def run() -> bytes:
+            # 清除縮圖快取，量測第一次生成（照片與熱力圖都需重新壓縮）的成本
+            pdf_optimizer._cache.clear()
+            data = report_engine.ReportData(report, analysis_text=analysis, photo=io.BytesIO(jpeg),
+                                            heatmap=heatmap)
+            pdf_bytes = report_engine.render_pdf(layout, data)
+            if not pdf_bytes:
+                raise RuntimeError(f"{layout} 報告生成失敗")
+            return pdf_bytes
+        return run
+    return setup
+
+
+def default_cases() -> List[Case]:
+    from src.report_engine import LAYOUTS
+    cases = [
+        Case("validate_image", True, _validate_image),
+        Case("compress_image", True, _compress_image),
+        Case("detect_face_regions.analyzer", True, _detect_analyzer),
+        Case("detect_face_regions.app", True, _detect_app),
+        Case("chart.heatmap", True, _heatmap),
+        Case("chart.radar", False, _vector_chart("radar")),
+        Case("chart.priority", False, _vector_chart("priority")),
+        Case("chart.radar_ui", False, _radar_ui),
+    ]
+    cases.extend(Case(f"pdf.{layout}", True, _pdf(layout)) for layout in LAYOUTS)
+    return cases
+
+
+def sized_jpeg(source: Image.Image, megapixels: float) -> bytes:
+    """將樣本照片縮放到指定像素數（保持長寬比），以 JPEG 品質 90 編碼"""
+    scale = (megapixels * 1_000_000 / (source.width * source.height)) ** 0.5
+    size = (max(1, round(source.width * scale)), max(1, round(source.height * scale)))
+    buffer = io.BytesIO()
+    source.resize(size, Image.LANCZOS).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """預熱一次後執行 repeat 次，回傳各項統計（毫秒）"""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "rounds": repeat,
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "stdev_ms": round(statistics.stdev(timings), 3) if repeat > 1 else 0.0,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def run_suite(cases: Sequence[Case], sizes: Sequence[float], repeat: int, image_path: str) -> Dict[str, Any]:
+    source = Image.open(image_path).convert("RGB")
+    inputs = {megapixels: sized_jpeg(source, megapixels) for megapixels in sizes}
+    results: Dict[str, Dict[str, Any]] = {}
+    for case in cases:
+        for megapixels in sizes if case.sized else [None]:
+            key = f"{case.name}@{megapixels:g}MP" if case.sized else case.name
+            jpeg = inputs[megapixels] if case.sized else None
+            try:
+                stats = measure(case.setup(jpeg), repeat)
+            except Exception as e:
+                print(f"{key:<40} failed: {type(e).__name__}: {str(e)}", file=sys.stderr)
+                continue
+            entry = {"name": case.name, "megapixels": megapixels}
+            if jpeg is not None:
+                entry["size"] = list(Image.open(io.BytesIO(jpeg)).size)
+            results[key] = dict(entry, **stats)
+            print(f"{key:<40} {stats['median_ms']:10.2f} ms  (min {stats['min_ms']:.2f}, "
+                  f"stdev {stats['stdev_ms']:.2f})", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "image": os.path.relpath(image_path, ROOT),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """列出與基準的中位數比較，回傳變慢超過門檻的項目"""
+    regressions = []
+    base_results = baseline["results"]
+    print(f"\ncompared with baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')}), "
+          f"threshold {threshold:.0%}")
+    for key, result in current["results"].items():
+        base = base_results.get(key)
+        if base is None:
+            print(f"{key:<40} {result['median_ms']:10.2f} ms  (new)")
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        status = ""
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(f"{key}: {base['median_ms']:.2f} ms -> {result['median_ms']:.2f} ms ({ratio:.2f}x)")
+        elif ratio < 1 - threshold:
+            status = "faster"
+        print(f"{key:<40} {base['median_ms']:10.2f} -> {result['median_ms']:10.2f} ms  {ratio:5.2f}x  {status}")
+    for key in base_results.keys() - current["results"].keys():
+        print(f"{key:<40} (not run)")
+    return regressions
+
+
+def _write_json(path: str, payload: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES_MP),
+                        help="圖片尺寸矩陣（百萬像素，以逗號分隔）")
+    parser.add_argument("--repeat", type=int, default=5, help="每項量測次數（取中位數）")
+    parser.add_argument("--filter", action="append", default=[], help="只執行名稱符合的項目（萬用字元，可重複指定）")
+    parser.add_argument("--image", default=CORPUS_IMAGE, help="縮放為各尺寸的樣本照片")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="結果 JSON 檔")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基準結果 JSON 檔")
+    parser.add_argument("--save-baseline", action="store_true", help="將本次結果另存為基準")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="視為變化的中位數比例")
+    parser.add_argument("--check", action="store_true", help="有項目變慢超過門檻時以結束碼 1 結束")
+    parser.add_argument("--list", action="store_true", help="列出所有項目後結束")
+    args = parser.parse_args()
+
+    # 被量測的程式會記錄每次壓縮與 PDF 生成，只保留警告以上
+    logging.basicConfig(level=logging.WARNING, force=True)
+    # plot_radar_chart 指定的 Microsoft YaHei 在多數伺服器上不存在，每次繪圖都會警告
+    logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font", category=UserWarning)
+    cases = default_cases()
+    if args.list:
+        for case in cases:
+            print(f"{case.name:<32} {'sized' if case.sized else ''}")
+        return
+    if args.filter:
+        cases = [case for case in cases if any(fnmatch.fnmatch(case.name, pattern) for pattern in args.filter)]
+    sizes = [float(size) for size in args.sizes.split(",")]
+
+    current = run_suite(cases, sizes, args.repeat, args.image)
+    _write_json(args.output, current)
+    print(f"results written to {os.path.relpath(args.output)}")
+    if args.save_baseline:
+        _write_json(args.baseline, current)
+        print(f"baseline saved to {os.path.relpath(args.baseline)}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("no baseline yet; run with --save-baseline to create one")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare(current, json.load(f), args.threshold)
+    if regressions:
+        print("\n" + "\n".join(regressions))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
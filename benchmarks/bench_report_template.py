@@ -0,0 +1,84 @@
+"""報告模板基準測試：比較每次重建樣式／固定段落與使用預編譯模板的 reports/sec
+
+用法（於專案根目錄）：
+    python -m benchmarks.bench_report_template --reports 50
+"""
+import io
+import time
+import argparse
+import datetime
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from src.font_registry import get_report_font
+from src.report_template import get_report_template
+
+SAMPLE_REPORT = "\n\n".join(
+    f"{i}. 治療方案 {i}\n建議於額頭與眼周進行皮下注射，療程 {i} 次，預期皺紋減少 {10 * i}% 。\n術後注意保濕與防曬。"
+    for i in range(1, 8)
+)
+
+
+def _body(styles, normal_style):
+    story = []
+    for para in SAMPLE_REPORT.split('\n\n'):
+        lines = para.split('\n')
+        story.append(Paragraph(lines[0], styles['Heading2']))
+        for line in lines[1:]:
+            story.append(Paragraph(line, normal_style))
+        story.append(Spacer(1, 10))
+    return story
+
+
+def build_legacy() -> bytes:
+    """重現原本的做法：每份報告重建樣式表、改寫字型並重建固定段落"""
+    font_name = get_report_font()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    for style_name in styles.byName:
+        styles[style_name].fontName = font_name
+    title_style = styles['Heading1']
+    title_style.alignment = 1
+    date_style = styles['Normal']
+    date_style.alignment = 1
+    story = [Paragraph("醫美智能評估報告", title_style), Spacer(1, 12),
+             Paragraph(f"生成日期：{datetime.datetime.now().strftime('%Y年%m月%d日')}", date_style), Spacer(1, 20)]
+    normal_style = styles['Normal']
+    normal_style.leading = 14
+    story.extend(_body(styles, normal_style))
+    disclaimer_style = styles['Italic']
+    disclaimer_style.textColor = colors.gray
+    story.extend([Spacer(1, 30), Paragraph("免責聲明：本報告由AI系統生成，僅供參考，具體治療方案請諮詢專業醫生。", disclaimer_style)])
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def build_template() -> bytes:
+    """使用行程級預編譯模板，只建立動態內容"""
+    template = get_report_template()
+    return template.build(_body(template.styles, template.style('ReportBody'))).getvalue()
+
+
+def run(builder, reports: int) -> float:
+    builder()  # 預熱（字型註冊、模板建立）
+    start = time.perf_counter()
+    for _ in range(reports):
+        builder()
+    return reports / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=50, help="每種做法生成的報告數")
+    args = parser.parse_args()
+
+    legacy = run(build_legacy, args.reports)
+    template = run(build_template, args.reports)
+    print(f"legacy:   {legacy:8.1f} reports/sec")
+    print(f"template: {template:8.1f} reports/sec  ({template / legacy:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
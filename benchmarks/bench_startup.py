@@ -0,0 +1,124 @@
+"""啟動基準測試：以 python -X importtime 量測各入口模組的匯入時間，並檢查重量級套件是否延遲到第一次使用才匯入
+
+用法（於專案根目錄）：
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --check   # 超過時間預算或提早匯入重量級套件時回傳非零結束碼
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口模組 → 匯入時間預算（毫秒，中位數）；Streamlit 頁面含 streamlit 本身約 500-600 ms
+BUDGETS_MS: Dict[str, float] = {
+    "main": 1200,
+    "app": 1200,
+    "src.service_http": 400,
+    "src.job_worker": 400,
+}
+
+# 只在分析或生成 PDF 時才需要的套件，啟動時不應匯入
+DEFERRED = ("dlib", "cv2", "matplotlib", "plotly", "reportlab", "fpdf", "fontTools",
+            "openai", "replicate", "requests")
+
+
+# 專案本身的套件（不列入套件排行）
+PROJECT_PACKAGES = ("src", "config", "utils", "main", "app", "pages")
+
+
+class ImportProfile(NamedTuple):
+    total_ms: float
+    # 各套件（含其相依）的累計匯入時間，由大到小
+    packages: List[Tuple[str, float]]
+    modules: List[str]
+
+
+def profile_import(module: str) -> ImportProfile:
+    """在新的直譯器中匯入模組一次，解析 -X importtime 的輸出"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 每層巢狀多縮排兩格
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1000))
+
+    total = sum(ms for depth, _, ms in entries if depth == 0)
+    # 輸出為後序（子模組先於上層），反轉後以堆疊追蹤上層；套件只在上層不屬於同一套件時計入
+    packages: Dict[str, float] = {}
+    stack: List[Tuple[int, str]] = []
+    for depth, name, ms in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        package = name.split(".")[0]
+        if not stack or stack[-1][1] != package:
+            packages[package] = packages.get(package, 0) + ms
+        stack.append((depth, package))
+    ranked = sorted(((package, ms) for package, ms in packages.items() if package not in PROJECT_PACKAGES),
+                    key=lambda item: item[1], reverse=True)
+    return ImportProfile(total, ranked, [name for _, name, _ in entries])
+
+
+def eager_heavy_imports(modules: List[str], baseline: Set[str] = frozenset()) -> List[str]:
+    """啟動時匯入的重量級套件；baseline 為框架本身已匯入的套件（例如 streamlit 會匯入 plotly）"""
+    return sorted({name.split(".")[0] for name in modules
+                   if name.split(".")[0] in DEFERRED and name.split(".")[0] not in baseline})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="每個入口量測次數（取中位數）")
+    parser.add_argument("--top", type=int, default=8, help="列出匯入最慢的套件數")
+    parser.add_argument("--check", action="store_true", help="超出預算時以結束碼 1 結束")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS_MS), help="要量測的入口模組")
+    args = parser.parse_args()
+
+    failures = []
+    streamlit_packages = None
+    for module in args.modules:
+        # 第一次匯入會寫入 .pyc，不計入
+        profile_import(module)
+        profiles = [profile_import(module) for _ in range(args.repeat)]
+        median = statistics.median(profile.total_ms for profile in profiles)
+        budget = BUDGETS_MS.get(module)
+        baseline: Set[str] = set()
+        if "streamlit" in profiles[0].modules:
+            if streamlit_packages is None:
+                streamlit_packages = {name.split(".")[0] for name in profile_import("streamlit").modules}
+            baseline = streamlit_packages
+        eager = eager_heavy_imports(profiles[0].modules, baseline)
+
+        status = "ok"
+        if budget is not None and median > budget:
+            status = "OVER BUDGET"
+            failures.append(f"{module}: {median:.0f} ms > {budget:.0f} ms")
+        if eager:
+            status = "EAGER IMPORTS" if status == "ok" else status
+            failures.append(f"{module}: imports {', '.join(eager)} at startup")
+
+        budget_text = f" / {budget:.0f} ms" if budget is not None else ""
+        print(f"{module:<20} {median:7.0f} ms{budget_text:<11} "
+              f"(min {min(p.total_ms for p in profiles):.0f}, {len(profiles[0].modules)} modules)  {status}")
+        for name, ms in profiles[0].packages[:args.top]:
+            print(f"    {ms:7.1f} ms  {name}")
+        if eager:
+            print(f"    eager: {', '.join(eager)}")
+
+    if failures:
+        print("\n" + "\n".join(failures))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""壓力測試：以 N 個並行請求執行分析，回報吞吐量、p50/p95/p99 延遲與錯誤數
+
+預設在同一行程內直接呼叫 AnalysisService；--url 改以 HTTP 呼叫已啟動的分析服務（src.service_http）。
+加上 --mock 時先在背景啟動模擬模型服務（benchmarks.mock_providers），並將資料寫入暫存目錄，完全離線執行。
+每個請求預設使用內容不同的照片，避免被 single-flight 合併；--same-image 則用來量測合併的效果。
+
+用法（於專案根目錄）：
+    python -m benchmarks.load_test --mock --requests 50 --concurrency 10 --model grok-2-vision-1212
+    python -m benchmarks.load_test --mock --latency lognormal:1.5:0.5 --error-rate 0.05 --error-status 500,429
+    python -m benchmarks.load_test --url http://localhost:8000 --requests 20 --concurrency 4 --image face.jpg
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+from benchmarks import mock_providers
+
+
+class Sample(NamedTuple):
+    seconds: float
+    # 失敗時的錯誤摘要；成功為 None
+    error: Optional[str]
+
+
+def make_images(count: int, image_path: Optional[str]) -> List[bytes]:
+    """產生測試照片；每張改動一個像素後重新編碼，使內容雜湊互不相同"""
+    from PIL import Image
+    if image_path:
+        base = Image.open(image_path).convert("RGB")
+    else:
+        base = Image.new("RGB", (480, 600), (224, 190, 170))
+    images = []
+    for i in range(count):
+        image = base.copy()
+        image.putpixel((i % image.width, i // image.width % image.height), (i % 256, i // 256 % 256, 0))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def _error_summary(message: str) -> str:
+    return message.strip().splitlines()[0][:80] if message.strip() else "unknown error"
+
+
+def service_caller(model: str) -> Callable[[bytes], Optional[str]]:
+    """同一行程內呼叫 AnalysisService；回傳錯誤摘要或 None"""
+    # 須在設定模擬服務的環境變數之後才匯入（config.settings 於匯入時讀取）
+    from src.service import AnalysisService
+    service = AnalysisService()
+
+    def call(image_bytes: bytes) -> Optional[str]:
+        result = service.analyze(image_bytes, model)
+        return _error_summary(str(result["error"])) if "error" in result else None
+
+    return call
+
+
+def http_caller(url: str, model: str, timeout: float) -> Callable[[bytes], Optional[str]]:
+    """以 HTTP 呼叫分析服務的 POST /analyze"""
+    endpoint = f"{url.rstrip('/')}/analyze?{urllib.parse.urlencode({'model': model})}"
+
+    def call(image_bytes: bytes) -> Optional[str]:
+        request = urllib.request.Request(endpoint, data=image_bytes, method="POST",
+                                         headers={"Content-Type": "application/octet-stream"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                result = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return f"HTTP {e.code}"
+        except (urllib.error.URLError, OSError) as e:
+            return _error_summary(str(e))
+        return _error_summary(str(result["error"])) if "error" in result else None
+
+    return call
+
+
+def run_load(call: Callable[[bytes], Optional[str]], images: List[bytes], concurrency: int) -> List[Sample]:
+    def timed(image_bytes: bytes) -> Sample:
+        start = time.perf_counter()
+        try:
+            error = call(image_bytes)
+        except Exception as e:
+            error = _error_summary(f"{type(e).__name__}: {str(e)}")
+        return Sample(time.perf_counter() - start, error)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, images))
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50／p95／p99（線性內插）；樣本少於兩個時皆為該值"""
+    if len(values) < 2:
+        return {name: values[0] if values else 0.0 for name in ("p50", "p95", "p99")}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def summarize(samples: List[Sample], wall_seconds: float) -> Dict[str, object]:
+    ok = [sample.seconds for sample in samples if sample.error is None]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if sample.error is not None:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+    return {
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "failed": len(samples) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(ok) / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_seconds": {name: round(value, 3) for name, value in
+                            dict(percentiles(ok), mean=statistics.fmean(ok) if ok else 0.0,
+                                 max=max(ok, default=0.0)).items()},
+        "errors": errors,
+    }
+
+
+def print_summary(summary: Dict[str, object], mock_stats: Optional[Dict[str, int]]) -> None:
+    latency = summary["latency_seconds"]
+    print(f"requests    {summary['requests']}  (ok {summary['succeeded']}, failed {summary['failed']})")
+    print(f"wall time   {summary['wall_seconds']:.2f} s")
+    print(f"throughput  {summary['throughput_rps']:.2f} req/s")
+    print(f"latency     p50 {latency['p50']:.2f} s  p95 {latency['p95']:.2f} s  p99 {latency['p99']:.2f} s  "
+          f"mean {latency['mean']:.2f} s  max {latency['max']:.2f} s")
+    for message, count in sorted(summary["errors"].items(), key=lambda item: -item[1]):
+        print(f"    {count:5d} x {message}")
+    if mock_stats is not None:
+        print(f"mock calls  {', '.join(f'{name} {count}' for name, count in sorted(mock_stats.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20, help="請求總數")
+    parser.add_argument("--concurrency", type=int, default=4, help="並行請求數")
+    parser.add_argument("--model", default="DeepSeek VL2", help="分析模型（DeepSeek VL2 或 grok-2-vision-1212）")
+    parser.add_argument("--image", help="測試照片（預設為純色樣本）")
+    parser.add_argument("--same-image", action="store_true", help="所有請求使用同一張照片（量測 single-flight 合併）")
+    parser.add_argument("--url", help="分析服務網址，例如 http://localhost:8000（預設於本行程呼叫）")
+    parser.add_argument("--timeout", type=float, default=120, help="HTTP 請求逾時（秒）")
+    parser.add_argument("--mock", action="store_true", help="啟動模擬模型服務並使用暫存資料目錄")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    mock_providers.add_arguments(parser)
+    args = parser.parse_args()
+
+    mock = None
+    if args.mock:
+        if args.url:
+            parser.error("--mock 只適用於本行程呼叫；HTTP 服務請以 mock_providers 印出的環境變數啟動")
+        mock = mock_providers.from_arguments(args)
+        server = mock_providers.start_in_background(mock)
+        os.environ.update(mock_providers.provider_env(server))
+        scratch = tempfile.mkdtemp(prefix="load-test-")
+        os.environ["RESPONSES_DB"] = os.path.join(scratch, "responses.db")
+        os.environ["BLOB_STORE_DIR"] = os.path.join(scratch, "blobs")
+        os.environ["SCORE_STORE_DIR"] = os.path.join(scratch, "scores")
+        os.environ["RESPONSE_LOG_DIR"] = os.path.join(scratch, "log")
+
+    call = http_caller(args.url, args.model, args.timeout) if args.url else service_caller(args.model)
+    # 多產生一張照片供預熱請求使用，避免其結果被後續請求共用
+    *images, warm_image = make_images(args.requests + 1, args.image)
+    if args.same_image:
+        images = [images[0]] * args.requests
+    # 第一個請求會載入人臉偵測器等一次性資源，不計入
+    if not args.url:
+        call(warm_image)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, model {args.model}", file=sys.stderr)
+    start = time.perf_counter()
+    samples = run_load(call, images, args.concurrency)
+    summary = summarize(samples, time.perf_counter() - start)
+
+    if args.json:
+        if mock is not None:
+            summary["mock_calls"] = mock.stats()
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary, mock.stats() if mock is not None else None)
+
+
+if __name__ == "__main__":
+    main()
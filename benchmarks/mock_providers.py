@@ -0,0 +1,330 @@
+"""模擬模型服務：以本地 HTTP 伺服器代替 xAI／DeepSeek（OpenAI 相容 chat completions）與 Replicate，供離線壓力測試
+
+只實作 ImageAnalyzer 與 app.py 用到的端點，可設定延遲分布、錯誤率與固定回應。
+將 XAI_BASE_URL、DEEPSEEK_BASE_URL、OPENAI_BASE_URL 設為 http://HOST:PORT/v1，
+REPLICATE_BASE_URL 設為 http://HOST:PORT 即可讓應用程式改連此伺服器。
+
+用法（於專案根目錄）：
+    python -m benchmarks.mock_providers --port 8900 --latency lognormal:1.2:0.4
+    python -m benchmarks.mock_providers --replicate-latency uniform:2:6 --error-rate 0.05 --error-status 500,429
+    python -m benchmarks.mock_providers --responses canned.json   # {"analysis": "...", "report": "...", "replicate": "..."}
+"""
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Sequence
+from src.analysis_schema import REGION_NAMES, DIMENSION_NAMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8900
+
+# 與 ImageAnalyzer 呼叫的 DeepSeek VL2 版本一致
+REPLICATE_VERSION = "e5caf557dd9e5dcee46442e1315291ef1867f027991ede8ff95e304d4f734200"
+
+# 固定回應：未以 --responses 覆寫時使用；文字格式可被 score_extractor 與報告解析
+DEFAULT_RESPONSES: Dict[str, str] = {
+    "analysis": "\n".join(
+        f"### {region}\n" + " ".join(f"{name} {3 + (i + j) % 3}/5" for j, name in enumerate(DIMENSION_NAMES))
+        for i, region in enumerate(REGION_NAMES)
+    ),
+    "report": (
+        "1. 面部狀況綜合評估\n整體膚況良好，眼周與額頭有輕微細紋。\n"
+        "2. 推薦的醫美治療方案\n1. **肉毒素**：額頭，20 單位，預期皺紋減少 40%\n"
+        "2. **玻尿酸填充**：眼周，1 ml，預期凹陷改善 50%\n3. **皮秒雷射**：頰骨，3 次療程\n"
+        "3. 預期效果\n療程結束後膚況改善約 30%。"
+    ),
+}
+DEFAULT_RESPONSES["replicate"] = DEFAULT_RESPONSES["analysis"]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """延遲分布：fixed:秒、uniform:最小:最大、lognormal:中位數:sigma（秒）"""
+    kind, *params = spec.split(":")
+    try:
+        values = [float(value) for value in params]
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(values[0], values[1])
+        if kind == "lognormal" and len(values) == 2:
+            # 中位數 m 的對數常態分布：exp(ln m + sigma * Z)
+            return lambda rng: values[0] * rng.lognormvariate(0, values[1])
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"Invalid latency spec: {spec}")
+
+
+def structured_analysis(rng: random.Random) -> Dict[str, Any]:
+    """符合 ANALYSIS_SCHEMA 的分析結果"""
+    return {
+        "summary": "整體膚況良好，眼周有輕微細紋，頰骨有少量色斑。",
+        "regions": [{"region": region, "scores": {name: rng.randint(2, 5) for name in DIMENSION_NAMES},
+                     "note": f"{region}膚況穩定"} for region in REGION_NAMES],
+    }
+
+
+def structured_report() -> Dict[str, Any]:
+    """符合 REPORT_SCHEMA 的治療建議"""
+    treatments = [("肉毒素", "額頭"), ("玻尿酸填充", "眼周"), ("皮秒雷射", "頰骨"), ("電波拉提", "下巴"),
+                  ("水光注射", "全臉")]
+    return {
+        "assessment": "整體膚況良好，主要問題為額頭動態紋與眼周凹陷。",
+        "treatments": [{"priority": i, "name": name, "area": area, "method": "依療程分 3 次進行",
+                        "expected_effect": "改善約 40%", "aftercare": "加強保濕與防曬", "risks": "暫時性紅腫"}
+                       for i, (name, area) in enumerate(treatments, 1)],
+    }
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class MockProviders:
+    """模擬服務的設定與狀態（延遲、錯誤率、固定回應與請求計數）"""
+
+    def __init__(self, chat_latency: str = "fixed:0.5", replicate_latency: Optional[str] = None,
+                 error_rate: float = 0.0, error_statuses: Sequence[int] = (500,),
+                 responses: Optional[Dict[str, str]] = None, seed: Optional[int] = None):
+        self.chat_latency = parse_latency(chat_latency)
+        self.replicate_latency = parse_latency(replicate_latency or chat_latency)
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.responses = dict(DEFAULT_RESPONSES, **(responses or {}))
+        self.predictions: Dict[str, Dict[str, Any]] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def sample(self, latency: Callable[[random.Random], float]) -> float:
+        with self._lock:
+            return max(0.0, latency(self._rng))
+
+    def injected_error(self) -> Optional[int]:
+        """依錯誤率抽出要回傳的錯誤狀態碼；不注入錯誤時回傳 None"""
+        with self._lock:
+            if self._rng.random() < self.error_rate:
+                return self._rng.choice(self.error_statuses)
+        return None
+
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """OpenAI 相容的 chat completion 回應；有 response_format 時回傳 JSON 內容"""
+        response_format = body.get("response_format") or {}
+        schema_name = response_format.get("json_schema", {}).get("name", "")
+        prompt = json.dumps(body.get("messages", []), ensure_ascii=False)
+        is_report = schema_name == "treatment_report" or "治療方案" in prompt or "treatment" in schema_name
+        kind = "report" if is_report else "analysis"
+
+        if response_format:
+            with self._lock:
+                data = structured_report() if is_report else structured_analysis(self._rng)
+            content = json.dumps(data, ensure_ascii=False)
+        else:
+            content = self.responses[kind]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        }
+
+    def prediction(self, body: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+        """已完成的 Replicate prediction（以 Prefer: wait 的同步模式回傳）"""
+        prediction_id = uuid.uuid4().hex[:26]
+        started_at = _now()
+        prediction = {
+            "id": prediction_id,
+            "model": "deepseek-ai/deepseek-vl2",
+            "version": body.get("version", REPLICATE_VERSION),
+            "status": "succeeded",
+            "input": body.get("input", {}),
+            "output": self.responses["replicate"],
+            "logs": "",
+            "error": None,
+            "metrics": {"predict_time": 0.0},
+            "created_at": started_at,
+            "started_at": started_at,
+            "completed_at": _now(),
+            "urls": {"get": f"{base_url}/v1/predictions/{prediction_id}",
+                     "cancel": f"{base_url}/v1/predictions/{prediction_id}/cancel"},
+        }
+        with self._lock:
+            self.predictions[prediction_id] = prediction
+        return prediction
+
+
+def make_handler(mock: MockProviders) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+        def _send_json(self, status: int, payload: Any) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status: int) -> None:
+            body = json.dumps({"error": {"message": f"mock injected error {status}", "type": "mock_error"},
+                               "detail": f"mock injected error {status}"}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _base_url(self) -> str:
+            return f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]}"
+
+        def _delay_or_error(self, latency: Callable[[random.Random], float]) -> bool:
+            """模擬服務延遲；注入錯誤時回傳錯誤並回傳 False"""
+            time.sleep(mock.sample(latency))
+            status = mock.injected_error()
+            if status is not None:
+                mock.count(f"error_{status}")
+                self._send_error(status)
+                return False
+            return True
+
+        def do_POST(self):
+            path = self.path.split("?")[0].rstrip("/")
+            raw = self._read_body()
+            try:
+                if path.endswith("/chat/completions"):
+                    mock.count("chat")
+                    if self._delay_or_error(mock.chat_latency):
+                        self._send_json(200, mock.chat_completion(json.loads(raw or b"{}")))
+                elif path == "/v1/files":
+                    # 上傳的圖片內容不需保存，只回傳 File 物件
+                    mock.count("files")
+                    file_id = uuid.uuid4().hex[:24]
+                    self._send_json(201, {
+                        "id": file_id, "name": "image.jpg", "content_type": "image/jpeg", "size": len(raw),
+                        "etag": file_id, "checksums": {}, "metadata": {}, "created_at": _now(),
+                        "expires_at": None, "urls": {"get": f"{self._base_url()}/v1/files/{file_id}"},
+                    })
+                elif path == "/v1/predictions" or path.endswith("/predictions"):
+                    mock.count("predictions")
+                    if self._delay_or_error(mock.replicate_latency):
+                        self._send_json(201, mock.prediction(json.loads(raw or b"{}"), self._base_url()))
+                else:
+                    self._send_json(404, {"detail": f"Not found: {path}"})
+            except ValueError as e:
+                self._send_json(400, {"detail": f"Invalid request body: {str(e)}"})
+
+        def do_GET(self):
+            path = self.path.split("?")[0].rstrip("/")
+            parts = path.strip("/").split("/")
+            if path == "/stats":
+                self._send_json(200, mock.stats())
+            elif len(parts) == 3 and parts[:2] == ["v1", "predictions"]:
+                prediction = mock.predictions.get(parts[2])
+                if prediction is None:
+                    self._send_json(404, {"detail": "Prediction not found"})
+                else:
+                    self._send_json(200, prediction)
+            elif len(parts) == 6 and parts[:2] == ["v1", "models"] and parts[4] == "versions":
+                # Output 為字串（非串流迭代器），replicate.run 直接回傳完整文字
+                self._send_json(200, {
+                    "id": parts[5], "created_at": "2024-12-01T00:00:00Z", "cog_version": "0.13.6",
+                    "openapi_schema": {"components": {"schemas": {"Output": {"type": "string"}}}},
+                })
+            else:
+                self._send_json(404, {"detail": f"Not found: {path}"})
+
+    return Handler
+
+
+def create_server(mock: MockProviders, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(mock: MockProviders, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在背景執行緒啟動模擬服務（port 0 表示自動選擇），供壓力測試於同一行程使用"""
+    server = create_server(mock, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-providers", daemon=True).start()
+    return server
+
+
+def provider_env(server: ThreadingHTTPServer) -> Dict[str, str]:
+    """讓應用程式改連模擬服務的環境變數（含假的 API 金鑰）"""
+    host, port = server.server_address[:2]
+    base = f"http://{host}:{port}"
+    return {
+        "XAI_BASE_URL": f"{base}/v1", "DEEPSEEK_BASE_URL": f"{base}/v1", "OPENAI_BASE_URL": f"{base}/v1",
+        "REPLICATE_BASE_URL": base, "XAI_API_KEY": "xai-mock", "DEEPSEEK_API_KEY": "sk-mock",
+        "REPLICATE_API_TOKEN": "r8_mock", "REPLICATE_POLL_INTERVAL": "0.05",
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """模擬服務的命令列參數（壓力測試以 --mock 啟動時共用）"""
+    parser.add_argument("--latency", default="fixed:0.5", help="chat completions 延遲分布，例如 lognormal:1.2:0.4")
+    parser.add_argument("--replicate-latency", help="Replicate 延遲分布（預設與 --latency 相同）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入錯誤的比例（0-1）")
+    parser.add_argument("--error-status", default="500", help="注入錯誤的狀態碼，以逗號分隔，例如 500,429")
+    parser.add_argument("--responses", help="固定回應 JSON 檔（analysis／report／replicate 文字）")
+    parser.add_argument("--seed", type=int, help="亂數種子，使延遲與錯誤可重現")
+
+
+def from_arguments(args: argparse.Namespace) -> MockProviders:
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    return MockProviders(args.latency, args.replicate_latency, args.error_rate,
+                         [int(status) for status in args.error_status.split(",")], responses, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = create_server(from_arguments(args), args.host, args.port)
+    for name, value in provider_env(server).items():
+        print(f"{name}={value}")
+    logger.info(f"模擬模型服務已啟動: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""多執行緒人臉偵測回歸檢查：多個執行緒同時以不同尺寸的照片偵測人臉，確認不會崩潰且結果與單執行緒一致
+
+對應 Streamlit 會話、HTTP 服務（ThreadingHTTPServer）與即時預覽同時偵測的情況；
+dlib 偵測器若在執行緒間共用，通常在數秒內以 segfault 或 "double free" 中止整個行程。
+
+用法（於專案根目錄）：
+    python -m benchmarks.stress_detection
+    python -m benchmarks.stress_detection --threads 8 --rounds 50 --sizes 0.3,1,3,6
+"""
+import io
+import sys
+import time
+import argparse
+import threading
+import faulthandler
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+from PIL import Image
+from benchmarks.bench_hot_paths import CORPUS_IMAGE, sized_jpeg
+
+
+def detection_calls(jpeg: bytes) -> Dict[str, Callable[[], Any]]:
+    """同一張照片經由各個偵測路徑的呼叫"""
+    from src import skin_metrics
+    from src.image_analyzer import ImageAnalyzer
+    analyzer = ImageAnalyzer()
+    pixels = np.array(Image.open(io.BytesIO(jpeg)).convert("RGB"))
+
+    def metrics():
+        result = skin_metrics.compute_metrics(jpeg)
+        return result.face_found, result.scores
+
+    return {
+        "analyzer": lambda: analyzer.detect_face_regions(pixels),
+        "face_crop": lambda: skin_metrics._face_crop(pixels)[1],
+        "metrics": metrics,
+    }
+
+
+def run(threads: int, rounds: int, sizes: List[float], image_path: str) -> Tuple[int, List[str]]:
+    """回傳 (呼叫次數, 與單執行緒結果不符的項目)"""
+    source = Image.open(image_path).convert("RGB")
+    calls: List[Tuple[str, Callable[[], Any]]] = []
+    for size in sizes:
+        for path, call in detection_calls(sized_jpeg(source, size)).items():
+            calls.append((f"{path}@{size}MP", call))
+    # 單執行緒的結果作為預期值，同時預熱各路徑
+    expected = {name: repr(call()) for name, call in calls}
+
+    mismatches: List[str] = []
+    lock = threading.Lock()
+
+    def worker(offset: int) -> int:
+        count = 0
+        for i in range(rounds):
+            # 各執行緒錯開順序，使不同尺寸與路徑同時執行
+            name, call = calls[(offset + i) % len(calls)]
+            result = repr(call())
+            count += 1
+            if result != expected[name]:
+                with lock:
+                    mismatches.append(f"{name}: {result} != {expected[name]}")
+        return count
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(worker, range(threads)))
+    return total, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4, help="並行執行緒數")
+    parser.add_argument("--rounds", type=int, default=30, help="每個執行緒的偵測次數")
+    parser.add_argument("--sizes", default="0.3,1,3", help="照片尺寸（百萬像素，逗號分隔）")
+    parser.add_argument("--image", default=CORPUS_IMAGE, help="縮放為各尺寸的樣本照片")
+    args = parser.parse_args()
+
+    # 崩潰時印出各執行緒的堆疊，指出同時執行的偵測路徑
+    faulthandler.enable()
+    start = time.perf_counter()
+    total, mismatches = run(args.threads, args.rounds, [float(size) for size in args.sizes.split(",")], args.image)
+    print(f"{total} detections on {args.threads} threads in {time.perf_counter() - start:.2f} s, "
+          f"{len(mismatches)} mismatches")
+    for message in mismatches[:10]:
+        print(f"    {message}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,10 @@ DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 XAI_API_KEY = os.getenv("XAI_API_KEY")
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 GROK_API_KEY = os.getenv("XAI_API_KEY")  # Using XAI_API_KEY for Grok model as well
+# Provider endpoints; point them at benchmarks/mock_providers.py for offline load tests
+# (the Replicate and OpenAI SDKs read REPLICATE_BASE_URL / OPENAI_BASE_URL themselves)
+XAI_BASE_URL = os.getenv("XAI_BASE_URL", "https://api.x.ai/v1")
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
 # Logging configuration
 logging.basicConfig(
@@ -27,11 +31,99 @@ MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Report generation settings
 REPORT_FONT_PATH = "static/fonts/msyh.ttc"
+# Directories searched (in order) for a CJK font when REPORT_FONT_PATH is missing
+REPORT_FONT_SEARCH_PATH = [
+    path for path in os.getenv("REPORT_FONT_SEARCH_PATH", "").split(os.pathsep) if path
+] or [
+    "static/fonts",
+    "fonts",
+    "/usr/share/fonts/opentype/noto",
+    "/usr/share/fonts/truetype/noto",
+    "/usr/share/fonts/truetype/wqy",
+    "/usr/share/fonts/truetype/arphic",
+    "/System/Library/Fonts",
+    "C:\\Windows\\Fonts",
+]
+REPORT_FONT_FILES = [
+    "msyh.ttc", "simsun.ttc", "simsun.ttf", "simhei.ttf",
+    "NotoSansCJK-Regular.ttc", "NotoSerifCJK-Regular.ttc",
+    "wqy-microhei.ttc", "wqy-zenhei.ttc", "uming.ttc", "PingFang.ttc",
+]
 DEFAULT_REPORT_FILENAME = "醫美診所智能評估報告.pdf"
+# Worker threads shared by all sessions for background report builds
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Embedded photos are recompressed to JPEG at this quality (printed size x PRINT_DPI)
+REPORT_JPEG_QUALITY = int(os.getenv("REPORT_JPEG_QUALITY", "80"))
+# Reports larger / slower than this are logged as over budget
+REPORT_SIZE_BUDGET_KB = int(os.getenv("REPORT_SIZE_BUDGET_KB", "1024"))
+REPORT_TIME_BUDGET = float(os.getenv("REPORT_TIME_BUDGET", "5"))  # seconds
+
+# Storage settings
+RESPONSES_DB = os.getenv("RESPONSES_DB", "responses.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT = 5  # seconds
+# Responses older than this are purged by background compaction; 0 (default) keeps everything.
+# Purging also releases the stored images and drops the entries from history and score trends.
+RESPONSE_RETENTION_DAYS = int(os.getenv("RESPONSE_RETENTION_DAYS", "0"))
+RESPONSE_COMPACT_INTERVAL = int(os.getenv("RESPONSE_COMPACT_INTERVAL", "3600"))  # seconds, 0 disables
+RESPONSE_COMPRESSION_LEVEL = 6  # zlib level for stored payloads
+# Provider responses are logged by a background writer: "db", "json" (segmented JSONL log) or "db,json"
+RESPONSE_LOG_SINKS = [sink.strip() for sink in os.getenv("RESPONSE_LOG_SINKS", "db").split(",") if sink.strip()]
+RESPONSE_LOG_QUEUE_SIZE = int(os.getenv("RESPONSE_LOG_QUEUE_SIZE", "1000"))
+RESPONSE_LOG_BATCH_SIZE = 50
+RESPONSE_LOG_FLUSH_INTERVAL = 0.5  # seconds
+RESPONSE_LOG_PUT_TIMEOUT = 1  # seconds to wait on a full queue before writing inline
+# Append-only JSONL response log, rotated when a segment reaches this size
+RESPONSE_LOG_DIR = os.getenv("RESPONSE_LOG_DIR", "temp/log")
+RESPONSE_SEGMENT_BYTES = int(os.getenv("RESPONSE_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# Columnar region x dimension scores for aggregate statistics
+SCORE_STORE_DIR = os.getenv("SCORE_STORE_DIR", "temp/scores")
+# Content-addressed upload store; unreferenced images are evicted (least recently used first) above the quota
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "temp/blobs")
+BLOB_STORE_QUOTA_MB = int(os.getenv("BLOB_STORE_QUOTA_MB", "1024"))
+BLOB_GC_GRACE = 3600  # seconds an unreferenced upload is kept before it can be evicted
+BLOB_GC_INTERVAL = 600  # seconds
+# File names (glob patterns) that `python -m src.blob_store --import ... --delete` never removes: the sample
+# photo used by the benchmarks and the bundled chart images in temp/
+BLOB_IMPORT_KEEP = [pattern.strip() for pattern in os.getenv(
+    "BLOB_IMPORT_KEEP", "20200911150349c274.jpg,face_heatmap.png,radar_chart.png,treatment_priority.png"
+).split(",") if pattern.strip()]
+# Analysis history dashboard
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+
+# Headless analysis service (python -m src.service_http)
+SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+SERVICE_MAX_UPLOAD_MB = int(os.getenv("SERVICE_MAX_UPLOAD_MB", "10"))
+
+# Durable analysis / report job queue (stored in RESPONSES_DB, consumed by python -m src.job_worker)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# The Streamlit app starts its own worker processes; set to false when workers run separately
+JOB_SPAWN_WORKERS = os.getenv("JOB_SPAWN_WORKERS", "true").lower() in ("1", "true", "yes")
+# A running job whose worker stops renewing its lease for this long is handed to another worker
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = 5  # seconds before the first retry, doubled after each failed attempt
+JOB_POLL_INTERVAL = 1  # seconds
+JOB_TTL = 3600  # seconds finished jobs and their results are kept
+
+# Single-flight: concurrent analyses of the same photo, model and prompt version share one provider call
+# Coordinate across processes (app, service, job workers) through a lock table in RESPONSES_DB
+SINGLE_FLIGHT_SHARED = os.getenv("SINGLE_FLIGHT_SHARED", "true").lower() in ("1", "true", "yes")
+# Lease on the cross-process lock; the owner renews it every third of the lease while the call runs,
+# so it only expires (and a waiter takes over) when the owning process dies
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "300"))
+SINGLE_FLIGHT_RESULT_TTL = 60  # seconds a finished result is kept for callers polling from other processes
+SINGLE_FLIGHT_POLL_INTERVAL = 0.5  # seconds
+
+# Preload detectors, fonts, clients and report templates at server / worker start (python -m src.warmup)
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() in ("1", "true", "yes")
 
 # Analysis settings
 FACE_DETECTION_CONFIDENCE = 0.8
 ANALYSIS_TIMEOUT = 30  # seconds
+# Request JSON-schema constrained output from providers that support it
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
 
 # Cache settings
 CACHE_ENABLED = True
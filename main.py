@@ -1,10 +1,20 @@
+import io
+import json
+import time
 import streamlit as st
 import logging
-from src.image_analyzer import ImageAnalyzer
-from src.report_generator import ReportGenerator
 from src.ui_components import UIComponents
+from src.job_queue import get_job_queue, spawn_workers
+from src.report_jobs import DONE, FAILED
+from src.blob_store import get_blob_store
+from src.score_extractor import response_hash
+from src.skin_metrics import metrics_for_blob
+from src import warmup
 from utils.helpers import validate_image, save_api_response
-from config.settings import DEEPSEEK_API_KEY, XAI_API_KEY, REPLICATE_API_TOKEN, GROK_API_KEY
+from config.settings import (
+    DEEPSEEK_API_KEY, XAI_API_KEY, REPLICATE_API_TOKEN, GROK_API_KEY, JOB_SPAWN_WORKERS, JOB_POLL_INTERVAL,
+    WARM_UP_ON_START,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +30,23 @@ if 'report_generated' not in st.session_state:
 if 'selected_model' not in st.session_state:
     st.session_state.selected_model = "DeepSeek VL2"  # 預設模型
 
+REPORT_LAYOUT = "premium"
+
+@st.cache_resource
+def start_job_workers():
+    """隨應用程式啟動分析／報告工作行程（每個伺服器行程一次）；JOB_SPAWN_WORKERS=false 時由外部另行啟動"""
+    return spawn_workers() if JOB_SPAWN_WORKERS else None
+
+@st.cache_resource
+def start_warm_up():
+    """在背景預先建立人臉偵測器並載入 OpenCV（每個伺服器行程一次），第一張照片的本地指標不需等待"""
+    return warmup.start_warm_up([("face_detector", warmup.warm_face_detector),
+                                 ("skin_metrics", warmup.warm_skin_metrics)])
+
 class BeautyClinicApp:
     def __init__(self):
-        self.image_analyzer = ImageAnalyzer()
-        self.report_generator = ReportGenerator()
+        # 分析與報告由工作行程執行，頁面只提交任務並輪詢狀態
+        self.jobs = get_job_queue()
         self.analysis_result = None
         self.report_buffer = None
 
@@ -49,29 +72,21 @@ class BeautyClinicApp:
                     # 顯示已上傳的圖片
                     image = validate_image(st.session_state.uploaded_image)
                     st.image(image, caption="上傳的照片", use_container_width=True)
+                    # AI 分析需時數十秒，先顯示本地指標
+                    self.show_local_metrics()
                     
+                    job_id = st.session_state.get('analysis_job')
                     # 添加分析按鈕
-                    if st.button("開始分析"):
-                        with st.spinner("正在進行 AI 分析..."):
-                            logger.info(f"開始使用 {st.session_state.selected_model} 進行 AI 分析...")
-                            self.analysis_result = self.image_analyzer.analyze_image(
-                                st.session_state.uploaded_image,
-                                model=st.session_state.selected_model
+                    if job_id is None:
+                        if st.button("開始分析"):
+                            logger.info(f"提交 {st.session_state.selected_model} AI 分析任務...")
+                            st.session_state.analysis_job = self.jobs.enqueue(
+                                "analysis", {"model": st.session_state.selected_model},
+                                image_hash=st.session_state.uploaded_blob
                             )
-                            
-                            # Check if there was an error in the analysis
-                            if "error" in self.analysis_result:
-                                st.error(f"分析過程中發生錯誤: {self.analysis_result['error']}")
-                                logger.error(f"分析錯誤: {self.analysis_result['error']}")
-                                # Still store the result to allow viewing error details
-                                st.session_state.analysis_result = self.analysis_result
-                                st.session_state.analysis_complete = False
-                            else:
-                                st.session_state.analysis_result = self.analysis_result
-                                st.session_state.analysis_complete = True
-                                st.session_state.current_step = 3
-                                logger.info("AI 分析完成，切換到步驟 3")
-                                st.rerun()
+                            st.rerun()
+                    else:
+                        self.show_analysis_job(job_id)
             
             # Step 3: Generate Report
             elif st.session_state.current_step == 3:
@@ -81,19 +96,22 @@ class BeautyClinicApp:
                     
                     UIComponents.create_analysis_section(self.analysis_result)
                     
+                    job_id = st.session_state.get('report_job')
                     # 添加生成報告按鈕
-                    if st.button("生成醫美建議報告"):
-                        with st.spinner("正在生成報告..."):
-                            logger.info("開始生成報告...")
-                            self.report_buffer = self.report_generator.generate_report(
-                                self.analysis_result,
-                                [st.session_state.uploaded_image]
+                    if job_id is None:
+                        if st.button("生成醫美建議報告"):
+                            logger.info("提交報告生成任務...")
+                            # 相同分析結果的報告只生成一次
+                            key = response_hash(REPORT_LAYOUT, st.session_state.uploaded_blob or "",
+                                                json.dumps(self.analysis_result, ensure_ascii=False,
+                                                           sort_keys=True, default=str))
+                            st.session_state.report_job = self.jobs.enqueue(
+                                "report", {"analysis_result": self.analysis_result, "layout": REPORT_LAYOUT},
+                                key=key, image_hash=st.session_state.uploaded_blob
                             )
-                            st.session_state.report_buffer = self.report_buffer
-                            st.session_state.report_generated = True
-                            st.session_state.current_step = 4
-                            logger.info("報告生成完成，切換到步驟 4")
                             st.rerun()
+                    else:
+                        self.show_report_job(job_id)
             
             # Step 4: View Results
             elif st.session_state.current_step == 4:
@@ -109,7 +127,7 @@ class BeautyClinicApp:
                     # 添加重新開始按鈕
                     if st.button("重新開始"):
                         for key in list(st.session_state.keys()):
-                            if key not in ['fonts_registered', 'app_fonts_registered', 'selected_model']:
+                            if key not in ['selected_model']:
                                 del st.session_state[key]
                         st.session_state.current_step = 1
                         st.session_state.image_processed = False
@@ -121,6 +139,85 @@ class BeautyClinicApp:
             logger.error(f"Error in main app flow: {str(e)}", exc_info=True)
             st.error("應用程序發生錯誤，請重試")
 
+    def wait_for_job(self, job_id, label):
+        """顯示任務進度；任務仍在排隊或執行時稍候重新整理頁面，結束時回傳任務狀態"""
+        job = self.jobs.status(job_id)
+        if job is None or job['state'] in (DONE, FAILED):
+            return job
+        if job['attempts'] == 0:
+            st.info(f"{label}排隊中，請稍候...")
+        else:
+            update_progress, _ = UIComponents.create_progress_reporter()
+            retry = f"（第 {job['attempts']} 次嘗試）" if job['attempts'] > 1 else ""
+            update_progress(job['progress'], f"{job['message'] or label + '進行中...'}{retry}")
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+
+    def show_analysis_job(self, job_id):
+        """輪詢分析任務，完成後切換到步驟 3"""
+        job = self.wait_for_job(job_id, "AI 分析")
+        if job is not None and job['state'] == DONE:
+            self.analysis_result, _ = self.jobs.result(job_id)
+            # Check if there was an error in the analysis
+            if "error" in self.analysis_result:
+                st.error(f"分析過程中發生錯誤: {self.analysis_result['error']}")
+                logger.error(f"分析錯誤: {self.analysis_result['error']}")
+                # Still store the result to allow viewing error details
+                st.session_state.analysis_result = self.analysis_result
+                st.session_state.analysis_complete = False
+            else:
+                st.session_state.analysis_result = self.analysis_result
+                st.session_state.analysis_complete = True
+                st.session_state.current_step = 3
+                logger.info("AI 分析完成，切換到步驟 3")
+                st.rerun()
+        else:
+            st.error(f"分析過程中發生錯誤: {job['error'] if job else '分析任務已失效'}")
+        if st.button("重新分析"):
+            del st.session_state['analysis_job']
+            st.rerun()
+        if st.button("以本地指標繼續"):
+            self.use_local_metrics()
+
+    def show_local_metrics(self):
+        """顯示上傳照片的本地膚質指標（不呼叫 API，每張照片只計算一次）"""
+        try:
+            metrics = metrics_for_blob(st.session_state.uploaded_blob)
+        except Exception as e:
+            logger.error(f"本地指標計算失敗: {str(e)}")
+            return
+        if metrics is not None:
+            UIComponents.create_local_metrics_section(metrics)
+
+    def use_local_metrics(self):
+        """AI 模型無法使用時，以本地指標作為分析結果繼續生成報告"""
+        metrics = metrics_for_blob(st.session_state.uploaded_blob)
+        if metrics is None:
+            st.error("未找到上傳的圖片，請返回上一步重新上傳")
+            return
+        logger.info("以本地指標取代 AI 分析結果")
+        st.session_state.analysis_result = {"analysis": metrics.to_analysis(),
+                                            "image_hash": st.session_state.uploaded_blob}
+        st.session_state.analysis_complete = True
+        st.session_state.current_step = 3
+        st.rerun()
+
+    def show_report_job(self, job_id):
+        """輪詢報告任務，完成後切換到步驟 4"""
+        job = self.wait_for_job(job_id, "報告生成")
+        if job is not None and job['state'] == DONE:
+            _, pdf_bytes = self.jobs.result(job_id)
+            self.report_buffer = io.BytesIO(pdf_bytes)
+            st.session_state.report_buffer = self.report_buffer
+            st.session_state.report_generated = True
+            st.session_state.current_step = 4
+            logger.info("報告生成完成，切換到步驟 4")
+            st.rerun()
+        st.error(f"報告生成失敗: {job['error'] if job else '報告任務已失效'}")
+        if st.button("重新生成報告"):
+            del st.session_state['report_job']
+            st.rerun()
+
     def create_sidebar(self):
         """創建側邊欄，顯示應用程式基本操作步驟和模型選擇"""
         with st.sidebar:
@@ -184,6 +281,8 @@ class BeautyClinicApp:
             
             # Store image in session state
             st.session_state.uploaded_image = uploaded_file
+            # 工作行程由內容定址儲存讀取圖片
+            st.session_state.uploaded_blob = get_blob_store().put(uploaded_file.getvalue())
             st.session_state.image_processed = True
             logger.info("圖片已保存到 session_state")
             
@@ -214,5 +313,8 @@ if __name__ == "__main__":
         st.stop()
     
     # Run app
+    start_job_workers()
+    if WARM_UP_ON_START:
+        start_warm_up()
     app = BeautyClinicApp()
     app.run()
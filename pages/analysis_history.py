@@ -0,0 +1,125 @@
+import datetime
+import streamlit as st
+from src.history import HistoryFilter, query_history, history_models, history_detail
+from src.score_store import DIMENSION_AXIS, get_score_store
+
+st.set_page_config(
+    page_title="分析歷史",
+    page_icon="📊",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+
+@st.cache_data(ttl=60)
+def _models():
+    return history_models()
+
+
+def _filters() -> HistoryFilter:
+    """側邊欄篩選條件"""
+    with st.sidebar:
+        st.header("篩選條件")
+        dates = st.date_input("日期範圍", value=())
+        response_type = st.selectbox("類型", ["全部", "grok", "deepseek"])
+        model = st.selectbox("模型", ["全部"] + _models())
+        client_id = st.text_input("客戶編號").strip()
+        image_hash = st.text_input("圖片雜湊").strip()
+        min_score, max_score = st.slider("整體評分", 0.0, 5.0, (0.0, 5.0), step=0.5)
+
+    since = until = None
+    if dates:
+        since = dates[0].isoformat()
+        # 結束日期包含當天
+        until = (dates[-1] + datetime.timedelta(days=1)).isoformat()
+    scored = (min_score, max_score) != (0.0, 5.0)
+    return HistoryFilter(
+        since=since,
+        until=until,
+        response_type=None if response_type == "全部" else response_type,
+        model=None if model == "全部" else model,
+        image_hash=image_hash or None,
+        client_id=client_id or None,
+        min_score=min_score if scored else None,
+        max_score=max_score if scored else None,
+    )
+
+
+def _load_page(filters: HistoryFilter) -> None:
+    page = query_history(filters, cursor=st.session_state.history_cursor)
+    st.session_state.history_items.extend(page.items)
+    st.session_state.history_cursor = page.next_cursor
+    st.session_state.history_done = page.next_cursor is None
+
+
+def _statistics(filters: HistoryFilter) -> None:
+    """欄式評分儲存上的全歷史統計與回訪客戶趨勢"""
+    scores = get_score_store()
+    if not len(scores):
+        return
+    with st.expander(f"評分統計（{len(scores)} 筆分析）"):
+        dimension = st.selectbox("維度", DIMENSION_AXIS)
+        col1, col2 = st.columns(2)
+        with col1:
+            months = scores.monthly_average(dimension, since=filters.since, until=filters.until)
+            if months:
+                st.caption("每月平均分")
+                st.line_chart({"月份": [m["month"] for m in months], "平均分": [m["average"] for m in months]},
+                              x="月份", y="平均分")
+        with col2:
+            histogram = scores.distribution(dimension, since=filters.since, until=filters.until)
+            st.caption("評分分布")
+            st.bar_chart({"評分": histogram["bins"], "筆數": histogram["counts"]}, x="評分", y="筆數")
+
+    if filters.client_id:
+        trend = scores.client_trend(filters.client_id)
+        if len(trend) > 1:
+            st.subheader("客戶前後對比")
+            chart = {"日期": [point["created_at"] for point in trend]}
+            for name in DIMENSION_AXIS:
+                chart[name] = [point["scores"].get(name) for point in trend]
+            st.line_chart(chart, x="日期", y=DIMENSION_AXIS)
+
+
+def main():
+    st.title("分析歷史")
+    filters = _filters()
+    _statistics(filters)
+
+    # 篩選條件改變時從第一頁重新載入
+    if st.session_state.get('history_filter') != filters:
+        st.session_state.history_filter = filters
+        st.session_state.history_items = []
+        st.session_state.history_cursor = None
+        st.session_state.history_done = False
+        _load_page(filters)
+
+    items = st.session_state.history_items
+    if not items:
+        st.info("沒有符合條件的分析記錄")
+        return
+
+    st.dataframe(items, use_container_width=True, hide_index=True)
+    if st.session_state.history_done:
+        st.caption(f"共 {len(items)} 筆")
+    elif st.button(f"載入更多（已載入 {len(items)} 筆）"):
+        _load_page(filters)
+        st.rerun()
+
+    # 詳細內容只在選取時讀取並解壓
+    response_id = st.selectbox("查看記錄", [item["id"] for item in items], index=None, placeholder="選擇記錄 ID")
+    if response_id is not None:
+        detail = history_detail(response_id)
+        if detail is None:
+            st.warning("記錄不存在")
+            return
+        if detail["scores"] and detail["scores"]["scores"]:
+            st.subheader("評分")
+            st.table(detail["scores"]["scores"])
+        st.subheader("內容")
+        st.markdown(detail["content"] or "")
+        with st.expander("原始回應"):
+            st.json(detail["response"])
+
+
+main()
@@ -0,0 +1,141 @@
+import re
+import json
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 與 score_extractor 的區域／維度一致
+REGION_NAMES = ['額頭', '眼周', '鼻子', '頰骨', '嘴唇', '下巴']
+DIMENSION_NAMES = ['皮膚狀況', '皺紋', '色斑', '緊致度', '其他特徵']
+
+# 分析提示詞或 schema 變更時遞增；相同照片與模型的請求只在同一版提示詞下合併
+PROMPT_VERSION = 1
+
+_SCORE = {"type": "integer", "minimum": 0, "maximum": 5}
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string", "description": "整體膚況摘要，150 字以內"},
+        "regions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "region": {"type": "string", "enum": REGION_NAMES},
+                    "scores": {
+                        "type": "object",
+                        "properties": {name: _SCORE for name in DIMENSION_NAMES},
+                        "required": DIMENSION_NAMES,
+                        "additionalProperties": False,
+                    },
+                    "note": {"type": "string", "description": "30 字以內的簡短描述"},
+                },
+                "required": ["region", "scores", "note"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["summary", "regions"],
+    "additionalProperties": False,
+}
+
+REPORT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "assessment": {"type": "string", "description": "面部狀況綜合評估，200 字以內"},
+        "treatments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "priority": {"type": "integer", "minimum": 1},
+                    "name": {"type": "string"},
+                    "area": {"type": "string"},
+                    "method": {"type": "string"},
+                    "expected_effect": {"type": "string"},
+                    "aftercare": {"type": "string"},
+                    "risks": {"type": "string"},
+                },
+                "required": ["priority", "name", "area", "method", "expected_effect", "aftercare", "risks"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["assessment", "treatments"],
+    "additionalProperties": False,
+}
+
+ANALYSIS_PROMPT = (
+    "請對此面部照片進行分析。針對額頭、眼周、鼻子、頰骨、嘴唇、下巴六個區域，"
+    "分別給出皮膚狀況、皺紋、色斑、緊致度、其他特徵（毛孔、黑眼圈等）的 0-5 分評分"
+    "（0 表示嚴重問題，5 表示完美）及一句簡短描述，並附上整體摘要。只輸出符合 JSON schema 的 JSON。"
+)
+
+REPORT_PROMPT = (
+    "你是資深醫美專家，請根據面部分析結果提供精簡的醫美建議：綜合評估，以及至少 5 種按優先級排序的治療方案，"
+    "每項包含適用區域、實施方式（劑量、療程次數）、預期效果（量化）、術後護理與風險提示。"
+    "使用專業術語，只輸出符合下列 JSON schema 的 JSON：\n"
+)
+
+# 各服務商支援的結構化輸出方式
+_JSON_SCHEMA_PROVIDERS = {'xai'}
+_JSON_OBJECT_PROVIDERS = {'deepseek'}
+
+
+def response_format(name: str, schema: Dict[str, Any], provider: str) -> Optional[Dict[str, Any]]:
+    """回傳服務商支援的 response_format 參數；不支援時回傳 None"""
+    if provider in _JSON_SCHEMA_PROVIDERS:
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+    if provider in _JSON_OBJECT_PROVIDERS:
+        # 只保證輸出合法 JSON，schema 需寫在提示詞中
+        return {"type": "json_object"}
+    return None
+
+
+def schema_prompt(prompt: str, schema: Dict[str, Any]) -> str:
+    """將 schema 附加到提示詞（json_object 模式使用）"""
+    return prompt + json.dumps(schema, ensure_ascii=False)
+
+
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+
+def parse_structured(content: Any) -> Optional[Dict[str, Any]]:
+    """解析結構化回應，不是 JSON 物件時回傳 None"""
+    if isinstance(content, dict):
+        return content
+    if not isinstance(content, str):
+        return None
+    text = content.strip()
+    if not text.startswith(('{', '```')):
+        return None
+    try:
+        data = json.loads(_FENCE_RE.sub('', text))
+    except ValueError as e:
+        logger.warning(f"結構化回應解析失敗: {str(e)}")
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def render_analysis(data: Dict[str, Any]) -> str:
+    """將結構化分析轉為精簡的 Markdown 摘要（供介面顯示）"""
+    lines = [data.get('summary', '').strip(), '']
+    for item in data.get('regions', []):
+        scores = '，'.join(f"{name} {score}/5" for name, score in item.get('scores', {}).items())
+        note = item.get('note', '').strip()
+        lines.append(f"- **{item.get('region', '')}**：{scores}" + (f"（{note}）" if note else ''))
+    return '\n'.join(lines).strip()
+
+
+def render_report(data: Dict[str, Any]) -> str:
+    """將結構化報告轉為 Markdown（治療方案格式與 score_extractor 的解析一致）"""
+    lines = ["## 面部狀況綜合評估", data.get('assessment', '').strip(), "", "## 推薦的醫美治療方案"]
+    treatments = sorted(data.get('treatments', []), key=lambda item: item.get('priority', 99))
+    for index, item in enumerate(treatments, 1):
+        lines.append(f"{index}. **{item.get('name', '').strip()}**：{item.get('area', '')}，{item.get('method', '')}")
+        lines.append(f"   - 預期效果：{item.get('expected_effect', '')}")
+        lines.append(f"   - 術後護理：{item.get('aftercare', '')}")
+        lines.append(f"   - 風險提示：{item.get('risks', '')}")
+    return '\n'.join(lines).strip()
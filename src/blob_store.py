@@ -0,0 +1,232 @@
+"""內容定址的圖片儲存：上傳檔以 SHA-256 為名只存一份，分析與報告以參照計數引用，超過容量時回收未引用的檔案
+
+用法（於專案根目錄，將舊的 temp/<檔名> 上傳檔轉入並回收空間；原始檔保留）：
+    python -m src.blob_store --import temp --gc
+    python -m src.blob_store --import /data/old_uploads --delete   # 轉入後刪除原始檔（BLOB_IMPORT_KEEP 的樣本檔除外）
+"""
+import os
+import glob
+import shutil
+import hashlib
+import logging
+import argparse
+import fnmatch
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+from config.settings import (
+    RESPONSES_DB, BLOB_STORE_DIR, BLOB_STORE_QUOTA_MB, BLOB_GC_GRACE, BLOB_GC_INTERVAL, BLOB_IMPORT_KEEP,
+)
+from src.storage import get_response_store
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+CHUNK_SIZE = 1024 * 1024
+
+# 新物件的初始參照數：已記錄的分析中引用此圖片的筆數（重新上傳已回收的圖片時仍正確）
+_UPSERT = ("INSERT INTO blobs (digest, size, refcount) "
+           "VALUES (?, ?, (SELECT COUNT(*) FROM api_responses WHERE image_hash = ?)) "
+           "ON CONFLICT(digest) DO UPDATE SET last_used = strftime('%Y-%m-%d %H:%M:%f', 'now')")
+
+
+class BlobStore:
+    """以內容雜湊定址的檔案儲存；中繼資料（大小、參照數、最後使用時間）存於回應資料庫的 blobs 表"""
+
+    def __init__(self, root: str = BLOB_STORE_DIR, db_path: str = RESPONSES_DB,
+                 quota_bytes: int = BLOB_STORE_QUOTA_MB * 1024 * 1024, grace: float = BLOB_GC_GRACE):
+        self.root = root
+        self.store = get_response_store(db_path)
+        self.quota_bytes = quota_bytes
+        self.grace = grace
+        self._tmp = os.path.join(root, "tmp")
+        os.makedirs(self._tmp, exist_ok=True)
+        self._gc_thread: Optional[threading.Thread] = None
+        self._stop_gc = threading.Event()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def _commit(self, digest: str, size: int, stage) -> bool:
+        """登記物件；檔案不存在時呼叫 stage(暫存路徑) 產生內容後原子地移入。回傳是否寫入新檔案"""
+        path = self.path(digest)
+        # BEGIN IMMEDIATE 與回收互斥：檢查存在與登記之間檔案不會被刪除
+        with self.store.transaction() as conn:
+            written = not os.path.exists(path)
+            if written:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self._tmp)
+                os.close(fd)
+                try:
+                    stage(tmp_path)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            conn.execute(_UPSERT, (digest, size, digest))
+        return written
+
+    def put(self, data: bytes) -> str:
+        """儲存內容並回傳其 SHA-256；已存在時只更新使用時間，不重複寫入"""
+        digest = hashlib.sha256(data).hexdigest()
+
+        def stage(tmp_path: str) -> None:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+        if self._commit(digest, len(data), stage):
+            logger.info(f"儲存圖片 {digest[:12]} ({len(data) / 1024:.1f} KB)")
+        return digest
+
+    def put_file(self, source: str) -> str:
+        """以硬連結將既有檔案轉入（不同檔案系統時改為複製），回傳其 SHA-256"""
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        def stage(tmp_path: str) -> None:
+            os.remove(tmp_path)
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+
+        self._commit(digest, os.path.getsize(source), stage)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self.path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def incref(self, digest: str, count: int = 1) -> None:
+        with self.store.transaction() as conn:
+            conn.execute("UPDATE blobs SET refcount = refcount + ?, "
+                         "last_used = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE digest = ?", (count, digest))
+
+    def decref(self, digest: str, count: int = 1) -> None:
+        self.incref(digest, -count)
+
+    @contextmanager
+    def hold(self, digest: str) -> Iterator[Optional[bytes]]:
+        """在區塊內持有參照（例如報告生成期間），回傳內容"""
+        self.incref(digest)
+        try:
+            yield self.get(digest)
+        finally:
+            self.decref(digest)
+
+    def usage(self) -> Dict[str, int]:
+        with self.store.connection() as conn:
+            count, size, referenced = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount > 0), 0) FROM blobs").fetchone()
+        return {"blobs": count, "bytes": size, "referenced": referenced, "quota_bytes": self.quota_bytes}
+
+    def gc(self, quota_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """總大小超過容量時，依最後使用時間刪除未被引用（且超過寬限期）的檔案，回傳 (刪除數, 釋放位元組)"""
+        quota = self.quota_bytes if quota_bytes is None else quota_bytes
+        removed = freed = 0
+        with self.store.transaction() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= quota:
+                return 0, 0
+            candidates = conn.execute(
+                "SELECT digest, size FROM blobs "
+                "WHERE refcount <= 0 AND last_used < strftime('%Y-%m-%d %H:%M:%f', 'now', ?) "
+                "ORDER BY last_used", (f"-{int(self.grace)} seconds",)).fetchall()
+            for digest, size in candidates:
+                if total <= quota:
+                    break
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                # 在交易內刪除檔案，與 put 的存在檢查互斥
+                try:
+                    os.remove(self.path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+                freed += size
+        if removed:
+            logger.info(f"圖片回收: 刪除 {removed} 個, 釋放 {freed / 1024 / 1024:.1f} MB")
+        if total > quota:
+            logger.warning(f"圖片儲存仍超過容量: {total / 1024 / 1024:.1f} MB（其餘皆被引用或在寬限期內）")
+        return removed, freed
+
+    def start_gc(self, interval: float = BLOB_GC_INTERVAL) -> None:
+        """啟動背景回收執行緒（每 interval 秒執行一次 gc）"""
+        if self._gc_thread is not None or interval <= 0:
+            return
+
+        def run():
+            while not self._stop_gc.wait(interval):
+                try:
+                    self.gc()
+                except Exception as e:
+                    logger.error(f"圖片回收失敗: {str(e)}")
+
+        self._gc_thread = threading.Thread(target=run, name="blob-store-gc", daemon=True)
+        self._gc_thread.start()
+
+    def close(self) -> None:
+        self._stop_gc.set()
+
+
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(root: str = BLOB_STORE_DIR) -> BlobStore:
+    """取得（並快取）指定目錄的圖片儲存，並啟動背景回收"""
+    store = _stores.get(root)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(root)
+            if store is None:
+                store = _stores[root] = BlobStore(root)
+                store.start_gc()
+    return store
+
+
+def import_uploads(source: str, blobs: BlobStore, delete: bool = False,
+                   keep: Sequence[str] = BLOB_IMPORT_KEEP) -> Tuple[int, int]:
+    """將 source 目錄下的舊上傳圖片轉入，回傳 (檔案數, 不重複的圖片數)；delete 不會刪除檔名符合 keep 的樣本檔"""
+    paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(source, pattern)))
+    digests = set()
+    for path in paths:
+        digests.add(blobs.put_file(path))
+        if delete:
+            if any(fnmatch.fnmatch(os.path.basename(path), pattern) for pattern in keep):
+                logger.warning(f"保留樣本檔案: {path}")
+            else:
+                os.remove(path)
+    return len(paths), len(digests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=BLOB_STORE_DIR, help="圖片儲存目錄")
+    parser.add_argument("--db", default=RESPONSES_DB, help="回應資料庫路徑")
+    parser.add_argument("--import", dest="source", help="轉入此目錄下的舊上傳圖片")
+    parser.add_argument("--delete", action="store_true", help="轉入後刪除原始檔案（BLOB_IMPORT_KEEP 的樣本檔除外）")
+    parser.add_argument("--gc", action="store_true", help="執行一次容量回收")
+    args = parser.parse_args()
+
+    blobs = BlobStore(args.root, args.db)
+    if args.source:
+        files, unique = import_uploads(args.source, blobs, delete=args.delete)
+        print(f"imported {files} files as {unique} blobs")
+    if args.gc:
+        removed, freed = blobs.gc()
+        print(f"gc removed {removed} blobs, freed {freed / 1024 / 1024:.1f} MB")
+    usage = blobs.usage()
+    print(f"{usage['blobs']} blobs ({usage['referenced']} referenced), "
+          f"{usage['bytes'] / 1024 / 1024:.1f} / {usage['quota_bytes'] / 1024 / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""批次重新生成歷史報告 PDF：讀取已儲存的分析回應（資料庫、分段記錄與舊 JSON 檔），以多行程工作池輸出到磁碟，不呼叫任何 AI 服務
+
+用法（於專案根目錄）：
+    python -m src.bulk_renderer --out reports_out --layout premium --workers 4
+"""
+import os
+import glob
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from config.settings import RESPONSES_DB, RESPONSE_LOG_DIR
+from src.analysis_schema import parse_structured, render_analysis, render_report
+from src.report_engine import ReportData, LAYOUTS, render_pdf, warm_up
+from src.storage import get_response_store
+from src.segment_log import SegmentLog
+from utils.helpers import response_content
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = RESPONSES_DB
+DEFAULT_JSON_DIR = "temp"
+# Grok 回應為面部分析，DeepSeek 回應為依分析生成的報告；同一張照片的兩者合併為一份 PDF
+ANALYSIS_TYPE = "grok"
+REPORT_TYPE = "deepseek"
+DEFAULT_TYPES = (ANALYSIS_TYPE, REPORT_TYPE)
+
+# 每個工作行程使用的報告版面（由 _init_worker 設定並預熱）
+_layout = "premium"
+
+
+class Record(NamedTuple):
+    """一筆已儲存的回應"""
+    source: str
+    response_type: str
+    key: str
+    image_hash: Optional[str]
+    content: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.source}-{self.response_type}-{self.key}"
+
+
+class Task(NamedTuple):
+    """一份報告的輸入：分析與報告至少一項"""
+    name: str
+    analysis: Optional[str]
+    report: Optional[str]
+
+
+def iter_db_records(db_path: str, types) -> Iterator[Record]:
+    """逐批讀取 responses.db 中的回應（依 ID 順序）"""
+    if not os.path.exists(db_path):
+        logger.warning(f"資料庫不存在: {db_path}")
+        return
+    for row_id, response_type, response_data, image_hash in get_response_store(db_path).iter_responses(types):
+        try:
+            content = response_content(json.loads(response_data))
+        except ValueError as e:
+            logger.warning(f"無法解析記錄 {row_id}: {str(e)}")
+            continue
+        if content:
+            yield Record("db", response_type, str(row_id), image_hash, content)
+
+
+def iter_json_records(json_dir: str, types) -> Iterator[Record]:
+    """讀取 temp/<type>/*.json 中的回應（舊格式沒有圖片雜湊，各自生成報告）"""
+    for response_type in types:
+        for path in sorted(glob.glob(os.path.join(json_dir, response_type, "*.json"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    content = response_content(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"無法讀取 {path}: {str(e)}")
+                continue
+            if content:
+                name = os.path.splitext(os.path.basename(path))[0]
+                yield Record("json", response_type, name, None, content)
+
+
+def iter_log_records(log_dir: str, types) -> Iterator[Record]:
+    """讀取分段 JSONL 回應記錄（依寫入順序）"""
+    if not os.path.isdir(log_dir):
+        return
+    for (segment, number), record in SegmentLog(log_dir).iter_records(types):
+        content = response_content(record.get("data"))
+        if content:
+            yield Record("log", record["type"], f"{segment:06d}-{number}", record.get("image_hash"), content)
+
+
+def pair_records(records: Iterable[Record]) -> Iterator[Task]:
+    """依圖片雜湊將分析與其後的報告配對為一份報告輸入
+
+    同一張照片重新分析時以最新的分析配對；沒有圖片雜湊、其他類型或找不到配對的記錄單獨生成。
+    """
+    pending: Dict[Tuple[str, str], Record] = {}
+
+    def alone(record: Record) -> Task:
+        if record.response_type == REPORT_TYPE:
+            return Task(record.name, None, record.content)
+        return Task(record.name, record.content, None)
+
+    for record in records:
+        if not record.image_hash or record.response_type not in DEFAULT_TYPES:
+            yield alone(record)
+            continue
+        key = (record.source, record.image_hash)
+        if record.response_type == ANALYSIS_TYPE:
+            previous = pending.pop(key, None)
+            if previous is not None:
+                yield alone(previous)
+            pending[key] = record
+        else:
+            analysis = pending.pop(key, None)
+            if analysis is None:
+                yield alone(record)
+            else:
+                yield Task(f"{record.source}-report-{analysis.key}-{record.key}", analysis.content, record.content)
+    for record in pending.values():
+        yield alone(record)
+
+
+def _report_text(content: str) -> str:
+    data = parse_structured(content)
+    if data and "treatments" in data:
+        return render_report(data)
+    if data:
+        return render_analysis(data)
+    return content
+
+
+def report_data(analysis: Optional[str], report: Optional[str] = None) -> ReportData:
+    """由分析與報告建立報告輸入（歷史記錄沒有照片，因此不含熱力圖）；評分由分析解析，缺少分析時由報告解析"""
+    if report is None:
+        return ReportData(_report_text(analysis), analysis_text=analysis)
+    return ReportData(_report_text(report), analysis_text=analysis or report)
+
+
+def _init_worker(layout: str) -> None:
+    """工作行程初始化：預先註冊字型、建立報告模板"""
+    global _layout
+    logging.basicConfig(level=logging.WARNING)
+    warm_up()
+    _layout = layout
+
+
+def render_task(task: Task, out_dir: str) -> Tuple[str, int]:
+    """在工作行程中生成一份 PDF 並直接寫入磁碟，回傳 (記錄名稱, 檔案大小)"""
+    try:
+        pdf_bytes = render_pdf(_layout, report_data(task.analysis, task.report))
+        if not pdf_bytes:
+            return task.name, 0
+        with open(os.path.join(out_dir, f"{task.name}.pdf"), "wb") as f:
+            f.write(pdf_bytes)
+        return task.name, len(pdf_bytes)
+    except Exception as e:
+        logger.error(f"生成 {task.name} 失敗: {str(e)}")
+        return task.name, 0
+
+
+def render_batch(tasks: List[Task], out_dir: str) -> List[Tuple[str, int]]:
+    return [render_task(task, out_dir) for task in tasks]
+
+
+def _batches(tasks: Iterable[Task], size: int) -> Iterator[List[Task]]:
+    batch: List[Task] = []
+    for task in tasks:
+        batch.append(task)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_all(out_dir: str, db_path: str = DEFAULT_DB, json_dir: str = DEFAULT_JSON_DIR,
+               types=DEFAULT_TYPES, layout: str = "premium", workers: Optional[int] = None,
+               limit: Optional[int] = None, chunksize: int = 8, log_dir: str = RESPONSE_LOG_DIR) -> Dict[str, Any]:
+    """批次生成所有已儲存回應的報告，回傳統計資料"""
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    def tasks() -> Iterator[Task]:
+        count = 0
+        for source in (iter_db_records(db_path, types), iter_log_records(log_dir, types),
+                       iter_json_records(json_dir, types)):
+            for task in pair_records(source):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield task
+
+    rendered = failed = total_bytes = 0
+    start = time.perf_counter()
+
+    def collect(futures) -> None:
+        nonlocal rendered, failed, total_bytes
+        for future in futures:
+            for name, size in future.result():
+                if size:
+                    rendered += 1
+                    total_bytes += size
+                else:
+                    failed += 1
+                done = rendered + failed
+                if done % 100 == 0:
+                    print(f"{done} reports, {done / (time.perf_counter() - start):.1f} reports/sec", flush=True)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(layout,)) as executor:
+        # 逐批提交，最多 2 × workers 批在途，記錄與 PDF 內容不會一次全部讀入記憶體
+        in_flight = set()
+        for batch in _batches(tasks(), chunksize):
+            if len(in_flight) >= 2 * workers:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight.add(executor.submit(render_batch, batch, out_dir))
+        collect(wait(in_flight).done)
+    elapsed = time.perf_counter() - start
+    return {
+        "rendered": rendered,
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "reports_per_sec": round((rendered + failed) / elapsed, 1) if elapsed else 0.0,
+        "total_kb": round(total_bytes / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default="reports_out", help="PDF 輸出目錄")
+    parser.add_argument("--db", default=DEFAULT_DB, help="回應資料庫路徑")
+    parser.add_argument("--log-dir", default=RESPONSE_LOG_DIR, help="分段 JSONL 回應記錄目錄")
+    parser.add_argument("--json-dir", default=DEFAULT_JSON_DIR, help="尚未轉換的舊 JSON 回應目錄（temp/<type>/*.json）")
+    parser.add_argument("--types", nargs="+", default=list(DEFAULT_TYPES), help="要重新生成的回應類型")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="premium")
+    parser.add_argument("--workers", type=int, default=None, help="工作行程數（預設為 CPU 核心數）")
+    parser.add_argument("--limit", type=int, default=None, help="最多生成的報告數")
+    parser.add_argument("--chunksize", type=int, default=8, help="每批提交給工作行程的報告數")
+    args = parser.parse_args()
+
+    stats = render_all(args.out, args.db, args.json_dir, args.types, args.layout, args.workers, args.limit,
+                       args.chunksize, args.log_dir)
+    print(f"rendered {stats['rendered']} reports ({stats['failed']} failed) in {stats['seconds']} s: "
+          f"{stats['reports_per_sec']} reports/sec, {stats['total_kb']} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from config.settings import REPORT_FONT_PATH, REPORT_FONT_SEARCH_PATH, REPORT_FONT_FILES
+
+logger = logging.getLogger(__name__)
+
+# reportlab 中註冊的字型名稱
+REPORT_FONT_NAME = 'ReportCJK'
+# 找不到 TTF/TTC 時使用 reportlab 內建的 CID 字型（由閱讀器提供字形，不需嵌入）
+FALLBACK_CID_FONT = 'STSong-Light'
+
+SUBSET_CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_font_name: Optional[str] = None
+_font_file: Optional[Tuple[str, int]] = None
+
+
+def resolve_font_file() -> Optional[Tuple[str, int]]:
+    """依設定的搜尋路徑尋找中文字型檔，回傳 (路徑, TTC 子字型索引)"""
+    candidates = [REPORT_FONT_PATH]
+    for directory in REPORT_FONT_SEARCH_PATH:
+        candidates.extend(os.path.join(directory, name) for name in REPORT_FONT_FILES)
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path, 0
+    return None
+
+
+def _cache_subsets(face, max_size: int = SUBSET_CACHE_SIZE) -> None:
+    """快取字型子集，同一組字形在不同報告之間不需重新生成"""
+    make_subset = face.makeSubset
+    cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+    cache_lock = threading.Lock()
+
+    def cached_make_subset(subset):
+        key = tuple(subset)
+        with cache_lock:
+            data = cache.get(key)
+            if data is not None:
+                cache.move_to_end(key)
+                return data
+        data = make_subset(subset)
+        with cache_lock:
+            cache[key] = data
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+        return data
+
+    face.makeSubset = cached_make_subset
+
+
+def get_report_font() -> str:
+    """取得報告用中文字型名稱；整個行程只解析並註冊一次"""
+    global _font_name, _font_file
+    if _font_name is not None:
+        return _font_name
+    with _lock:
+        if _font_name is not None:
+            return _font_name
+
+        font_file = resolve_font_file()
+        if font_file:
+            path, subfont_index = font_file
+            try:
+                font = TTFont(REPORT_FONT_NAME, path, subfontIndex=subfont_index)
+                _cache_subsets(font.face)
+                pdfmetrics.registerFont(font)
+                _font_file = font_file
+                _font_name = REPORT_FONT_NAME
+                logger.info(f"成功註冊報告字型: {path}")
+                return _font_name
+            except Exception as e:
+                logger.warning(f"載入字型 {path} 失敗: {str(e)}")
+
+        try:
+            pdfmetrics.registerFont(UnicodeCIDFont(FALLBACK_CID_FONT))
+            _font_name = FALLBACK_CID_FONT
+            logger.warning(f"未找到中文字型檔，使用內建 CID 字型 {FALLBACK_CID_FONT}")
+        except Exception as e:
+            logger.error(f"註冊 CID 字型失敗: {str(e)}，使用 Helvetica")
+            _font_name = 'Helvetica'
+        return _font_name
+
+
+def get_report_font_file() -> Optional[Tuple[str, int]]:
+    """已註冊的字型檔 (路徑, 子字型索引)；使用 CID／內建字型時為 None"""
+    get_report_font()
+    return _font_file
+
+
+def apply_report_font(styles) -> str:
+    """將樣式表中所有樣式改用報告字型"""
+    font_name = get_report_font()
+    for style in styles.byName.values():
+        style.fontName = font_name
+    return font_name
@@ -0,0 +1,114 @@
+"""分析歷史查詢：依日期、類型、模型、客戶、圖片雜湊與評分篩選已儲存的回應，以鍵集分頁逐頁讀取
+
+查詢只讀取涵蓋索引中的中繼資料欄位（見 storage 遷移 5），不解壓 payload；
+分頁以上一頁最後一筆的 (created_at, id) 為游標，每頁成本與所在頁數無關。
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import RESPONSES_DB, HISTORY_PAGE_SIZE
+from src.storage import METADATA_COLUMNS, get_response_store
+from src.score_extractor import extract_scores
+from utils.helpers import response_content
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class HistoryFilter:
+    """歷史查詢條件；未設定的條件不套用（since 含、until 不含）"""
+    since: Optional[str] = None
+    until: Optional[str] = None
+    response_type: Optional[str] = None
+    model: Optional[str] = None
+    image_hash: Optional[str] = None
+    client_id: Optional[str] = None
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+
+    def clauses(self) -> Tuple[List[str], List[Any]]:
+        clauses, params = [], []
+        for column, op, value in (("created_at", ">=", self.since), ("created_at", "<", self.until),
+                                  ("response_type", "=", self.response_type), ("model", "=", self.model),
+                                  ("image_hash", "=", self.image_hash), ("client_id", "=", self.client_id),
+                                  ("score", ">=", self.min_score), ("score", "<=", self.max_score)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return clauses, params
+
+
+@dataclass(frozen=True)
+class HistoryPage:
+    items: List[Dict[str, Any]]
+    # 下一頁的游標；None 表示已是最後一頁
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(created_at: str, response_id: int) -> str:
+    return f"{created_at},{response_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    created_at, _, response_id = cursor.rpartition(",")
+    if not created_at or not response_id.isdigit():
+        raise ValueError(f"Invalid history cursor: {cursor}")
+    return created_at, int(response_id)
+
+
+def query_history(filters: HistoryFilter = HistoryFilter(), cursor: Optional[str] = None,
+                  limit: int = HISTORY_PAGE_SIZE, db_path: str = RESPONSES_DB) -> HistoryPage:
+    """依時間由新到舊查詢一頁回應中繼資料"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    clauses, params = filters.clauses()
+    if cursor:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    query = f"SELECT {METADATA_COLUMNS} FROM api_responses"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    # 多取一筆以判斷是否還有下一頁
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with get_response_store(db_path).connection() as conn:
+        cursor_obj = conn.execute(query, params)
+        names = [column[0] for column in cursor_obj.description]
+        items = [dict(zip(names, row)) for row in cursor_obj.fetchall()]
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]["created_at"], items[-1]["id"])
+    return HistoryPage(items, next_cursor)
+
+
+def history_models(db_path: str = RESPONSES_DB) -> List[str]:
+    """已記錄的模型名稱；以遞迴查詢在模型索引上逐一跳躍，不掃描整個索引"""
+    query = """
+        WITH RECURSIVE models(model) AS (
+            SELECT MIN(model) FROM api_responses
+            UNION ALL
+            SELECT (SELECT MIN(model) FROM api_responses WHERE model > models.model)
+            FROM models WHERE models.model IS NOT NULL
+        )
+        SELECT model FROM models WHERE model IS NOT NULL
+    """
+    with get_response_store(db_path).connection() as conn:
+        return [row[0] for row in conn.execute(query)]
+
+
+def history_detail(response_id: int, db_path: str = RESPONSES_DB) -> Optional[Dict[str, Any]]:
+    """讀取單筆回應的完整內容與結構化評分"""
+    data = get_response_store(db_path).get_response(response_id)
+    if data is None:
+        return None
+    content = response_content(data)
+    return {
+        "id": response_id,
+        "content": content,
+        "scores": extract_scores(content).to_dict() if content else None,
+        "response": data,
+    }
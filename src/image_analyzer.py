@@ -5,15 +5,70 @@ import logging
 import numpy as np
 import uuid
 import time
-from typing import Dict, Any, List, Tuple
+import threading
+from typing import Dict, Any, List, Tuple, Callable, Optional
 from PIL import Image as PILImage, ImageFile
-import cv2
-import replicate
-from openai import OpenAI
-import dlib
-import time
-import streamlit as st
-import requests
+from config.settings import STRUCTURED_OUTPUT, XAI_BASE_URL
+from src.analysis_schema import ANALYSIS_SCHEMA, ANALYSIS_PROMPT, response_format, parse_structured, render_analysis
+from utils.helpers import lazy_import
+
+# 人臉偵測與供應商 SDK 在建立 ImageAnalyzer 時才匯入
+cv2 = lazy_import("cv2")
+dlib = lazy_import("dlib")
+openai = lazy_import("openai")
+replicate = lazy_import("replicate")
+requests = lazy_import("requests")
+
+
+# dlib 偵測器不是執行緒安全的：Streamlit 會話、HTTP 服務與預覽都在不同執行緒偵測，每個執行緒各用一個
+_detectors = threading.local()
+
+
+def get_face_detector():
+    """目前執行緒的 dlib 正面人臉偵測器（建立成本高，同一執行緒內重複使用）"""
+    detector = getattr(_detectors, "detector", None)
+    if detector is None:
+        detector = _detectors.detector = dlib.get_frontal_face_detector()
+    return detector
+
+
+def compress_image(image: PILImage.Image) -> io.BytesIO:
+    """
+    Downscale and JPEG-compress a loaded image before sending it to the model APIs.
+    """
+    # Resize and compress the image to reduce size
+    max_size = (800, 800)  # Reduced maximum dimensions
+    image.thumbnail(max_size, PILImage.LANCZOS)
+    
+    # Convert to RGB if it's not already (handles RGBA, etc.)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Save to a BytesIO object with reduced quality
+    compressed_image = io.BytesIO()
+    image.save(compressed_image, format='JPEG', quality=70)  # Lower quality for smaller size
+    compressed_image.seek(0)
+    
+    # Get the size of the compressed image in bytes
+    compressed_size = len(compressed_image.getvalue())
+    logger.info(f"Compressed image size: {compressed_size / 1024:.2f} KB")
+    
+    # If still too large, compress further
+    if compressed_size > 1000000:  # 1MB
+        logger.warning("Image still too large, compressing further")
+        compressed_image.seek(0)
+        image = PILImage.open(compressed_image)
+        image.thumbnail((600, 600), PILImage.LANCZOS)  # Even smaller dimensions
+        
+        # Create a new BytesIO object with even lower quality
+        compressed_image = io.BytesIO()
+        image.save(compressed_image, format='JPEG', quality=50)
+        compressed_image.seek(0)
+        
+        logger.info(f"Further compressed image size: {len(compressed_image.getvalue()) / 1024:.2f} KB")
+    
+    return compressed_image
+
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,12 +86,12 @@ class ImageAnalyzer:
         if self.xai_api_key:
             if self.xai_api_key.startswith("sk-proj-"):
                 # 新的 OpenAI API 金鑰格式
-                self.xai_client = OpenAI(api_key=self.xai_api_key)
+                self.xai_client = openai.OpenAI(api_key=self.xai_api_key)
                 self.xai_base_url = "https://api.openai.com/v1"
                 logger.info("Initialized OpenAI client with project API key")
             elif self.xai_api_key.startswith("xai-"):
                 # X AI 的 API 金鑰格式
-                self.xai_base_url = "https://api.x.ai/v1"
+                self.xai_base_url = XAI_BASE_URL
                 logger.info("Initialized X AI client")
             else:
                 logger.warning("Unknown API key format")
@@ -48,31 +103,21 @@ class ImageAnalyzer:
         self.replicate_api_token = os.environ.get("REPLICATE_API_TOKEN")
         if not self.replicate_api_token:
             logger.warning("REPLICATE_API_TOKEN not found in environment variables")
-        os.environ["REPLICATE_API_TOKEN"] = self.replicate_api_token
+        else:
+            os.environ["REPLICATE_API_TOKEN"] = self.replicate_api_token
         
-        self.face_detector = dlib.get_frontal_face_detector()
+        # 預先載入 dlib；偵測器依執行緒建立，偵測時才取得
+        get_face_detector()
 
-    def analyze_image(self, image_file: io.BytesIO, model: str = "DeepSeek VL2") -> Dict[str, Any]:
+    def analyze_image(self, image_file: io.BytesIO, model: str = "DeepSeek VL2",
+                      progress: Optional[Callable[[int, str], None]] = None) -> Dict[str, Any]:
+        """
+        Analyze a face photo. Progress is reported through the optional progress(percent, message)
+        callback (the UI passes one that drives its widgets), so the analyzer itself has no UI dependency.
+        """
         try:
-            # Create progress placeholders if Streamlit is running
-            progress_placeholder = None
-            progress_bar = None
-            status_text = None
-            
-            try:
-                # Check if we're in a Streamlit context
-                if st._is_running:
-                    progress_placeholder = st.empty()
-                    progress_bar = progress_placeholder.progress(0)
-                    status_text = st.empty()
-                    status_text.text("Initializing image analysis...")
-            except:
-                # Not in Streamlit context or error occurred
-                logger.info("Not in Streamlit context or error initializing progress indicators")
-                pass
-            
             # Update progress - 10%
-            self._update_progress(progress_bar, status_text, 10, "Loading and processing image...")
+            self._update_progress(progress, 10, "Loading and processing image...")
             
             # Set to handle truncated images
             ImageFile.LOAD_TRUNCATED_IMAGES = True
@@ -84,42 +129,14 @@ class ImageAnalyzer:
             image = PILImage.open(image_file)
             image.load()
             
-            # Resize and compress the image to reduce size
-            max_size = (800, 800)  # Reduced maximum dimensions
-            image.thumbnail(max_size, PILImage.LANCZOS)
-            
             # Update progress - 20%
-            self._update_progress(progress_bar, status_text, 20, "Optimizing image...")
+            self._update_progress(progress, 20, "Optimizing image...")
             
-            # Convert to RGB if it's not already (handles RGBA, etc.)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Save to a BytesIO object with reduced quality
-            compressed_image = io.BytesIO()
-            image.save(compressed_image, format='JPEG', quality=70)  # Lower quality for smaller size
-            compressed_image.seek(0)
-            
-            # Get the size of the compressed image in bytes
-            compressed_size = len(compressed_image.getvalue())
-            logger.info(f"Compressed image size: {compressed_size / 1024:.2f} KB")
-            
-            # If still too large, compress further
-            if compressed_size > 1000000:  # 1MB
-                logger.warning("Image still too large, compressing further")
-                compressed_image.seek(0)
-                image = PILImage.open(compressed_image)
-                image.thumbnail((600, 600), PILImage.LANCZOS)  # Even smaller dimensions
-                
-                # Create a new BytesIO object with even lower quality
-                compressed_image = io.BytesIO()
-                image.save(compressed_image, format='JPEG', quality=50)
-                compressed_image.seek(0)
-                
-                logger.info(f"Further compressed image size: {len(compressed_image.getvalue()) / 1024:.2f} KB")
+            # Resize and compress the image to reduce size
+            compressed_image = compress_image(image)
             
             # Update progress - 30%
-            self._update_progress(progress_bar, status_text, 30, "Detecting facial features...")
+            self._update_progress(progress, 30, "Detecting facial features...")
             
             # Get face regions from the original image for better detection
             image_file.seek(0)
@@ -129,7 +146,7 @@ class ImageAnalyzer:
             # Get analysis based on model
             if model == "DeepSeek VL2":
                 # Update progress - 40%
-                self._update_progress(progress_bar, status_text, 40, "Preparing for DeepSeek VL2 analysis...")
+                self._update_progress(progress, 40, "Preparing for DeepSeek VL2 analysis...")
                 
                 # Save compressed image to a temporary file with unique name
                 compressed_image.seek(0)
@@ -138,36 +155,36 @@ class ImageAnalyzer:
                     f.write(compressed_image.getvalue())
                 
                 # Update progress - 50%
-                self._update_progress(progress_bar, status_text, 50, "Sending image to DeepSeek VL2...")
+                self._update_progress(progress, 50, "Sending image to DeepSeek VL2...")
                 
                 # Use Replicate API for DeepSeek VL2
-                analysis_result = self._get_deepseek_analysis(temp_image_path, progress_bar, status_text)
+                analysis_result = self._get_deepseek_analysis(temp_image_path, progress)
                 
                 # Update progress - 90%
-                self._update_progress(progress_bar, status_text, 90, "Analysis complete, cleaning up...")
+                self._update_progress(progress, 90, "Analysis complete, cleaning up...")
                 
                 # Remove temporary file with retry mechanism
                 self._safely_remove_file(temp_image_path)
                 
             elif model == "grok-2-vision-1212":
                 # Update progress - 40%
-                self._update_progress(progress_bar, status_text, 40, "Preparing for grok-2-vision-1212 analysis...")
+                self._update_progress(progress, 40, "Preparing for grok-2-vision-1212 analysis...")
                 
                 # Use X AI API directly
                 compressed_image.seek(0)
                 image_base64 = base64.b64encode(compressed_image.read()).decode('utf-8')
                 
                 # Update progress - 50%
-                self._update_progress(progress_bar, status_text, 50, "Sending image to grok-2-vision-1212 model...")
+                self._update_progress(progress, 50, "Sending image to grok-2-vision-1212 model...")
                 
-                analysis_result = self._get_xai_analysis(image_base64, progress_bar, status_text)
+                analysis_result = self._get_xai_analysis(image_base64, progress)
             
             elif model == "GPT-4o":
                 # Redirect to DeepSeek VL2 since GPT-4o is not supported
                 logger.info("GPT-4o model selected but not supported, using DeepSeek VL2 instead")
                 
                 # Update progress - 40%
-                self._update_progress(progress_bar, status_text, 40, "Preparing for DeepSeek VL2 analysis (fallback)...")
+                self._update_progress(progress, 40, "Preparing for DeepSeek VL2 analysis (fallback)...")
                 
                 # Save compressed image to a temporary file with unique name
                 compressed_image.seek(0)
@@ -176,13 +193,13 @@ class ImageAnalyzer:
                     f.write(compressed_image.getvalue())
                 
                 # Update progress - 50%
-                self._update_progress(progress_bar, status_text, 50, "Sending image to DeepSeek VL2...")
+                self._update_progress(progress, 50, "Sending image to DeepSeek VL2...")
                 
                 # Use Replicate API for DeepSeek VL2
-                analysis_result = self._get_deepseek_analysis(temp_image_path, progress_bar, status_text)
+                analysis_result = self._get_deepseek_analysis(temp_image_path, progress)
                 
                 # Update progress - 90%
-                self._update_progress(progress_bar, status_text, 90, "Analysis complete, cleaning up...")
+                self._update_progress(progress, 90, "Analysis complete, cleaning up...")
                 
                 # Remove temporary file with retry mechanism
                 self._safely_remove_file(temp_image_path)
@@ -191,7 +208,7 @@ class ImageAnalyzer:
                 return {"error": f"不支持的模型: {model}"}
             
             # Update progress - 95%
-            self._update_progress(progress_bar, status_text, 95, "Processing results...")
+            self._update_progress(progress, 95, "Processing results...")
             
             # Check if analysis_result contains an error
             if isinstance(analysis_result, dict) and "error" in analysis_result:
@@ -199,21 +216,16 @@ class ImageAnalyzer:
             
             # If analysis_result is a string, wrap it in a dictionary
             if isinstance(analysis_result, str):
+                structured = parse_structured(analysis_result) if STRUCTURED_OUTPUT else None
                 analysis_result = {
                     "model": model,
-                    "result": analysis_result
+                    "result": render_analysis(structured) if structured else analysis_result
                 }
+                if structured:
+                    analysis_result["structured"] = structured
             
             # Update progress - 100%
-            self._update_progress(progress_bar, status_text, 100, "Analysis complete!")
-            
-            # Clear progress indicators
-            if progress_placeholder:
-                try:
-                    progress_placeholder.empty()
-                    status_text.empty()
-                except:
-                    pass
+            self._update_progress(progress, 100, "Analysis complete!")
             
             return {'face_regions': face_regions, 'analysis': analysis_result}
             
@@ -224,15 +236,13 @@ class ImageAnalyzer:
             logger.error(f"Unexpected error during image analysis: {str(e)}")
             return {"error": f"Analysis failed: {str(e)}"}
 
-    def _update_progress(self, progress_bar, status_text, progress_value, message):
+    def _update_progress(self, progress, progress_value, message):
         """
-        Update progress indicators if they exist
+        Report progress to the callback if one was given
         """
         try:
-            if progress_bar:
-                progress_bar.progress(progress_value)
-            if status_text:
-                status_text.text(message)
+            if progress:
+                progress(progress_value, message)
             # Log progress regardless of UI
             logger.info(f"Progress {progress_value}%: {message}")
         except:
@@ -265,7 +275,7 @@ class ImageAnalyzer:
     def detect_face_regions(self, image):
         try:
             gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            faces = self.face_detector(gray)
+            faces = get_face_detector()(gray)
             
             if not faces:
                 return None
@@ -283,7 +293,7 @@ class ImageAnalyzer:
             logger.error(f"Error detecting face regions: {str(e)}")
             return None
 
-    def _get_deepseek_analysis(self, image_path: str, progress_bar=None, status_text=None) -> Dict[str, Any]:
+    def _get_deepseek_analysis(self, image_path: str, progress=None) -> Dict[str, Any]:
         """
         Send image to DeepSeek VL2 using Replicate API and get analysis.
         """
@@ -309,7 +319,7 @@ class ImageAnalyzer:
             progress_steps = ["⣾", "⣽", "⣻", "⢿", "⡿", "⣟", "⣯", "⣷"]
             
             # Update UI progress
-            self._update_progress(progress_bar, status_text, 60, "Waiting for DeepSeek analysis...")
+            self._update_progress(progress, 60, "Waiting for DeepSeek analysis...")
             
             # Show animation in console logs
             for i in range(3):  # Show animation for a few cycles
@@ -318,7 +328,7 @@ class ImageAnalyzer:
                     time.sleep(0.1)
             
             # Update progress before API call
-            self._update_progress(progress_bar, status_text, 70, "Processing with DeepSeek VL2...")
+            self._update_progress(progress, 70, "Processing with DeepSeek VL2...")
             
             # Run the model using Replicate API
             output = replicate.run(
@@ -327,7 +337,7 @@ class ImageAnalyzer:
             )
             
             # Update progress after API call
-            self._update_progress(progress_bar, status_text, 85, "Received results from DeepSeek VL2...")
+            self._update_progress(progress, 85, "Received results from DeepSeek VL2...")
             
             logger.info("Successfully received DeepSeek VL2 response via Replicate")
             return output
@@ -338,7 +348,7 @@ class ImageAnalyzer:
             
             return {"error": error_msg}
 
-    def _get_xai_analysis(self, image_base64: str, progress_bar=None, status_text=None) -> Dict[str, Any]:
+    def _get_xai_analysis(self, image_base64: str, progress=None) -> Dict[str, Any]:
         """
         Send image to XAI API and get analysis.
         """
@@ -374,6 +384,11 @@ class ImageAnalyzer:
                 "max_tokens": 1000
             }
             
+            # X AI 支援 JSON schema 結構化輸出
+            if STRUCTURED_OUTPUT and not self.xai_api_key.startswith("sk-proj-"):
+                data["messages"][0]["content"][0]["text"] = ANALYSIS_PROMPT
+                data["response_format"] = response_format("face_analysis", ANALYSIS_SCHEMA, "xai")
+            
             # 根據 API 金鑰格式選擇不同的處理方式
             if self.xai_api_key.startswith("sk-proj-"):
                 try:
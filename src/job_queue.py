@@ -0,0 +1,185 @@
+"""持久化的任務佇列：分析與報告任務存於回應資料庫的 jobs 表，由獨立的工作行程領取執行
+
+工作行程以租約領取任務並定期續約；行程中斷後租約逾期，任務會交給其他工作行程重試，
+超過重試次數才標記失敗。佇列存於 SQLite，應用程式重新啟動後排隊中的任務仍會執行。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+from config.settings import (
+    RESPONSES_DB, JOB_WORKERS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, JOB_TTL,
+)
+from src.storage import get_response_store
+from src.report_jobs import QUEUED, RUNNING, DONE, FAILED
+
+logger = logging.getLogger(__name__)
+
+STATUS_COLUMNS = "id, kind, state, attempts, max_attempts, progress, message, error, created_at, finished_at"
+
+
+@dataclass(frozen=True)
+class Job:
+    """已領取的任務"""
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    image_hash: Optional[str]
+    attempts: int
+
+
+class JobQueue:
+    """以 SQLite 實作的任務佇列；多個行程可同時提交與領取（BEGIN IMMEDIATE 互斥）"""
+
+    def __init__(self, db_path: str = RESPONSES_DB, lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, retry_delay: float = JOB_RETRY_DELAY):
+        self.store = get_response_store(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], key: Optional[str] = None,
+                image_hash: Optional[str] = None) -> int:
+        """提交任務，回傳任務 ID；指定 key 時，相同內容未失敗的任務直接共用"""
+        now = time.time()
+        with self.store.transaction() as conn:
+            if key is not None:
+                row = conn.execute("SELECT id FROM jobs WHERE kind = ? AND dedup_key = ? AND state != ? "
+                                   "ORDER BY id DESC LIMIT 1", (kind, key, FAILED)).fetchone()
+                if row:
+                    return row[0]
+            job_id = conn.execute(
+                "INSERT INTO jobs (kind, dedup_key, payload, image_hash, max_attempts, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id",
+                (kind, key, json.dumps(payload, ensure_ascii=False, default=str), image_hash,
+                 self.max_attempts, now, now)).fetchone()[0]
+        logger.info(f"任務已提交: {kind} #{job_id}")
+        return job_id
+
+    def claim(self, kinds: Sequence[str], owner: str) -> Optional[Job]:
+        """領取一個可執行的任務（排隊中，或租約已逾期）；沒有任務時回傳 None"""
+        now = time.time()
+        kind_list = ", ".join("?" * len(kinds))
+        with self.store.transaction() as conn:
+            # 租約逾期且已用完重試次數的任務不再交給其他工作行程
+            conn.execute("UPDATE jobs SET state = ?, error = ?, finished_at = ?, lease_owner = NULL "
+                         "WHERE state = ? AND lease_until < ? AND attempts >= max_attempts",
+                         (FAILED, "工作行程中斷，已達重試上限", now, RUNNING, now))
+            row = conn.execute(f"SELECT id FROM jobs WHERE state = ? AND kind IN ({kind_list}) "
+                               f"AND available_at <= ? ORDER BY available_at, id LIMIT 1",
+                               (QUEUED, *kinds, now)).fetchone()
+            if row is None:
+                row = conn.execute(f"SELECT id FROM jobs WHERE state = ? AND lease_until < ? "
+                                   f"AND kind IN ({kind_list}) ORDER BY lease_until LIMIT 1",
+                                   (RUNNING, now, *kinds)).fetchone()
+                if row is not None:
+                    logger.warning(f"任務 #{row[0]} 租約逾期，重新執行")
+            if row is None:
+                return None
+            job_id, kind, payload, image_hash, attempts = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_until = ?, "
+                "progress = 0, message = NULL "
+                "WHERE id = ? RETURNING id, kind, payload, image_hash, attempts",
+                (RUNNING, owner, now + self.lease_seconds, row[0])).fetchone()
+        return Job(job_id, kind, json.loads(payload), image_hash, attempts)
+
+    def renew(self, job_id: int, owner: str) -> bool:
+        """延長租約；租約已被收回（例如逾期後交給其他行程）時回傳 False"""
+        with self.store.transaction() as conn:
+            return conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND lease_owner = ? AND state = ?",
+                                (time.time() + self.lease_seconds, job_id, owner, RUNNING)).rowcount == 1
+
+    def report_progress(self, job_id: int, owner: str, value: int, message: str) -> None:
+        """記錄執行進度（0-100 與說明文字），供介面輪詢顯示"""
+        with self.store.transaction() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, message = ? WHERE id = ? AND lease_owner = ?",
+                         (value, message, job_id, owner))
+
+    def complete(self, job_id: int, owner: str, result: Dict[str, Any], artifact: Optional[bytes] = None) -> bool:
+        """記錄任務結果；只有仍持有租約的行程能完成任務"""
+        with self.store.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, artifact = ?, progress = 100, error = NULL, finished_at = ?, "
+                "lease_owner = NULL, lease_until = NULL WHERE id = ? AND lease_owner = ? AND state = ?",
+                (DONE, json.dumps(result, ensure_ascii=False, default=str), artifact, time.time(),
+                 job_id, owner, RUNNING)).rowcount == 1
+        if not updated:
+            logger.warning(f"任務 #{job_id} 的租約已失效，捨棄結果")
+        return updated
+
+    def fail(self, job_id: int, owner: str, error: str, retry: bool = True,
+             result: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """記錄失敗：可重試且未達上限時延後重新排隊（間隔逐次加倍），回傳任務的新狀態
+
+        result 為失敗時的部分結果（例如分析失敗時的本地指標），最終失敗後仍可由 result() 取得。
+        """
+        now = time.time()
+        give_up = "(NOT ? OR attempts >= max_attempts)"
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET "
+                f"state = CASE WHEN {give_up} THEN ? ELSE ? END, "
+                "available_at = ? + ? * (1 << (attempts - 1)), "
+                f"finished_at = CASE WHEN {give_up} THEN ? END, "
+                "error = ?, result = ?, lease_owner = NULL, lease_until = NULL "
+                "WHERE id = ? AND lease_owner = ? AND state = ? RETURNING state",
+                (retry, FAILED, QUEUED, now, self.retry_delay, retry, now, error,
+                 json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 job_id, owner, RUNNING)).fetchone()
+        return row[0] if row else None
+
+    def status(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """任務狀態；未知（或已清除）的任務 ID 回傳 None"""
+        with self.store.connection() as conn:
+            cursor = conn.execute(f"SELECT {STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def result(self, job_id: int) -> Optional[Tuple[Dict[str, Any], Optional[bytes]]]:
+        """已完成任務的 (結果, 附件)；最終失敗且留有部分結果時回傳該結果，其餘回傳 None"""
+        with self.store.connection() as conn:
+            row = conn.execute("SELECT result, artifact FROM jobs WHERE id = ? AND "
+                               "(state = ? OR (state = ? AND result IS NOT NULL))",
+                               (job_id, DONE, FAILED)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        with self.store.connection() as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def prune(self, ttl: float = JOB_TTL) -> int:
+        """清除結束超過 ttl 秒的任務（同時釋放其圖片引用），回傳筆數"""
+        with self.store.transaction() as conn:
+            removed = conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - ttl,)).rowcount
+        if removed:
+            logger.info(f"清除 {removed} 個已結束的任務")
+        return removed
+
+
+_queues: Dict[str, JobQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_job_queue(db_path: str = RESPONSES_DB) -> JobQueue:
+    """取得（並快取）指定資料庫的任務佇列"""
+    job_queue = _queues.get(db_path)
+    if job_queue is None:
+        with _queues_lock:
+            job_queue = _queues.get(db_path)
+            if job_queue is None:
+                job_queue = _queues[db_path] = JobQueue(db_path)
+    return job_queue
+
+
+def spawn_workers(workers: int = JOB_WORKERS) -> subprocess.Popen:
+    """在背景啟動工作行程（python -m src.job_worker），上層行程結束時工作行程隨之結束"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, "-m", "src.job_worker", "--workers", str(workers),
+                                "--parent-pid", str(os.getpid())], cwd=root)
+    logger.info(f"已啟動 {workers} 個任務工作行程 (pid {process.pid})")
+    return process
@@ -0,0 +1,189 @@
+"""任務工作行程：啟動多個行程領取並執行佇列中的分析與報告任務，行程異常結束時自動重新啟動
+
+用法（於專案根目錄）：
+    python -m src.job_worker --workers 4 --kinds analysis,report
+"""
+import os
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+from config.settings import JOB_WORKERS, JOB_POLL_INTERVAL, WARM_UP_ON_START
+from src.job_queue import Job, JobQueue, get_job_queue
+from src.service import AnalysisService, DEFAULT_MODEL
+from src.blob_store import get_blob_store
+from src.warmup import default_steps, run_warm_up
+
+logger = logging.getLogger(__name__)
+
+# 任務類型
+ANALYSIS = "analysis"
+REPORT = "report"
+KINDS = (ANALYSIS, REPORT)
+
+# 閒置時清除過期任務的最短間隔（秒）
+PRUNE_INTERVAL = 60
+
+JobResult = Tuple[Dict[str, Any], Optional[bytes]]
+Progress = Callable[[int, str], None]
+
+
+class ProviderError(Exception):
+    """模型服務回傳錯誤結果（可重試）；result 為完整的失敗結果（含 local_metrics），最終失敗時保留"""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(str(result["error"]))
+        self.result = result
+
+
+def run_analysis(job: Job, service: AnalysisService, progress: Progress) -> JobResult:
+    """分析任務：payload 為 {"model", "client_id"}，圖片由 image_hash 指定"""
+    image_bytes = get_blob_store().get(job.image_hash) if job.image_hash else None
+    if image_bytes is None:
+        raise ValueError(f"Unknown image: {job.image_hash}")
+    result = service.analyze(image_bytes, job.payload.get("model", DEFAULT_MODEL), job.payload.get("client_id"),
+                             progress=progress)
+    if "error" in result:
+        # ImageAnalyzer 以回傳值表示供應商錯誤，改以例外交由租約與重試機制處理
+        raise ProviderError(result)
+    return result, None
+
+
+def run_report(job: Job, service: AnalysisService, progress: Progress) -> JobResult:
+    """報告任務：payload 為 {"analysis_result", "layout"}；結果為預算報告，附件為 PDF"""
+    artifact = service.report(job.payload.get("analysis_result"), job.payload.get("layout", "premium"),
+                              job.image_hash)
+    return {"budget": artifact["budget"]}, artifact["pdf"]
+
+
+HANDLERS: Dict[str, Callable[[Job, AnalysisService, Progress], JobResult]] = {
+    ANALYSIS: run_analysis,
+    REPORT: run_report,
+}
+
+
+class Worker:
+    """單一工作行程：逐一領取任務，執行期間在背景續約"""
+
+    def __init__(self, kinds: Sequence[str] = KINDS, job_queue: Optional[JobQueue] = None,
+                 service: Optional[AnalysisService] = None, poll_interval: float = JOB_POLL_INTERVAL):
+        self.kinds = list(kinds)
+        self.queue = job_queue or get_job_queue()
+        self.service = service or AnalysisService()
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+        self._last_prune = 0.0
+
+    def run_once(self) -> bool:
+        """領取並執行一個任務，沒有任務時回傳 False"""
+        job = self.queue.claim(self.kinds, self.owner)
+        if job is None:
+            return False
+        self._execute(job)
+        return True
+
+    def _execute(self, job: Job) -> None:
+        stop_renewing = threading.Event()
+
+        def renew():
+            while not stop_renewing.wait(self.queue.lease_seconds / 3):
+                if not self.queue.renew(job.id, self.owner):
+                    logger.warning(f"任務 #{job.id} 的租約已被收回")
+                    return
+
+        renewer = threading.Thread(target=renew, name=f"job-lease-{job.id}", daemon=True)
+        renewer.start()
+        start = time.perf_counter()
+        try:
+            result, artifact = HANDLERS[job.kind](
+                job, self.service, lambda value, message: self.queue.report_progress(job.id, self.owner, value, message))
+        except Exception as e:
+            # 輸入錯誤（ValueError）重試也不會成功，直接標記失敗
+            state = self.queue.fail(job.id, self.owner, str(e), retry=not isinstance(e, ValueError),
+                                    result=getattr(e, "result", None))
+            logger.error(f"任務失敗 {job.kind} #{job.id}（第 {job.attempts} 次，{state}）: {str(e)}", exc_info=True)
+        else:
+            self.queue.complete(job.id, self.owner, result, artifact)
+            logger.info(f"任務完成 {job.kind} #{job.id}: {time.perf_counter() - start:.2f} 秒")
+        finally:
+            stop_renewing.set()
+
+    def run(self) -> None:
+        logger.info(f"工作行程 {self.owner} 開始領取任務: {', '.join(self.kinds)}")
+        while not self.stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+                if time.time() - self._last_prune > PRUNE_INTERVAL:
+                    self._last_prune = time.time()
+                    self.queue.prune()
+            except Exception as e:
+                logger.error(f"工作行程錯誤: {str(e)}", exc_info=True)
+            self.stop_event.wait(self.poll_interval)
+
+
+def _worker_main(kinds: Sequence[str]) -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    worker = Worker(kinds)
+    # SIGTERM：完成目前的任務後結束；SIGINT 由上層行程處理
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop_event.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if WARM_UP_ON_START:
+        # 依領取的任務類型預熱，第一個任務不需等待模型與字型載入
+        run_warm_up(default_steps(kinds, analyzer=lambda: worker.service.analyzer))
+    worker.run()
+
+
+def run_workers(workers: int = JOB_WORKERS, kinds: Sequence[str] = KINDS, parent_pid: Optional[int] = None) -> None:
+    """啟動並監看工作行程；parent_pid 指定的行程結束時一併停止"""
+    # spawn：子行程不繼承上層行程的資料庫連線
+    context = multiprocessing.get_context("spawn")
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+    def start() -> multiprocessing.Process:
+        process = context.Process(target=_worker_main, args=(list(kinds),), name="job-worker")
+        process.start()
+        return process
+
+    processes = [start() for _ in range(workers)]
+    logger.info(f"已啟動 {workers} 個工作行程: {', '.join(str(process.pid) for process in processes)}")
+    while not stop.wait(JOB_POLL_INTERVAL):
+        if parent_pid is not None and os.getppid() != parent_pid:
+            logger.info("上層行程已結束，停止工作行程")
+            break
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                # 中斷的任務在租約逾期後由其他工作行程重試
+                logger.warning(f"工作行程 {process.pid} 異常結束 (exit {process.exitcode})，重新啟動")
+                processes[index] = start()
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="工作行程數")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="領取的任務類型（以逗號分隔）")
+    parser.add_argument("--parent-pid", type=int, help="此行程結束時停止（由應用程式啟動時使用）")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        parser.error(f"unknown job kinds: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_workers(args.workers, kinds, args.parent_pid)
+
+
+if __name__ == "__main__":
+    main()
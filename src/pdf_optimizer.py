@@ -0,0 +1,95 @@
+import io
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from reportlab.platypus import Image
+from config.settings import REPORT_JPEG_QUALITY, REPORT_SIZE_BUDGET_KB, REPORT_TIME_BUDGET
+from src.vector_charts import print_sized_image, PRINT_DPI
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SIZE = 64
+_cache: "OrderedDict[tuple, Tuple[bytes, float, float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+_IMAGE_RE = re.compile(rb'/Subtype\s*/Image\b')
+_PAGE_RE = re.compile(rb'/Type\s*/Page\b(?!s)')
+
+
+def _read_source(image) -> Optional[bytes]:
+    """取得原始圖檔內容；PIL 影像等無法雜湊的來源回傳 None"""
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, str) and os.path.isfile(image):
+        with open(image, 'rb') as f:
+            return f.read()
+    if hasattr(image, 'read'):
+        if hasattr(image, 'seek'):
+            image.seek(0)
+        data = image.read()
+        image.seek(0)
+        return data
+    return None
+
+
+def optimized_image(image, width_pt: float, dpi: int = PRINT_DPI,
+                    quality: int = REPORT_JPEG_QUALITY) -> Tuple[bytes, float, float]:
+    """縮小並重新壓縮為印刷尺寸的 JPEG，回傳 (JPEG 內容, 印刷寬, 印刷高)
+
+    結果以來源內容雜湊快取：同一張圖在同一份或不同報告中都得到相同位元組，
+    reportlab / fpdf2 依內容辨識圖片物件，因此只嵌入一次且不需重新編碼。
+    """
+    data = _read_source(image)
+    if data is None:
+        buffer, width, height = print_sized_image(image, width_pt, dpi, quality)
+        return buffer.getvalue(), width, height
+
+    key = (hashlib.sha256(data).hexdigest(), round(width_pt, 2), dpi, quality)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    buffer, width, height = print_sized_image(io.BytesIO(data), width_pt, dpi, quality)
+    result = (buffer.getvalue(), width, height)
+    logger.debug(f"圖片重新壓縮: {len(data) / 1024:.0f} KB -> {len(result[0]) / 1024:.0f} KB")
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def report_image(image, width_pt: float, dpi: int = PRINT_DPI) -> Image:
+    """reportlab 圖片 flowable（已縮小並重新壓縮）"""
+    data, width, height = optimized_image(image, width_pt, dpi)
+    return Image(io.BytesIO(data), width=width, height=height)
+
+
+def budget_report(label: str, pdf_bytes: bytes, seconds: float) -> Dict[str, Any]:
+    """報告大小／生成時間與預算的比較，超出預算時記錄警告"""
+    size_kb = len(pdf_bytes) / 1024
+    report = {
+        "label": label,
+        "size_kb": round(size_kb, 1),
+        "seconds": round(seconds, 2),
+        "pages": len(_PAGE_RE.findall(pdf_bytes)),
+        "images": len(_IMAGE_RE.findall(pdf_bytes)),
+        "size_budget_kb": REPORT_SIZE_BUDGET_KB,
+        "time_budget": REPORT_TIME_BUDGET,
+        "within_budget": size_kb <= REPORT_SIZE_BUDGET_KB and seconds <= REPORT_TIME_BUDGET,
+    }
+    message = (f"{label}: {report['size_kb']} KB / {REPORT_SIZE_BUDGET_KB} KB, "
+               f"{report['seconds']} s / {REPORT_TIME_BUDGET} s, "
+               f"{report['pages']} 頁, {report['images']} 張圖片")
+    if report["within_budget"]:
+        logger.info(f"報告預算 {message}")
+    else:
+        logger.warning(f"報告超出預算 {message}")
+    return report
+
@@ -0,0 +1,211 @@
+import re
+import abc
+import json
+import time
+import datetime
+import logging
+from io import BytesIO
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from fpdf import FPDF
+from reportlab.platypus import Paragraph, Spacer
+from src.report_template import get_report_template, DEFAULT_TITLE
+from src.score_extractor import extract_scores
+from src.vector_charts import build_drawing, render_fpdf_chart
+from src.pdf_optimizer import optimized_image, report_image, budget_report
+
+logger = logging.getLogger(__name__)
+
+REPORT_HEADING_RE = re.compile(r'^[0-9]+\.\s+\w+')
+EMPTY_REPORT_TEXT = "無法生成報告內容，請重試。"
+
+
+@dataclass(frozen=True)
+class ReportData:
+    """報告引擎的統一輸入：報告內文、供評分解析的分析結果與（可選的）照片／熱力圖"""
+    report_text: str
+    analysis_text: str = ''
+    heading: str = ''
+    photo: Any = None
+    heatmap: Optional[bytes] = None
+    title: str = DEFAULT_TITLE
+
+    def charts(self) -> List[dict]:
+        """向量圖表描述（雷達圖、治療優先級），評分解析結果由 score_extractor 以內容雜湊快取"""
+        sheet = extract_scores(self.analysis_text, self.report_text)
+        return [spec for spec in (sheet.radar_spec(), sheet.priority_spec()) if spec]
+
+    def figures(self) -> List[Any]:
+        """依版面順序排列的圖片：照片、熱力圖（點陣圖）與向量圖表描述"""
+        figures = []
+        if self.photo is not None:
+            figures.append(("photo", self.photo))
+        if self.heatmap:
+            figures.append(("heatmap", self.heatmap))
+        figures.extend((spec["kind"], spec) for spec in self.charts())
+        return figures
+
+    @classmethod
+    def from_analysis_result(cls, analysis_result: Dict[str, Any], photo: Any = None,
+                             title: str = DEFAULT_TITLE) -> "ReportData":
+        """由 ImageAnalyzer 的分析結果（main.py 流程）建立報告輸入"""
+        if "error" in analysis_result:
+            return cls(f"错误信息: {analysis_result['error']}", heading="分析错误", photo=photo, title=title)
+
+        analysis = analysis_result.get('analysis', {})
+        if isinstance(analysis, dict) and "error" in analysis:
+            return cls(f"错误信息: {analysis['error']}", heading="分析错误", photo=photo, title=title)
+
+        if isinstance(analysis, dict):
+            model = analysis.get('model', 'Unknown')
+            result = analysis.get('result', str(analysis))
+            # 結構化回應直接提供評分，不需再從文字解析
+            scores_source = analysis.get('structured') or result
+        else:
+            model = 'Unknown'
+            result = str(analysis) if analysis else '暂无分析结果'
+            scores_source = result
+        if not isinstance(scores_source, str):
+            scores_source = json.dumps(scores_source, ensure_ascii=False)
+
+        return cls(str(result), analysis_text=scores_source, heading=f"{model} 分析结果", photo=photo, title=title)
+
+
+class ReportLayout(abc.ABC):
+    """報告版面：將 ReportData 排版為 PDF 內容（子類別須實作 render，未實作時註冊即失敗）"""
+    name = ''
+    label = ''
+
+    @abc.abstractmethod
+    def render(self, data: ReportData) -> bytes:
+        """將報告輸入排版為 PDF 內容"""
+
+
+LAYOUTS: Dict[str, ReportLayout] = {}
+
+
+def register_layout(layout_cls):
+    """註冊報告版面（以 name 為鍵，供 render_pdf 選用）"""
+    LAYOUTS[layout_cls.name] = layout_cls()
+    return layout_cls
+
+
+@register_layout
+class PremiumLayout(ReportLayout):
+    """reportlab 版面：支援中文，使用行程級報告模板與向量圖表"""
+    name = 'premium'
+    label = '高級報告'
+    captions = {"photo": "面部照片", "heatmap": "面部問題熱力圖", "radar": "面部狀況評分", "priority": "治療方案優先級"}
+    max_width = 450
+
+    def render(self, data: ReportData) -> bytes:
+        # 样式、字体、标题、日期与免责声明由行程级报告模板预先编译，这里只处理动态内容
+        template = get_report_template(data.title)
+        styles = template.styles
+        normal_style = styles['ReportBody']
+
+        story = []
+        if data.heading:
+            story.append(Paragraph(data.heading, styles['Heading1']))
+            story.append(Spacer(1, 12))
+
+        # 分段处理报告文本，编号标题行使用二级标题
+        report_text = data.report_text if data.report_text and data.report_text.strip() else EMPTY_REPORT_TEXT
+        for para in report_text.split('\n\n'):
+            if not para.strip():
+                continue
+            if REPORT_HEADING_RE.match(para.strip()):
+                story.append(Paragraph(para, styles['Heading2']))
+            else:
+                for line in para.split('\n'):
+                    if line.strip():
+                        story.append(Paragraph(line, normal_style))
+            story.append(Spacer(1, 10))
+
+        figures = data.figures()
+        if figures:
+            story.append(Spacer(1, 20))
+            story.append(Paragraph("分析圖表", styles['Heading2']))
+            story.append(Spacer(1, 10))
+            for kind, figure in figures:
+                try:
+                    story.append(Paragraph(self.captions.get(kind, ""), styles['Heading3']))
+                    if isinstance(figure, dict):
+                        # 向量图表直接以 reportlab 绘图嵌入
+                        story.append(build_drawing(figure, font_name=template.font_name))
+                    else:
+                        # 点阵图缩小到 A4 印刷尺寸并重新压缩为 JPEG 后再嵌入
+                        story.append(report_image(figure, self.max_width))
+                    story.append(Spacer(1, 15))
+                except Exception as e:
+                    logger.error(f"处理图片失败: {str(e)}", exc_info=True)
+
+        # 构建PDF（标题、日期、免责声明与页面装饰由模板加入）
+        return template.build(story).getvalue()
+
+
+@register_layout
+class StandardLayout(ReportLayout):
+    """FPDF 版面：核心字型不支援中文，只輸出英文標題與圖表"""
+    name = 'standard'
+    label = '標準報告'
+    titles = {"photo": "Uploaded Photo", "heatmap": "Face Problem Heat Map",
+              "radar": "Facial Condition Score", "priority": "Treatment Priority"}
+
+    def render(self, data: ReportData) -> bytes:
+        pdf = FPDF()
+        pdf.add_page()
+
+        # 添加标题与日期（使用英文避免字体问题）
+        pdf.set_font('Arial', 'B', 16)
+        pdf.cell(0, 10, 'Medical Beauty Assessment Report', 0, 1, 'C')
+        pdf.set_font('Arial', '', 12)
+        pdf.cell(0, 10, f'Date: {datetime.datetime.now().strftime("%Y-%m-%d")}', 0, 1, 'C')
+
+        pdf.set_font('Arial', '', 10)
+        pdf.multi_cell(0, 5, "Due to font limitations in PDF, Chinese characters cannot be displayed properly.", new_x="LMARGIN", new_y="NEXT")
+        pdf.multi_cell(0, 5, "Below is the analysis visualization. For full report, please download the text report.", new_x="LMARGIN", new_y="NEXT")
+
+        for kind, figure in data.figures():
+            try:
+                pdf.add_page()
+                pdf.set_font('Arial', 'B', 12)
+                pdf.cell(0, 10, self.titles.get(kind, ""), 0, 1, 'C')
+                # 向量图以 FPDF 绘图指令绘制，点阵图缩小到印刷尺寸
+                if isinstance(figure, dict):
+                    render_fpdf_chart(pdf, figure, x=10, y=30, w=190)
+                else:
+                    img_data, _, _ = optimized_image(figure, 190 / 25.4 * 72)
+                    pdf.image(BytesIO(img_data), x=10, y=30, w=190)
+            except Exception as e:
+                logger.error(f"添加图片失败: {str(e)}")
+
+        pdf.set_font('Arial', 'I', 8)
+        pdf.cell(0, 10, 'Disclaimer: This report is generated by AI for reference only.', 0, 1, 'C')
+        return bytes(pdf.output())
+
+
+def render_pdf(layout: str, data: ReportData) -> Optional[bytes]:
+    """以指定版面生成報告 PDF，失敗時回傳 None"""
+    try:
+        pdf_bytes = LAYOUTS[layout].render(data)
+        logger.info(f"PDF生成成功 ({layout}): {len(pdf_bytes) / 1024:.1f} KB")
+        return pdf_bytes
+    except Exception as e:
+        logger.error(f"PDF生成失败 ({layout}): {str(e)}", exc_info=True)
+        return None
+
+
+def render_with_budget(layout: str, data: ReportData,
+                       start: Optional[float] = None) -> Tuple[Optional[bytes], Optional[Dict[str, Any]]]:
+    """生成報告並附上大小／時間預算報告（start 為計時起點，預設為現在）"""
+    start = time.perf_counter() if start is None else start
+    pdf_bytes = render_pdf(layout, data)
+    if not pdf_bytes:
+        return None, None
+    return pdf_bytes, budget_report(LAYOUTS[layout].label, pdf_bytes, time.perf_counter() - start)
+
+
+def warm_up(title: str = DEFAULT_TITLE) -> None:
+    """預先註冊字型並建立報告模板（批次工作行程啟動時呼叫）"""
+    get_report_template(title)
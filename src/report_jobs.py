@@ -0,0 +1,120 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 任務狀態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 已結束任務的保留時間（秒）
+JOB_TTL = 3600
+
+
+class ReportJobQueue:
+    """行程內的報告任務佇列：以工作執行緒池生成報告，任務 ID 供介面輪詢，結果存入成品快取
+
+    同一個 key（報告內容雜湊）的任務只會執行一次，重複提交會回傳既有任務 ID。
+    """
+
+    def __init__(self, max_workers: int = 2, max_artifacts: int = 128):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._job_by_key: Dict[str, str] = {}
+        self._artifacts: "OrderedDict[str, Any]" = OrderedDict()
+        self._max_artifacts = max_artifacts
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> str:
+        """提交報告任務，回傳任務 ID"""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(self._job_by_key.get(key, ""))
+            # 進行中或已完成（成品仍在快取）的任務直接共用
+            if job and (job["state"] in (QUEUED, RUNNING) or key in self._artifacts):
+                return job["id"]
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            cached = key in self._artifacts
+            self._jobs[job_id] = {
+                "id": job_id,
+                "key": key,
+                "state": DONE if cached else QUEUED,
+                "error": None,
+                "created_at": now,
+                "finished_at": now if cached else None,
+            }
+            self._job_by_key[key] = job_id
+            if cached:
+                return job_id
+
+        self._executor.submit(self._run, job_id, key, fn, args, kwargs)
+        logger.info(f"報告任務已提交: {job_id}")
+        return job_id
+
+    def _run(self, job_id: str, key: str, fn: Callable[..., Any], args, kwargs) -> None:
+        self._update(job_id, state=RUNNING)
+        try:
+            result = fn(*args, **kwargs)
+            if result is None:
+                raise RuntimeError("報告生成失敗")
+            self.put_artifact(key, result)
+            self._update(job_id, state=DONE, finished_at=time.time())
+            logger.info(f"報告任務完成: {job_id}")
+        except Exception as e:
+            logger.error(f"報告任務失敗 {job_id}: {str(e)}", exc_info=True)
+            self._update(job_id, state=FAILED, error=str(e), finished_at=time.time())
+
+    def _prune(self) -> None:
+        """清除逾時的已結束任務（呼叫者需持有鎖）"""
+        cutoff = time.time() - JOB_TTL
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._job_by_key.get(job["key"]) == job_id and job["key"] not in self._artifacts:
+                del self._job_by_key[job["key"]]
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任務狀態（複本）；未知的任務 ID 回傳 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def put_artifact(self, key: str, artifact: Any) -> None:
+        with self._lock:
+            self._artifacts[key] = artifact
+            self._artifacts.move_to_end(key)
+            while len(self._artifacts) > self._max_artifacts:
+                evicted, _ = self._artifacts.popitem(last=False)
+                self._job_by_key.pop(evicted, None)
+
+    def artifact(self, key: str) -> Optional[Any]:
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is not None:
+                self._artifacts.move_to_end(key)
+            return artifact
+
+    def result(self, job_id: str) -> Optional[Any]:
+        """已完成任務的成品；未完成時回傳 None"""
+        job = self.status(job_id)
+        if not job or job["state"] != DONE:
+            return None
+        return self.artifact(job["key"])
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
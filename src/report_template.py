@@ -0,0 +1,130 @@
+import io
+import copy
+import datetime
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import List, Optional
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import BaseDocTemplate, PageTemplate, Frame, Paragraph, Spacer
+from src.font_registry import apply_report_font
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLE = "醫美智能評估報告"
+DEFAULT_DISCLAIMER = "免責聲明：本報告由AI系統生成，僅供參考，具體治療方案請諮詢專業醫生。"
+
+_binary_lock = threading.Lock()
+_binary_builds = 0
+_saved_use_a85 = None
+
+
+@contextmanager
+def binary_streams():
+    """輸出期間關閉 ASCII85 編碼（圖片、字型、頁面內容各多 25%），結束後還原原設定
+
+    pageCompression 可逐份文件指定，useA85 只有 rl_config 全域設定，
+    因此只在報告輸出期間切換；並行輸出時由最後一個結束者還原。
+    """
+    global _binary_builds, _saved_use_a85
+    with _binary_lock:
+        if _binary_builds == 0:
+            _saved_use_a85 = rl_config.useA85
+            rl_config.useA85 = 0
+        _binary_builds += 1
+    try:
+        yield
+    finally:
+        with _binary_lock:
+            _binary_builds -= 1
+            if _binary_builds == 0:
+                rl_config.useA85 = _saved_use_a85
+
+
+class ReportTemplate:
+    """行程級報告模板：預先編譯樣式、頁面裝飾與固定段落，每份報告只需處理動態內容"""
+
+    def __init__(self, title: str = DEFAULT_TITLE, disclaimer: str = DEFAULT_DISCLAIMER,
+                 pagesize=A4, margin: float = 72):
+        self.title = title
+        self.disclaimer = disclaimer
+        self.pagesize = pagesize
+        self.margin = margin
+
+        self.styles = getSampleStyleSheet()
+        self.font_name = apply_report_font(self.styles)
+        self.styles.add(ParagraphStyle('ReportTitle', parent=self.styles['Heading1'], alignment=TA_CENTER))
+        self.styles.add(ParagraphStyle('ReportDate', parent=self.styles['Normal'], alignment=TA_CENTER))
+        self.styles.add(ParagraphStyle('ReportBody', parent=self.styles['Normal'], leading=14))
+        self.styles.add(ParagraphStyle('ReportDisclaimer', parent=self.styles['Italic'], textColor=colors.gray))
+
+        # 固定段落只解析一次，每份報告取淺拷貝（排版狀態各自獨立）
+        self._title = Paragraph(self.title, self.styles['ReportTitle'])
+        self._disclaimer = Paragraph(self.disclaimer, self.styles['ReportDisclaimer'])
+        self._date_cache = {}
+        self._date_lock = threading.Lock()
+
+        width, height = pagesize
+        self._frame_args = (margin, margin, width - 2 * margin, height - 2 * margin)
+
+    def style(self, name: str) -> ParagraphStyle:
+        return self.styles[name]
+
+    def title_flowables(self) -> List:
+        return [copy.copy(self._title), Spacer(1, 12)]
+
+    def date_flowables(self, date: Optional[datetime.date] = None) -> List:
+        date = date or datetime.date.today()
+        with self._date_lock:
+            paragraph = self._date_cache.get(date)
+            if paragraph is None:
+                self._date_cache = {date: Paragraph(f"生成日期：{date.strftime('%Y年%m月%d日')}", self.styles['ReportDate'])}
+                paragraph = self._date_cache[date]
+        return [copy.copy(paragraph), Spacer(1, 20)]
+
+    def disclaimer_flowables(self) -> List:
+        return [Spacer(1, 30), copy.copy(self._disclaimer)]
+
+    def _draw_page(self, canvas, doc):
+        """頁首標題與頁尾頁碼，由頁面模板繪製而不進入排版流程"""
+        width, height = self.pagesize
+        canvas.saveState()
+        canvas.setStrokeColor(colors.HexColor('#9C89B8'))
+        canvas.setLineWidth(1.5)
+        canvas.line(self.margin, height - self.margin + 20, width - self.margin, height - self.margin + 20)
+        canvas.setFont(self.font_name, 8)
+        canvas.setFillColor(colors.gray)
+        canvas.drawString(self.margin, height - self.margin + 26, self.title)
+        canvas.drawRightString(width - self.margin, self.margin - 24, f"- {doc.page} -")
+        canvas.restoreState()
+
+    def build(self, body: List, buffer: Optional[io.BytesIO] = None, with_header: bool = True, **doc_kwargs) -> io.BytesIO:
+        """以模板組合固定段落與動態內容並輸出 PDF"""
+        buffer = buffer or io.BytesIO()
+        doc_kwargs.setdefault('pageCompression', 1)
+        doc = BaseDocTemplate(buffer, pagesize=self.pagesize, leftMargin=self.margin, rightMargin=self.margin,
+                              topMargin=self.margin, bottomMargin=self.margin, **doc_kwargs)
+        doc.addPageTemplates([PageTemplate(id='report', frames=[Frame(*self._frame_args, id='body')],
+                                           onPage=self._draw_page)])
+        story = []
+        if with_header:
+            story.extend(self.title_flowables())
+            story.extend(self.date_flowables())
+        story.extend(body)
+        story.extend(self.disclaimer_flowables())
+        with binary_streams():
+            doc.build(story)
+        buffer.seek(0)
+        return buffer
+
+
+@lru_cache(maxsize=8)
+def get_report_template(title: str = DEFAULT_TITLE, disclaimer: str = DEFAULT_DISCLAIMER) -> ReportTemplate:
+    """取得（並快取）指定標題的報告模板"""
+    logger.info(f"建立報告模板: {title}")
+    return ReportTemplate(title, disclaimer)
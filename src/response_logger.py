@@ -0,0 +1,150 @@
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from config.settings import (
+    RESPONSE_LOG_SINKS, RESPONSE_LOG_QUEUE_SIZE, RESPONSE_LOG_BATCH_SIZE,
+    RESPONSE_LOG_FLUSH_INTERVAL, RESPONSE_LOG_PUT_TIMEOUT,
+)
+from src.storage import get_response_store
+from src.segment_log import get_segment_log, make_record
+from utils.helpers import response_to_dict
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+Record = Tuple[str, Any, datetime, Optional[str], Optional[str]]
+
+
+class WriteBehindLogger:
+    """API 回應的背景寫入器：回應先放入有上限的記憶體佇列，由寫入執行緒批次序列化並寫入
+
+    佇列已滿時呼叫端最多等待 put_timeout 秒（背壓），仍無空位則直接同步寫入，不遺失記錄。
+    """
+
+    def __init__(self, sinks: Sequence[str] = RESPONSE_LOG_SINKS, max_queue: int = RESPONSE_LOG_QUEUE_SIZE,
+                 batch_size: int = RESPONSE_LOG_BATCH_SIZE, flush_interval: float = RESPONSE_LOG_FLUSH_INTERVAL,
+                 put_timeout: float = RESPONSE_LOG_PUT_TIMEOUT):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stats = {"enqueued": 0, "written": 0, "inline": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="response-logger", daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def log(self, response_type: str, response_data: Any, image_hash: Optional[str] = None,
+            client_id: Optional[str] = None) -> None:
+        """記錄一筆回應（不在呼叫端序列化；回應物件交給寫入執行緒處理）"""
+        record = (response_type, response_data, datetime.now(), image_hash, client_id)
+        if self._closed:
+            self._write([record])
+            self._count("inline")
+            return
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+            self._count("enqueued")
+        except queue.Full:
+            logger.warning(f"回應記錄佇列已滿，直接寫入 {response_type} 回應")
+            self._write([record])
+            self._count("inline")
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch: List[Record] = []
+            stop = item is _STOP
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: List[Record]) -> None:
+        """序列化並寫入一批回應；單一輸出失敗不影響其他輸出"""
+        try:
+            records = [(response_type, response_to_dict(data), created_at, image_hash, client_id)
+                       for response_type, data, created_at, image_hash, client_id in batch]
+        except Exception as e:
+            logger.error(f"回應序列化失敗: {str(e)}")
+            self._count("errors", len(batch))
+            return
+        if "db" in self.sinks:
+            try:
+                get_response_store().save_many((response_type, data, image_hash, client_id)
+                                               for response_type, data, _, image_hash, client_id in records)
+            except Exception as e:
+                logger.error(f"批次寫入資料庫失敗: {str(e)}")
+                self._count("errors", len(batch))
+        if "json" in self.sinks:
+            try:
+                get_segment_log().append_many(make_record(*record) for record in records)
+            except Exception as e:
+                logger.error(f"寫入回應記錄分段失敗: {str(e)}")
+                self._count("errors", len(batch))
+        self._count("written", len(batch))
+
+    def flush(self) -> None:
+        """等待佇列中的回應全部寫入"""
+        self._queue.join()
+
+    def shutdown(self) -> None:
+        """寫入剩餘回應並停止寫入執行緒"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        # 關閉期間才放入佇列的回應直接寫入
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._write(leftover)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats, pending=self._queue.qsize())
+
+
+_logger_instance: Optional[WriteBehindLogger] = None
+_logger_lock = threading.Lock()
+
+
+def get_response_logger() -> WriteBehindLogger:
+    """行程內共用的回應寫入器；行程結束時自動寫入剩餘回應"""
+    global _logger_instance
+    if _logger_instance is None:
+        with _logger_lock:
+            if _logger_instance is None:
+                _logger_instance = WriteBehindLogger()
+                atexit.register(_logger_instance.shutdown)
+    return _logger_instance
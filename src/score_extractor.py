@@ -0,0 +1,240 @@
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from src.analysis_schema import parse_structured
+
+logger = logging.getLogger(__name__)
+
+# 評分維度與面部區域（與分析提示詞一致），值為可能出現的別名（繁／簡）
+DIMENSIONS = {
+    '皮膚狀況': ['皮膚狀況', '皮肤状况', '膚質', '肤质'],
+    '皺紋': ['皺紋', '皱纹'],
+    '色斑': ['色斑'],
+    '緊致度': ['緊致度', '紧致度', '緊致', '紧致'],
+    '其他特徵': ['其他特徵', '其他特征', '毛孔', '黑眼圈'],
+}
+REGIONS = {
+    '額頭': ['額頭', '额头'],
+    '眼周': ['眼周', '眼部'],
+    '鼻子': ['鼻子', '鼻部'],
+    '頰骨': ['頰骨', '颊骨', '臉頰', '脸颊', '顴骨', '颧骨'],
+    '嘴唇': ['嘴唇', '唇部'],
+    '下巴': ['下巴', '下頜', '下颌'],
+}
+OVERALL = '整體'
+
+# 雷達圖以英文標籤顯示各維度平均分（PDF 圖表字型不一定支援中文）
+RADAR_LABELS = {
+    '皮膚狀況': 'Skin Quality',
+    '皺紋': 'Wrinkles',
+    '色斑': 'Spots',
+    '緊致度': 'Firmness',
+    '其他特徵': 'Pores & Other',
+}
+# detect_face_regions 回傳的區域對應到分析中的區域
+HEATMAP_REGIONS = {
+    'forehead': '額頭',
+    'cheeks': '頰骨',
+    'chin': '下巴',
+}
+
+MAX_SCORE = 5
+
+
+def _alias_lookup(table: Dict[str, List[str]]) -> Dict[str, str]:
+    return {alias: name for name, aliases in table.items() for alias in aliases}
+
+
+def _alternation(lookup: Dict[str, str]) -> str:
+    # 長別名優先，避免「緊致」搶先匹配「緊致度」
+    return '|'.join(re.escape(alias) for alias in sorted(lookup, key=len, reverse=True))
+
+
+_DIMENSION_ALIASES = _alias_lookup(DIMENSIONS)
+_REGION_ALIASES = _alias_lookup(REGIONS)
+
+_REGION_RE = re.compile(f'({_alternation(_REGION_ALIASES)})')
+_SCORE_RE = re.compile(
+    rf'(?P<dim>{_alternation(_DIMENSION_ALIASES)})[^0-9\n]{{0,30}}?(?P<score>[0-5](?:\.\d+)?)\s*(?:/\s*5|分)'
+)
+_TREATMENT_SECTION_RE = re.compile(r'(治療方案|治疗方案|推薦.*方案|推荐.*方案)')
+_OTHER_SECTION_RE = re.compile(r'^\s*(?:#+\s*|\*\*)?\s*\d*[\.、]?\s*(?:\*\*)?\s*(預期效果|预期效果|術後護理|术后护理|風險提示|风险提示)')
+_TREATMENT_RE = re.compile(
+    r'^\s*(?:#+\s*)?(?:[-*]\s*)?(?:\*\*)?\s*(?P<rank>\d+)\s*[\.\)、）]\s*(?:\*\*)?\s*(?P<name>[^\n:：*（(]+)'
+)
+# 舊格式：行內「1) 玻尿酸填充」
+_INLINE_TREATMENT_RE = re.compile(r'(\d+)\)\s*([^0-5].*?)(?=\s*\d|\n|$)')
+
+_CACHE_SIZE = 256
+_cache: "OrderedDict[str, ScoreSheet]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ScoreSheet:
+    """一次模型回應解析後的結構化評分"""
+    # 區域 → 維度 → 0-5 分
+    scores: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # 依優先級排序的 (治療名稱, 排名)
+    treatments: Tuple[Tuple[str, int], ...] = ()
+    source_hash: str = ''
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.scores and not self.treatments
+
+    def region_score(self, region: str) -> Optional[float]:
+        """區域平均分，沒有評分時回傳 None"""
+        values = list(self.scores.get(region, {}).values())
+        return sum(values) / len(values) if values else None
+
+    def region_dimension_score(self, region: str, dimension: str) -> Optional[float]:
+        return self.scores.get(region, {}).get(dimension)
+
+    def dimension_average(self, dimension: str) -> Optional[float]:
+        """某一維度在所有區域的平均分"""
+        values = [dims[dimension] for dims in self.scores.values() if dimension in dims]
+        return sum(values) / len(values) if values else None
+
+    def overall_average(self) -> Optional[float]:
+        """所有區域、所有維度的平均分"""
+        values = [value for dims in self.scores.values() for value in dims.values()]
+        return sum(values) / len(values) if values else None
+
+    def region_severity(self, region: str) -> Optional[float]:
+        """熱力圖嚴重程度（0 完美 ~ 1 嚴重），優先使用皮膚狀況分數"""
+        score = self.region_dimension_score(region, '皮膚狀況')
+        if score is None:
+            score = self.region_score(region)
+        return None if score is None else (MAX_SCORE - score) / MAX_SCORE
+
+    def radar_spec(self) -> Optional[dict]:
+        """雷達圖描述；可用維度不足三個時回傳 None"""
+        categories, values = [], []
+        for dimension, label in RADAR_LABELS.items():
+            average = self.dimension_average(dimension)
+            if average is not None:
+                categories.append(label)
+                values.append(round(average, 1))
+        if len(categories) < 3:
+            return None
+        return {"kind": "radar", "categories": categories, "scores": values}
+
+    def priority_spec(self) -> Optional[dict]:
+        """治療方案優先級圖描述；沒有治療方案時回傳 None"""
+        if not self.treatments:
+            return None
+        return {
+            "kind": "priority",
+            "treatments": [name for name, _ in self.treatments],
+            "priorities": [max(1, 6 - rank) for _, rank in self.treatments],
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "scores": {region: dict(dims) for region, dims in self.scores.items()},
+            "treatments": [[name, rank] for name, rank in self.treatments],
+            "source_hash": self.source_hash,
+        }
+
+
+def response_hash(*texts: str) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update((text or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _parse_scores(text: str) -> Dict[str, Dict[str, float]]:
+    scores: Dict[str, Dict[str, float]] = {}
+    current_region = OVERALL
+    for line in text.splitlines():
+        region_match = _REGION_RE.search(line)
+        if region_match:
+            current_region = _REGION_ALIASES[region_match.group(1)]
+        for match in _SCORE_RE.finditer(line):
+            dimension = _DIMENSION_ALIASES[match.group('dim')]
+            scores.setdefault(current_region, {}).setdefault(dimension, float(match.group('score')))
+    return scores
+
+
+def _parse_treatments(text: str) -> List[Tuple[str, int]]:
+    treatments: List[Tuple[str, int]] = []
+    in_section = False
+    for line in text.splitlines():
+        if _OTHER_SECTION_RE.match(line):
+            in_section = False
+        elif _TREATMENT_SECTION_RE.search(line):
+            # 「2. 推薦的醫美治療方案」這類標題本身不是治療項目
+            in_section = True
+            continue
+
+        if in_section:
+            match = _TREATMENT_RE.match(line)
+            if match:
+                name = match.group('name').strip()
+                if name:
+                    treatments.append((name, int(match.group('rank'))))
+                continue
+        match = _INLINE_TREATMENT_RE.search(line)
+        if match:
+            treatments.append((match.group(2).strip(), int(match.group(1))))
+
+    # 同名治療只保留最高優先級，並依排名排序
+    best: Dict[str, int] = {}
+    for name, rank in treatments:
+        best[name] = min(rank, best.get(name, rank))
+    return sorted(best.items(), key=lambda item: item[1])
+
+
+def _structured_scores(data: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    scores: Dict[str, Dict[str, float]] = {}
+    for item in data.get('regions', []):
+        region = _REGION_ALIASES.get(item.get('region', ''), OVERALL)
+        for name, value in (item.get('scores') or {}).items():
+            dimension = _DIMENSION_ALIASES.get(name)
+            if dimension is not None and isinstance(value, (int, float)):
+                scores.setdefault(region, {})[dimension] = float(max(0, min(MAX_SCORE, value)))
+    return scores
+
+
+def _structured_treatments(data: Dict[str, Any]) -> List[Tuple[str, int]]:
+    items = [item for item in data.get('treatments', []) if item.get('name')]
+    items.sort(key=lambda item: item.get('priority', 99))
+    return [(item['name'].strip(), rank) for rank, item in enumerate(items, 1)]
+
+
+def extract_scores(analysis_text: str, report_text: str = '') -> ScoreSheet:
+    """將分析結果與報告解析為結構化評分（以回應雜湊快取）
+
+    JSON 結構化回應（見 analysis_schema）直接讀取，其餘以正則單次掃描自由文本。
+    """
+    key = response_hash(analysis_text, report_text)
+    with _cache_lock:
+        sheet = _cache.get(key)
+        if sheet is not None:
+            _cache.move_to_end(key)
+            return sheet
+
+    analysis_data = parse_structured(analysis_text)
+    report_data = parse_structured(report_text)
+    sheet = ScoreSheet(
+        scores=_structured_scores(analysis_data) if analysis_data else _parse_scores(analysis_text or ''),
+        treatments=tuple(_structured_treatments(report_data) if report_data else _parse_treatments(report_text or '')),
+        source_hash=key,
+    )
+    if not sheet.scores:
+        logger.info("分析結果中未找到結構化評分")
+    if report_text and not sheet.treatments:
+        logger.info("報告中未找到治療方案列表")
+
+    with _cache_lock:
+        _cache[key] = sheet
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return sheet
@@ -0,0 +1,282 @@
+"""欄式評分儲存：每筆分析的區域 × 維度評分以固定型別欄位檔附加寫入，讀取時以記憶體映射做向量化統計
+
+用法（於專案根目錄，由 responses.db 重建）：
+    python -m src.score_store --rebuild
+"""
+import os
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import numpy as np
+from config.settings import SCORE_STORE_DIR, RESPONSES_DB
+from src.score_extractor import DIMENSIONS, REGIONS, OVERALL, ScoreSheet, extract_scores
+
+try:
+    import fcntl
+except ImportError:  # Windows：僅保證單一行程內的寫入互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+REGION_AXIS = list(REGIONS) + [OVERALL]
+DIMENSION_AXIS = list(DIMENSIONS)
+# 只有 Grok 的面部分析回應寫入評分儲存（DeepSeek 回應為報告，其中的數字不是面部評分）
+SCORED_TYPES = ("grok",)
+# 評分分布的分箱（0, 0.5, ..., 5）
+SCORE_BINS = np.arange(0, 5.75, 0.5)
+
+ScoreRow = Tuple[int, Union[str, datetime], Optional[str], ScoreSheet]
+
+
+def client_key(client_id: Optional[str]) -> int:
+    """客戶編號轉為 64 位元鍵（0 表示未知客戶）"""
+    if not client_id:
+        return 0
+    return int.from_bytes(hashlib.sha256(client_id.encode("utf-8")).digest()[:8], "little") or 1
+
+
+def _column_name(region: str, dimension: str) -> str:
+    return f"score_{REGION_AXIS.index(region)}_{DIMENSION_AXIS.index(dimension)}"
+
+
+# 欄位名稱 → 型別；每欄一個檔案，第 i 列即第 i 筆分析
+COLUMNS: Dict[str, np.dtype] = {
+    "id": np.dtype("<i8"),
+    "created_at": np.dtype("<i8"),  # UTC epoch 秒
+    "client": np.dtype("<u8"),
+}
+COLUMNS.update({_column_name(region, dimension): np.dtype("<f4")
+                for region in REGION_AXIS for dimension in DIMENSION_AXIS})
+
+
+def _epoch(created_at: Union[str, datetime]) -> int:
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=" ")
+    return int(np.datetime64(created_at.replace(" ", "T"), "s").astype(np.int64))
+
+
+class ScoreStore:
+    """以分析 ID 為鍵的欄式評分；只附加，ID 遞增"""
+
+    def __init__(self, directory: str = SCORE_STORE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+        os.makedirs(directory, exist_ok=True)
+        self._repair()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _rows_on_disk(self) -> int:
+        sizes = [os.path.getsize(self._path(name)) // dtype.itemsize if os.path.exists(self._path(name)) else 0
+                 for name, dtype in COLUMNS.items()]
+        return min(sizes)
+
+    def _repair(self) -> None:
+        """寫入中斷時各欄長度可能不一致，截斷到最短欄位"""
+        rows = self._rows_on_disk()
+        for name, dtype in COLUMNS.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) != rows * dtype.itemsize:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * dtype.itemsize)
+                logger.warning(f"評分欄位 {name} 截斷至 {rows} 筆")
+
+    def append_many(self, rows: Iterable[ScoreRow]) -> int:
+        """附加多筆 (分析 ID, 建立時間, 客戶編號, 評分)，回傳筆數"""
+        rows = [row for row in rows if row[3].scores]
+        if not rows:
+            return 0
+        data = {
+            "id": np.array([row[0] for row in rows], dtype=COLUMNS["id"]),
+            "created_at": np.array([_epoch(row[1]) for row in rows], dtype=COLUMNS["created_at"]),
+            "client": np.array([client_key(row[2]) for row in rows], dtype=COLUMNS["client"]),
+        }
+        for region in REGION_AXIS:
+            for dimension in DIMENSION_AXIS:
+                data[_column_name(region, dimension)] = np.array(
+                    [row[3].region_dimension_score(region, dimension) for row in rows], dtype=np.float64
+                ).astype(COLUMNS[_column_name(region, dimension)])
+
+        with self._lock, open(self._path("lock"), "wb") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for name, values in data.items():
+                with open(self._path(name), "ab") as f:
+                    values.tofile(f)
+            self._columns = None
+        return len(rows)
+
+    def append(self, analysis_id: int, created_at: Union[str, datetime], client_id: Optional[str],
+               sheet: ScoreSheet) -> int:
+        return self.append_many([(analysis_id, created_at, client_id, sheet)])
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """所有欄位的唯讀記憶體映射（列數改變時重新映射）"""
+        rows = self._rows_on_disk()
+        cached = self._columns
+        if cached is not None and len(cached["id"]) == rows:
+            return cached
+        if rows == 0:
+            columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        else:
+            columns = {name: np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,))
+                       for name, dtype in COLUMNS.items()}
+        self._columns = columns
+        return columns
+
+    def __len__(self) -> int:
+        return self._rows_on_disk()
+
+    def dimension_scores(self, dimension: str, region: Optional[str] = None,
+                         rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """每筆分析（或 rows 指定的列）在某維度的分數；未指定區域時為各區域平均，沒有評分為 NaN"""
+        columns = self.columns()
+        select = (lambda column: column) if rows is None else (lambda column: column[rows])
+        if region is not None:
+            return select(columns[_column_name(region, dimension)]).astype(np.float64)
+        totals = counts = None
+        for name in REGION_AXIS:
+            values = select(columns[_column_name(name, dimension)])
+            valid = ~np.isnan(values)
+            if totals is None:
+                totals, counts = np.where(valid, values, 0).astype(np.float64), valid.astype(np.int32)
+            else:
+                totals += np.where(valid, values, 0)
+                counts += valid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals / np.where(counts > 0, counts, np.nan)
+
+    def _time_mask(self, since: Optional[str], until: Optional[str]) -> np.ndarray:
+        created = self.columns()["created_at"]
+        mask = np.ones(len(created), dtype=bool)
+        if since is not None:
+            mask &= created >= _epoch(since)
+        if until is not None:
+            mask &= created < _epoch(until)
+        return mask
+
+    def monthly_average(self, dimension: str, region: Optional[str] = None, since: Optional[str] = None,
+                        until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """依月份彙總某維度的平均分與筆數"""
+        scores = self.dimension_scores(dimension, region)
+        mask = self._time_mask(since, until) & ~np.isnan(scores)
+        if not mask.any():
+            return []
+        months = self.columns()["created_at"][mask].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        # 以月份序號直接分箱，不需排序
+        first = months.min()
+        counts = np.bincount(months - first)
+        totals = np.bincount(months - first, weights=scores[mask])
+        return [{"month": str(np.datetime64(int(first + offset), "M")),
+                 "average": round(float(totals[offset] / count), 2),
+                 "count": int(count)}
+                for offset, count in enumerate(counts) if count]
+
+    def distribution(self, dimension: str, region: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None) -> Dict[str, List]:
+        """某維度的評分分布（以 0.5 分為一箱）"""
+        scores = self.dimension_scores(dimension, region)
+        values = scores[self._time_mask(since, until) & ~np.isnan(scores)]
+        counts, edges = np.histogram(values, bins=SCORE_BINS)
+        return {"bins": [float(edge) for edge in edges[:-1]], "counts": counts.tolist()}
+
+    def client_trend(self, client_id: str) -> List[Dict[str, Any]]:
+        """回訪客戶歷次分析的各維度平均分（依時間排序），用於前後對比"""
+        columns = self.columns()
+        rows = np.flatnonzero(columns["client"] == client_key(client_id))
+        if not len(rows):
+            return []
+        rows = rows[np.argsort(columns["created_at"][rows], kind="stable")]
+        averages = {dimension: self.dimension_scores(dimension, rows=rows) for dimension in DIMENSION_AXIS}
+        trend = []
+        for position, row in enumerate(rows):
+            scores = {dimension: round(float(values[position]), 2)
+                      for dimension, values in averages.items() if not np.isnan(values[position])}
+            trend.append({
+                "id": int(columns["id"][row]),
+                "created_at": str(columns["created_at"][row].astype("datetime64[s]")).replace("T", " "),
+                "scores": scores,
+            })
+        return trend
+
+    def get(self, analysis_id: int) -> Optional[Dict[str, Dict[str, float]]]:
+        """依分析 ID 取得區域 × 維度評分（ID 遞增時以二分搜尋定位，順序不符時改為線性搜尋）"""
+        columns = self.columns()
+        row = int(np.searchsorted(columns["id"], analysis_id))
+        if row >= len(columns["id"]) or columns["id"][row] != analysis_id:
+            # 舊版在交易外附加，多個行程可能以相反順序寫入 ID
+            matches = np.flatnonzero(columns["id"] == analysis_id)
+            if not len(matches):
+                return None
+            row = int(matches[-1])
+        scores: Dict[str, Dict[str, float]] = {}
+        for region in REGION_AXIS:
+            for dimension in DIMENSION_AXIS:
+                value = columns[_column_name(region, dimension)][row]
+                if not np.isnan(value):
+                    scores.setdefault(region, {})[dimension] = float(value)
+        return scores
+
+
+_stores: Dict[str, ScoreStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_score_store(directory: str = SCORE_STORE_DIR) -> ScoreStore:
+    """取得（並快取）指定目錄的評分儲存"""
+    store = _stores.get(directory)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(directory)
+            if store is None:
+                store = _stores[directory] = ScoreStore(directory)
+    return store
+
+
+def rebuild(db_path: str = RESPONSES_DB, directory: str = SCORE_STORE_DIR, batch_size: int = 1000) -> int:
+    """清空評分儲存並由資料庫中已有評分的回應重建，回傳筆數"""
+    # 延遲匯入：storage 在寫入時也會使用本模組
+    from src.storage import get_response_store, decode_payload
+    from utils.helpers import response_content
+
+    shutil.rmtree(directory, ignore_errors=True)
+    _stores.pop(directory, None)
+    scores = get_score_store(directory)
+    query = ("SELECT id, created_at, client_id, payload, codec, response_data FROM api_responses "
+             f"WHERE score IS NOT NULL AND response_type IN ({','.join('?' for _ in SCORED_TYPES)}) ORDER BY id")
+    total = 0
+    with get_response_store(db_path).connection() as conn:
+        cursor = conn.execute(query, SCORED_TYPES)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = []
+            for row_id, created_at, client_id, payload, codec, legacy in rows:
+                content = response_content(decode_payload(payload, codec, legacy))
+                if content:
+                    batch.append((row_id, created_at, client_id, extract_scores(content)))
+            total += scores.append_many(batch)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=RESPONSES_DB, help="回應資料庫路徑")
+    parser.add_argument("--dir", default=SCORE_STORE_DIR, help="評分儲存目錄")
+    parser.add_argument("--rebuild", action="store_true", help="由資料庫重建評分儲存")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"rebuilt {rebuild(args.db, args.dir)} analyses into {args.dir}")
+    print(f"{len(ScoreStore(args.dir))} analyses in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""僅附加的分段 JSONL 回應記錄：依大小輪替分段，每段附帶偏移索引供隨機讀取
+
+用法（於專案根目錄，將舊的 temp/<type>/*.json 壓縮為分段記錄）：
+    python -m src.segment_log --source temp --delete
+"""
+import os
+import re
+import json
+import glob
+import struct
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from config.settings import RESPONSE_LOG_DIR, RESPONSE_SEGMENT_BYTES
+
+try:
+    import fcntl
+except ImportError:  # Windows：僅保證單一行程內的寫入互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_NAME = "segment-{:06d}"
+SEGMENT_RE = re.compile(r'^segment-(\d{6})\.jsonl$')
+LOCK_NAME = "append.lock"
+# 索引項目：(在分段中的位元組偏移, 長度)
+INDEX_ENTRY = struct.Struct("<QI")
+
+Locator = Tuple[int, int]
+
+
+class SegmentLog:
+    """分段 JSONL 記錄；每筆記錄以 (分段編號, 段內序號) 定位"""
+
+    def __init__(self, directory: str = RESPONSE_LOG_DIR, max_segment_bytes: int = RESPONSE_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            segments = self.segments()
+            self._segment = segments[-1] if segments else 1
+            self._open(self._segment)
+
+    @contextmanager
+    def _locked(self):
+        """行程內以 threading.Lock、跨行程以 flock 互斥（多個工作行程寫入同一目錄）"""
+        with self._lock, open(os.path.join(self.directory, LOCK_NAME), "wb") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _path(self, segment: int, suffix: str = ".jsonl") -> str:
+        return os.path.join(self.directory, SEGMENT_NAME.format(segment) + suffix)
+
+    def segments(self) -> List[int]:
+        """目前所有分段編號（由舊到新）"""
+        numbers = [int(match.group(1)) for match in map(SEGMENT_RE.match, os.listdir(self.directory)) if match]
+        return sorted(numbers)
+
+    def _open(self, segment: int) -> None:
+        self._data = open(self._path(segment), "ab")
+        self._index = open(self._path(segment, ".idx"), "ab")
+        self._recover(segment)
+
+    def _recover(self, segment: int) -> None:
+        """索引落後於資料時（例如程序中斷）由資料重建缺少的索引項目；須持有跨行程鎖"""
+        self._data.seek(0, os.SEEK_END)
+        self._index.seek(0, os.SEEK_END)
+        data_size = self._data.tell()
+        entries = self._index.tell() // INDEX_ENTRY.size
+        if entries * INDEX_ENTRY.size != self._index.tell():
+            self._index.truncate(entries * INDEX_ENTRY.size)
+            self._index.seek(0, os.SEEK_END)
+        indexed_end = 0
+        if entries:
+            with open(self._path(segment, ".idx"), "rb") as f:
+                f.seek((entries - 1) * INDEX_ENTRY.size)
+                offset, length = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                indexed_end = offset + length
+        if indexed_end >= data_size:
+            return
+        rebuilt = 0
+        with open(self._path(segment), "rb") as f:
+            f.seek(indexed_end)
+            offset = indexed_end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 不完整的最後一行（寫入中斷）截斷
+                    self._data.truncate(offset)
+                    self._data.seek(0, os.SEEK_END)
+                    break
+                self._index.write(INDEX_ENTRY.pack(offset, len(line)))
+                offset += len(line)
+                rebuilt += 1
+        self._index.flush()
+        logger.warning(f"重建分段 {segment} 的索引: {rebuilt} 筆")
+
+    def _sync(self) -> None:
+        """持有跨行程鎖後對齊其他行程的寫入：切換到最新的分段，並由實際檔尾計算偏移與索引位置"""
+        latest = max(self.segments(), default=self._segment)
+        if latest != self._segment:
+            self._data.close()
+            self._index.close()
+            self._segment = latest
+            self._open(latest)
+        else:
+            self._recover(self._segment)
+
+    def _rotate(self) -> None:
+        self._data.close()
+        self._index.close()
+        self._segment = max(self.segments(), default=self._segment) + 1
+        self._open(self._segment)
+        logger.info(f"回應記錄輪替至分段 {self._segment}")
+
+    def append_many(self, records: Iterable[Dict[str, Any]]) -> List[Locator]:
+        """附加多筆記錄（每筆為一行 JSON），回傳各筆的定位"""
+        locators = []
+        with self._locked():
+            self._sync()
+            for record in records:
+                line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                if self._data.tell() and self._data.tell() + len(line) > self.max_segment_bytes:
+                    self._data.flush()
+                    self._index.flush()
+                    self._rotate()
+                offset = self._data.tell()
+                self._data.write(line)
+                self._index.write(INDEX_ENTRY.pack(offset, len(line)))
+                locators.append((self._segment, self._index.tell() // INDEX_ENTRY.size - 1))
+            # 先寫資料再寫索引，中斷時最多只需由資料重建索引
+            self._data.flush()
+            self._index.flush()
+        return locators
+
+    def append(self, response_type: str, data: Any, created_at: Optional[datetime] = None,
+               image_hash: Optional[str] = None, client_id: Optional[str] = None) -> Locator:
+        return self.append_many([make_record(response_type, data, created_at, image_hash, client_id)])[0]
+
+    def read(self, locator: Locator) -> Dict[str, Any]:
+        """依定位隨機讀取一筆記錄（兩次 seek，不掃描分段）"""
+        segment, number = locator
+        with self._lock:
+            if segment == self._segment:
+                self._data.flush()
+                self._index.flush()
+        with open(self._path(segment, ".idx"), "rb") as f:
+            f.seek(number * INDEX_ENTRY.size)
+            entry = f.read(INDEX_ENTRY.size)
+        if len(entry) != INDEX_ENTRY.size:
+            raise KeyError(f"記錄不存在: {segment}#{number}")
+        offset, length = INDEX_ENTRY.unpack(entry)
+        with open(self._path(segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def iter_records(self, types: Optional[Sequence[str]] = None) -> Iterator[Tuple[Locator, Dict[str, Any]]]:
+        """依寫入順序逐筆讀取 (定位, 記錄)"""
+        with self._lock:
+            self._data.flush()
+        for segment in self.segments():
+            with open(self._path(segment), "rb") as f:
+                for number, line in enumerate(f):
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    if types is None or record.get("type") in types:
+                        yield (segment, number), record
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.close()
+            self._index.close()
+
+
+def make_record(response_type: str, data: Any, created_at: Optional[datetime] = None,
+                image_hash: Optional[str] = None, client_id: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "type": response_type,
+        "created_at": (created_at or datetime.now()).isoformat(timespec="microseconds"),
+        "image_hash": image_hash,
+        "client_id": client_id,
+        "data": data,
+    }
+
+
+def format_locator(directory: str, locator: Locator) -> str:
+    segment, number = locator
+    return f"{os.path.join(directory, SEGMENT_NAME.format(segment))}.jsonl#{number}"
+
+
+_logs: Dict[str, SegmentLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_segment_log(directory: str = RESPONSE_LOG_DIR) -> SegmentLog:
+    """取得（並快取）指定目錄的分段記錄"""
+    log = _logs.get(directory)
+    if log is None:
+        with _logs_lock:
+            log = _logs.get(directory)
+            if log is None:
+                log = _logs[directory] = SegmentLog(directory)
+    return log
+
+
+def _file_timestamp(path: str) -> datetime:
+    """由舊檔名（%Y%m%d_%H%M%S[_%f].json）取得時間，無法解析時使用修改時間"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    for fmt in ("%Y%m%d_%H%M%S_%f", "%Y%m%d_%H%M%S"):
+        try:
+            return datetime.strptime(name, fmt)
+        except ValueError:
+            continue
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def migrate_json_dumps(source: str, log: SegmentLog, delete: bool = False, batch_size: int = 500) -> int:
+    """將 source/<type>/*.json 逐檔轉入分段記錄（依時間排序），回傳轉入筆數"""
+    files = sorted((_file_timestamp(path), path) for path in glob.glob(os.path.join(source, "*", "*.json")))
+
+    migrated = 0
+    for start in range(0, len(files), batch_size):
+        batch, paths = [], []
+        for created_at, path in files[start:start + batch_size]:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"略過無法讀取的檔案 {path}: {str(e)}")
+                continue
+            response_type = os.path.basename(os.path.dirname(path))
+            batch.append(make_record(response_type, data, created_at))
+            paths.append(path)
+        log.append_many(batch)
+        migrated += len(batch)
+        if delete:
+            for path in paths:
+                os.remove(path)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default="temp", help="舊 JSON 檔所在目錄（<source>/<type>/*.json）")
+    parser.add_argument("--dest", default=RESPONSE_LOG_DIR, help="分段記錄目錄")
+    parser.add_argument("--delete", action="store_true", help="轉入後刪除原始檔案")
+    args = parser.parse_args()
+
+    log = SegmentLog(args.dest)
+    migrated = migrate_json_dumps(args.source, log, delete=args.delete)
+    log.close()
+    print(f"migrated {migrated} responses into {len(log.segments())} segment(s) in {args.dest}")
+
+
+if __name__ == "__main__":
+    main()
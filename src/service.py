@@ -0,0 +1,118 @@
+import io
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+from config.settings import HISTORY_PAGE_SIZE
+from src.image_analyzer import ImageAnalyzer
+from src.report_generator import REPORT_TITLE
+from src.blob_store import get_blob_store
+from src.response_logger import get_response_logger
+from src.history import HistoryFilter, HistoryPage, query_history
+from src.warmup import last_timings
+from src.single_flight import analysis_key, get_single_flight
+from src.job_queue import get_job_queue
+from src.skin_metrics import compute_metrics
+from utils.helpers import lazy_import
+
+logger = logging.getLogger(__name__)
+
+# 只處理分析或查詢的工作行程不需載入報告引擎
+report_engine = lazy_import("src.report_engine")
+
+# ImageAnalyzer 支援的模型（GPT-4o 會改用 DeepSeek VL2）
+MODELS = ("DeepSeek VL2", "grok-2-vision-1212", "GPT-4o")
+DEFAULT_MODEL = "DeepSeek VL2"
+
+
+def response_type_for(model: str) -> str:
+    return "grok" if model.startswith("grok") else "deepseek"
+
+
+class AnalysisService:
+    """不依賴 Streamlit 的分析／報告服務
+
+    服務本身不保存會話狀態：圖片存入內容定址儲存、回應寫入共用資料庫，
+    因此可以在 UI 之外獨立啟動多個工作行程水平擴充。
+    """
+
+    def __init__(self, analyzer: Optional[ImageAnalyzer] = None):
+        self._analyzer = analyzer
+        self._analyzer_lock = threading.Lock()
+
+    @property
+    def analyzer(self) -> ImageAnalyzer:
+        # 延遲建立：報告與查詢請求不需要載入人臉偵測模型
+        if self._analyzer is None:
+            with self._analyzer_lock:
+                if self._analyzer is None:
+                    self._analyzer = ImageAnalyzer()
+        return self._analyzer
+
+    def analyze(self, image_bytes: bytes, model: str = DEFAULT_MODEL, client_id: Optional[str] = None,
+                progress: Optional[Callable[[int, str], None]] = None) -> Dict[str, Any]:
+        """分析一張面部照片，回傳 ImageAnalyzer 的結果與圖片雜湊（供後續生成報告）"""
+        if not image_bytes:
+            raise ValueError("Empty image")
+        if model not in MODELS:
+            raise ValueError(f"Unsupported model: {model}")
+
+        image_hash = get_blob_store().put(image_bytes)
+
+        def run() -> Dict[str, Any]:
+            result = self.analyzer.analyze_image(io.BytesIO(image_bytes), model=model, progress=progress)
+            if "error" not in result:
+                get_response_logger().log(response_type_for(model), result["analysis"], image_hash, client_id)
+            return result
+
+        def on_wait() -> None:
+            if progress:
+                progress(10, "相同照片的分析正在進行中，等待結果...")
+
+        # 重複提交同一張照片與模型時只呼叫一次 API（回應也只記錄一次），其他呼叫者共用結果
+        result = get_single_flight().do(analysis_key(image_hash, model), run, on_wait)
+        if "error" in result:
+            # 模型服務無法使用時附上本地指標，呼叫端可改以本地指標繼續
+            result = dict(result, local_metrics=self.preview(image_bytes))
+        return dict(result, image_hash=image_hash)
+
+    @staticmethod
+    def preview(image_bytes: bytes) -> Dict[str, Any]:
+        """本地膚質指標（不呼叫 API，JPEG 約 100 ms 內完成；PNG 等格式另需完整解碼的時間），作為 AI 分析前的即時預覽"""
+        if not image_bytes:
+            raise ValueError("Empty image")
+        try:
+            return compute_metrics(image_bytes).to_dict()
+        except OSError as e:
+            raise ValueError(f"Invalid image: {str(e)}")
+
+    def report(self, analysis_result: Dict[str, Any], layout: str = "premium",
+               image_hash: Optional[str] = None) -> Dict[str, Any]:
+        """由分析結果生成報告 PDF，回傳 {"pdf": bytes, "budget": dict}"""
+        if layout not in report_engine.LAYOUTS:
+            raise ValueError(f"Unknown report layout: {layout}")
+        if not isinstance(analysis_result, dict):
+            raise ValueError("analysis_result must be an object")
+
+        if image_hash:
+            # 生成期間持有圖片引用，避免被容量回收
+            with get_blob_store().hold(image_hash) as image_bytes:
+                if image_bytes is None:
+                    raise ValueError(f"Unknown image: {image_hash}")
+                return self._render(analysis_result, layout, io.BytesIO(image_bytes))
+        return self._render(analysis_result, layout, None)
+
+    @staticmethod
+    def _render(analysis_result: Dict[str, Any], layout: str, photo: Optional[io.BytesIO]) -> Dict[str, Any]:
+        data = report_engine.ReportData.from_analysis_result(analysis_result, photo=photo, title=REPORT_TITLE)
+        pdf_bytes, budget = report_engine.render_with_budget(layout, data)
+        if pdf_bytes is None:
+            raise RuntimeError("报告生成失败")
+        return {"pdf": pdf_bytes, "budget": budget}
+
+    def history(self, filters: HistoryFilter = HistoryFilter(), cursor: Optional[str] = None,
+                limit: int = HISTORY_PAGE_SIZE) -> HistoryPage:
+        return query_history(filters, cursor, limit)
+
+    def health(self) -> Dict[str, Any]:
+        return {"status": "ok", "response_log": get_response_logger().stats(), "jobs": get_job_queue().counts(),
+                "single_flight": get_single_flight().stats(), "warm_up": last_timings()}
@@ -0,0 +1,158 @@
+"""分析服務的 HTTP 介面（標準函式庫，不需 Streamlit），可與 UI 分開部署並啟動多個實例
+
+用法（於專案根目錄）：
+    python -m src.service_http --host 0.0.0.0 --port 8000
+
+端點：
+    GET  /health
+    POST /analyze?model=<模型>&client_id=<客戶編號>   請求主體為圖片檔內容
+    POST /preview                                    本地膚質指標（不呼叫 API），請求主體為圖片檔內容
+    POST /report?layout=premium|standard             請求主體為 JSON {"analysis_result": {...}, "image_hash": "..."}
+    GET  /history?since=&until=&type=&model=&client_id=&image_hash=&min_score=&max_score=&cursor=&limit=
+"""
+import json
+import logging
+import argparse
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit, parse_qs
+from config.settings import SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_UPLOAD_MB, HISTORY_PAGE_SIZE, WARM_UP_ON_START
+from src.service import AnalysisService, DEFAULT_MODEL
+from src.history import HistoryFilter
+from src.warmup import default_steps, run_warm_up
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = SERVICE_MAX_UPLOAD_MB * 1024 * 1024
+
+
+class BodyTooLarge(ValueError):
+    """請求主體超過上限；主體未讀取，回應 413 後關閉連線"""
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """將 HTTP 請求轉給 AnalysisService；錯誤輸入回傳 400，主體過大回傳 413，其餘例外回傳 500"""
+
+    service: AnalysisService
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        self._send(status, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"),
+                   "application/json; charset=utf-8")
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise BodyTooLarge(f"Request body exceeds {SERVICE_MAX_UPLOAD_MB} MB")
+        return self.rfile.read(length)
+
+    def _dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        handler = getattr(self, f"_{method}_{url.path.strip('/') or 'index'}", None)
+        if handler is None:
+            self._send_json(404, {"error": f"Not found: {method.upper()} {url.path}"})
+            return
+        try:
+            handler(params)
+        except BodyTooLarge as e:
+            # 未讀取的主體仍留在連線上，不能沿用 keep-alive 處理下一個請求
+            self.close_connection = True
+            self._send(413, json.dumps({"error": str(e)}).encode("utf-8"), "application/json; charset=utf-8",
+                       {"Connection": "close"})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"服務請求失敗 {method.upper()} {url.path}: {str(e)}", exc_info=True)
+            self._send_json(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._dispatch("get")
+
+    def do_POST(self):
+        self._dispatch("post")
+
+    def _get_health(self, params: Dict[str, str]) -> None:
+        self._send_json(200, self.service.health())
+
+    def _post_analyze(self, params: Dict[str, str]) -> None:
+        result = self.service.analyze(self._body(), params.get("model", DEFAULT_MODEL), params.get("client_id"))
+        self._send_json(200, result)
+
+    def _post_preview(self, params: Dict[str, str]) -> None:
+        self._send_json(200, self.service.preview(self._body()))
+
+    def _post_report(self, params: Dict[str, str]) -> None:
+        try:
+            request = json.loads(self._body() or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON body: {str(e)}")
+        artifact = self.service.report(request.get("analysis_result"), params.get("layout", "premium"),
+                                       request.get("image_hash"))
+        budget = artifact["budget"] or {}
+        self._send(200, artifact["pdf"], "application/pdf", {
+            "Content-Disposition": 'attachment; filename="report.pdf"',
+            # 標頭只能是 ASCII，中文標籤以跳脫字元傳送
+            "X-Report-Budget": json.dumps(budget),
+        })
+
+    def _get_history(self, params: Dict[str, str]) -> None:
+        def number(name: str) -> Optional[float]:
+            return float(params[name]) if name in params else None
+
+        filters = HistoryFilter(
+            since=params.get("since"),
+            until=params.get("until"),
+            response_type=params.get("type"),
+            model=params.get("model"),
+            image_hash=params.get("image_hash"),
+            client_id=params.get("client_id"),
+            min_score=number("min_score"),
+            max_score=number("max_score"),
+        )
+        page = self.service.history(filters, params.get("cursor"), int(params.get("limit", HISTORY_PAGE_SIZE)))
+        self._send_json(200, asdict(page))
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+def create_server(host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+                  service: Optional[AnalysisService] = None) -> ThreadingHTTPServer:
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service or AnalysisService()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = AnalysisService()
+    if WARM_UP_ON_START:
+        # 開始接受請求前完成預熱，第一個請求與之後的請求一樣快
+        run_warm_up(default_steps(analyzer=lambda: service.analyzer))
+    server = create_server(args.host, args.port, service)
+    logger.info(f"分析服務啟動: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Single-flight：相同鍵的並行請求只執行一次，其他呼叫者等待並共用結果
+
+用於避免重複點擊「開始分析」或多個分頁對同一張照片重複呼叫 Grok／DeepSeek／Replicate。
+同一行程內的呼叫者等待執行中的呼叫；啟用跨行程模式時，另以回應資料庫的 flights 表作為鎖，
+由持有者寫回成功的結果（保留 SINGLE_FLIGHT_RESULT_TTL 秒），其他行程輪詢取得；含 "error" 的失敗結果不保留。
+持有者執行期間定期延長鎖的期限；持有者中斷時鎖在 lease_seconds 後逾期，由等待中的行程接手執行。
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+from config.settings import (
+    RESPONSES_DB, STRUCTURED_OUTPUT, SINGLE_FLIGHT_SHARED, SINGLE_FLIGHT_LEASE_SECONDS,
+    SINGLE_FLIGHT_RESULT_TTL, SINGLE_FLIGHT_POLL_INTERVAL,
+)
+from src.analysis_schema import PROMPT_VERSION
+from src.score_extractor import response_hash
+from src.storage import get_response_store
+
+logger = logging.getLogger(__name__)
+
+# 跨行程鎖的狀態
+ACQUIRED = "acquired"
+RUNNING = "running"
+FINISHED = "finished"
+
+
+def analysis_key(image_hash: str, model: str) -> str:
+    """分析請求的 single-flight 鍵：(圖片雜湊, 模型, 提示詞版本)；結構化輸出模式使用不同的提示詞"""
+    return response_hash("analysis", image_hash, model, str(PROMPT_VERSION), str(STRUCTURED_OUTPUT))
+
+
+class _Call:
+    """同一行程內執行中的呼叫"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """以鍵合併並行呼叫；跨行程共用的結果須可序列化為 JSON"""
+
+    def __init__(self, db_path: str = RESPONSES_DB, shared: bool = SINGLE_FLIGHT_SHARED,
+                 lease_seconds: float = SINGLE_FLIGHT_LEASE_SECONDS, result_ttl: float = SINGLE_FLIGHT_RESULT_TTL,
+                 poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL):
+        self.store = get_response_store(db_path) if shared else None
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "shared": 0}
+
+    def do(self, key: str, fn: Callable[[], Any], on_wait: Optional[Callable[[], None]] = None) -> Any:
+        """執行 fn 並回傳結果；相同鍵已在執行中時等待並共用其結果（on_wait 於開始等待時呼叫一次）"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            logger.info(f"相同請求執行中，等待共用結果: {key[:12]}")
+            if on_wait:
+                on_wait()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn, on_wait)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run(self, key: str, fn: Callable[[], Any], on_wait: Optional[Callable[[], None]]) -> Any:
+        if self.store is None:
+            with self._lock:
+                self._stats["calls"] += 1
+            return fn()
+
+        waiting = False
+        while True:
+            state, result = self._acquire(key)
+            if state == ACQUIRED:
+                break
+            if state == FINISHED:
+                with self._lock:
+                    self._stats["shared"] += 1
+                return result
+            if not waiting:
+                waiting = True
+                logger.info(f"相同請求在其他行程執行中，等待共用結果: {key[:12]}")
+                if on_wait:
+                    on_wait()
+            time.sleep(self.poll_interval)
+
+        with self._lock:
+            self._stats["calls"] += 1
+        # fn 執行期間定期延長鎖的期限，避免呼叫超過 lease_seconds 時被其他行程重複接手
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(key, stop), daemon=True,
+                                   name=f"single-flight-lease-{key[:12]}")
+        renewer.start()
+        try:
+            result = fn()
+        except BaseException:
+            # 釋放鎖，等待中的行程立即接手
+            self._release(key)
+            raise
+        finally:
+            stop.set()
+            renewer.join()
+        if isinstance(result, dict) and "error" in result:
+            # 失敗結果不共用：釋放鎖，下一個呼叫者（重新分析、工作重試）重新呼叫供應商
+            self._release(key)
+        else:
+            self._publish(key, result)
+        return result
+
+    def _renew(self, key: str, stop: threading.Event) -> None:
+        """每隔三分之一個期限延長持有中的鎖，直到 stop 被設定；行程中斷時鎖照常逾期"""
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                with self.store.transaction() as conn:
+                    renewed = conn.execute(
+                        "UPDATE flights SET lease_until = ? WHERE key = ? AND owner = ? AND finished_at IS NULL",
+                        (time.time() + self.lease_seconds, key, self.owner)).rowcount
+            except Exception as e:
+                logger.error(f"延長 single-flight 鎖失敗: {str(e)}")
+                continue
+            if not renewed:
+                logger.warning(f"single-flight 鎖已被其他行程接手: {key[:12]}")
+                return
+
+    def _acquire(self, key: str) -> Tuple[str, Any]:
+        """嘗試取得跨行程鎖，回傳 (狀態, 已完成的結果)"""
+        now = time.time()
+        with self.store.transaction() as conn:
+            row = conn.execute("SELECT lease_until, result, finished_at FROM flights WHERE key = ?",
+                               (key,)).fetchone()
+            if row:
+                lease_until, result, finished_at = row
+                if finished_at is not None and finished_at >= now - self.result_ttl:
+                    return FINISHED, json.loads(result)
+                if finished_at is None and lease_until >= now:
+                    return RUNNING, None
+                if finished_at is None:
+                    logger.warning(f"single-flight 鎖逾期，接手執行: {key[:12]}")
+            # 順帶清除過期的鎖與結果
+            conn.execute("DELETE FROM flights WHERE COALESCE(finished_at + ?, lease_until) < ?",
+                         (self.result_ttl, now))
+            conn.execute("INSERT OR REPLACE INTO flights (key, owner, lease_until, result, finished_at) "
+                         "VALUES (?, ?, ?, NULL, NULL)", (key, self.owner, now + self.lease_seconds))
+        return ACQUIRED, None
+
+    def _publish(self, key: str, result: Any) -> None:
+        try:
+            payload = json.dumps(result, ensure_ascii=False, default=str)
+            with self.store.transaction() as conn:
+                conn.execute("UPDATE flights SET result = ?, finished_at = ? WHERE key = ? AND owner = ?",
+                             (payload, time.time(), key, self.owner))
+        except Exception as e:
+            # 結果已取得，寫回失敗只影響其他行程（鎖逾期後自行執行）
+            logger.error(f"寫入 single-flight 結果失敗: {str(e)}")
+            self._release(key)
+
+    def _release(self, key: str) -> None:
+        try:
+            with self.store.transaction() as conn:
+                conn.execute("DELETE FROM flights WHERE key = ? AND owner = ? AND finished_at IS NULL",
+                             (key, self.owner))
+        except Exception as e:
+            logger.error(f"釋放 single-flight 鎖失敗: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """calls：實際執行次數；coalesced：同一行程內合併的呼叫；shared：取用其他行程結果的呼叫"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(db_path: str = RESPONSES_DB) -> SingleFlight:
+    """取得（並快取）指定資料庫的 single-flight 協調器"""
+    flight = _flights.get(db_path)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.get(db_path)
+            if flight is None:
+                flight = _flights[db_path] = SingleFlight(db_path)
+    return flight
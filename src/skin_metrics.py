@@ -0,0 +1,257 @@
+"""本地膚質指標：不呼叫任何 API，以 CPU 在偵測到的面部區域計算紋理、泛紅、色素不均、油光與毛孔指標
+
+遠端模型回應前的即時預覽，以及模型服務緩慢或無法使用時的備援（一張照片約 50-150 ms）。
+指標為影像統計的相對估計；換算為 0-5 分（5 分最佳）的基準值依室內補光的正面照片設定，並非臨床量測。
+
+用法（於專案根目錄）：
+    python -m src.skin_metrics photo.jpg [photo2.jpg ...]
+"""
+import io
+import json
+import time
+import logging
+import argparse
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple, Union
+import numpy as np
+from PIL import Image, ImageOps
+from src.analysis_schema import render_analysis
+from src.score_extractor import OVERALL
+from src.blob_store import get_blob_store
+from utils.helpers import lazy_import
+
+cv2 = lazy_import("cv2")
+image_analyzer = lazy_import("src.image_analyzer")
+
+logger = logging.getLogger(__name__)
+
+# 人臉偵測前縮小到此長邊（像素）；指標在裁切後的臉部以固定臉寬計算，與原圖解析度無關
+DETECT_SIZE = 512
+FACE_WIDTH = 400
+# Image.reduce 支援的模式（調色盤等其他模式先轉為 RGB）
+REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA", "I", "F")
+
+METRIC_LABELS = {
+    "texture": "紋理",
+    "redness": "泛紅",
+    "pigmentation": "色素不均",
+    "shine": "油光",
+    "pores": "毛孔",
+}
+# 原始指標的 (最佳, 最差) 基準值，線性換算為 0-5 分
+METRIC_RANGES = {
+    "texture": (3.0, 12.0),        # 拉普拉斯能量（灰階二階導數的均方根）
+    "redness": (6.0, 22.0),        # CIELAB a* 平均（8 位元，已減去 128）
+    "pigmentation": (1.5, 6.0),    # 去除光照後的 L* 標準差
+    "shine": (0.0, 0.06),          # 高亮低飽和（鏡面反光）像素比例
+    "pores": (0.01, 0.10),         # 小尺度暗點（黑帽運算）像素比例
+}
+# 對應到分析評分維度（見 score_extractor.DIMENSIONS）；緊致度無法由單張影像統計估計
+DIMENSION_METRICS = {
+    "皮膚狀況": ("redness", "shine"),
+    "皺紋": ("texture",),
+    "色斑": ("pigmentation",),
+    "其他特徵": ("pores",),
+}
+# 臉框（左, 上, 寬, 高）的相對位置：區域 → 一或多個 (x0, y0, x1, y1)，避開眼睛與嘴唇
+REGION_BOXES = {
+    "額頭": ((0.30, -0.05, 0.70, 0.08),),
+    "頰骨": ((0.12, 0.42, 0.30, 0.62), (0.70, 0.42, 0.88, 0.62)),
+    "鼻子": ((0.44, 0.32, 0.56, 0.48),),
+    "下巴": ((0.38, 0.75, 0.62, 0.86),),
+}
+# 沒有偵測到人臉時，以照片中央區域計算整體指標
+CENTER_BOX = (0.25, 0.2, 0.75, 0.8)
+
+
+@dataclass(frozen=True)
+class SkinMetrics:
+    """一張照片的本地指標：各區域的原始值與 0-5 分"""
+    # 區域 → 指標 → 原始值
+    raw: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # 區域 → 指標 → 0-5 分
+    scores: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    face_found: bool = False
+    seconds: float = 0.0
+
+    def metric_average(self, metric: str) -> Optional[float]:
+        """某一指標在所有區域的平均分"""
+        values = [scores[metric] for scores in self.scores.values() if metric in scores]
+        return round(sum(values) / len(values), 1) if values else None
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """各指標的平均分（介面預覽與雷達圖使用）"""
+        return {metric: self.metric_average(metric) for metric in METRIC_LABELS}
+
+    def dimension_scores(self, region: str) -> Dict[str, float]:
+        """區域的分析維度評分（格式與模型的結構化分析一致）"""
+        scores = self.scores.get(region, {})
+        return {dimension: round(sum(scores[m] for m in metrics) / len(metrics), 1)
+                for dimension, metrics in DIMENSION_METRICS.items() if all(m in scores for m in metrics)}
+
+    def to_structured(self) -> Dict[str, Any]:
+        """轉為 ANALYSIS_SCHEMA 格式的結構化分析，可直接用於報告圖表與評分解析"""
+        averages = '，'.join(f"{METRIC_LABELS[metric]} {score}/5"
+                            for metric, score in self.summary().items() if score is not None)
+        prefix = "本地影像指標初步評估（非 AI 分析）" if self.face_found else "未偵測到人臉，以照片中央區域估計"
+        return {
+            "summary": f"{prefix}：{averages}",
+            "regions": [
+                {
+                    "region": region,
+                    "scores": self.dimension_scores(region),
+                    "note": '，'.join(f"{METRIC_LABELS[metric]} {score}"
+                                     for metric, score in self.scores[region].items()),
+                }
+                for region in self.scores
+            ],
+        }
+
+    def to_analysis(self) -> Dict[str, Any]:
+        """模型無法使用時的備援分析結果（與 ImageAnalyzer 的 analysis 欄位格式相同）"""
+        structured = self.to_structured()
+        return {"model": "本地影像指標", "result": render_analysis(structured), "structured": structured}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "face_found": self.face_found,
+            "seconds": round(self.seconds, 3),
+            "summary": self.summary(),
+            "scores": self.scores,
+            "raw": self.raw,
+        }
+
+
+def _score(metric: str, value: float) -> float:
+    best, worst = METRIC_RANGES[metric]
+    return round(float(np.clip((worst - value) / (worst - best), 0, 1)) * 5, 1)
+
+
+def _face_crop(rgb: np.ndarray) -> Tuple[np.ndarray, Optional[Tuple[int, int, int, int]]]:
+    """偵測人臉並裁切（含邊界）、縮放到固定臉寬；回傳 (臉部影像, 臉框)，沒有人臉時臉框為 None"""
+    height, width = rgb.shape[:2]
+    scale = min(1.0, DETECT_SIZE / max(height, width))
+    small = cv2.resize(rgb, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    faces = image_analyzer.get_face_detector()(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY))
+    if not faces:
+        x0, y0, x1, y1 = CENTER_BOX
+        crop = rgb[int(y0 * height):int(y1 * height), int(x0 * width):int(x1 * width)]
+        zoom = FACE_WIDTH / crop.shape[1]
+        return cv2.resize(crop, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_AREA), None
+
+    face = max(faces, key=lambda rect: rect.width() * rect.height())
+    left, top, face_width, face_height = (value / scale for value in
+                                          (face.left(), face.top(), face.width(), face.height()))
+    # 額頭在臉框上方、下巴在臉框下緣附近，上下各多裁 20%
+    crop_top = max(0, int(top - 0.2 * face_height))
+    crop_left = max(0, int(left))
+    crop = rgb[crop_top:min(height, int(top + 1.2 * face_height)), crop_left:min(width, int(left + face_width))]
+    zoom = FACE_WIDTH / face_width
+    interpolation = cv2.INTER_AREA if zoom < 1 else cv2.INTER_LINEAR
+    box = (round((left - crop_left) * zoom), round((top - crop_top) * zoom),
+           round(face_width * zoom), round(face_height * zoom))
+    return cv2.resize(crop, None, fx=zoom, fy=zoom, interpolation=interpolation), box
+
+
+def _metric_maps(face: np.ndarray) -> Dict[str, np.ndarray]:
+    """整張臉部影像的逐像素指標（向量化計算一次，各區域再取平均）"""
+    gray = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY).astype(np.float32)
+    lab = cv2.cvtColor(face, cv2.COLOR_RGB2LAB).astype(np.float32)
+    hsv = cv2.cvtColor(face, cv2.COLOR_RGB2HSV)
+
+    # 紋理：輕微平滑去除感光雜訊後的拉普拉斯能量
+    laplacian = cv2.Laplacian(cv2.GaussianBlur(gray, (3, 3), 0), cv2.CV_32F)
+    # 色素不均：以大尺度模糊估計光照後相減，保留斑點尺度的明暗變化
+    lightness = lab[:, :, 0] * (100 / 255)
+    detail = cv2.GaussianBlur(lightness, (0, 0), 1.5) - cv2.GaussianBlur(lightness, (0, 0), 12)
+    # 油光：高亮且低飽和的鏡面反光
+    specular = (hsv[:, :, 2] >= 230) & (hsv[:, :, 1] <= 40)
+    # 毛孔：比周圍暗的小點（黑帽運算）
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    dark_spots = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel) > 8
+    return {
+        "texture": laplacian * laplacian,
+        "redness": lab[:, :, 1] - 128,
+        "pigmentation": detail,
+        "shine": specular.astype(np.float32),
+        "pores": dark_spots.astype(np.float32),
+    }
+
+
+def _region_slices(shape: Tuple[int, int], box: Optional[Tuple[int, int, int, int]]):
+    height, width = shape
+    if box is None:
+        yield OVERALL, (slice(0, height), slice(0, width))
+        return
+    left, top, face_width, face_height = box
+    for region, parts in REGION_BOXES.items():
+        for x0, y0, x1, y1 in parts:
+            rows = slice(max(0, int(top + y0 * face_height)), min(height, int(top + y1 * face_height)))
+            cols = slice(max(0, int(left + x0 * face_width)), min(width, int(left + x1 * face_width)))
+            if rows.stop - rows.start > 4 and cols.stop - cols.start > 4:
+                yield region, (rows, cols)
+
+
+def compute_metrics(image: Union[Image.Image, np.ndarray, bytes]) -> SkinMetrics:
+    """計算一張照片的本地膚質指標（PIL 影像、RGB 陣列或圖片位元組）"""
+    start = time.perf_counter()
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    if isinstance(image, Image.Image):
+        # JPEG 直接以縮小的比例解碼（不小於所需臉寬的兩倍），大幅減少解碼時間
+        image.draft("RGB", (FACE_WIDTH * 2, FACE_WIDTH * 2))
+        # PNG、WebP 等格式無法縮小解碼：解碼後先以整數倍縮小，方向校正與色彩轉換只處理縮小後的影像
+        factor = min(image.size) // (FACE_WIDTH * 2)
+        if factor > 1:
+            if image.mode not in REDUCIBLE_MODES:
+                image = image.convert("RGB")
+            image = image.reduce(factor)
+        image = np.asarray(ImageOps.exif_transpose(image).convert("RGB"))
+
+    face, box = _face_crop(image)
+    maps = _metric_maps(face)
+
+    # 同一區域的多個區塊（例如左右頰）合併計算
+    pixels: Dict[str, Dict[str, list]] = {}
+    for region, (rows, cols) in _region_slices(face.shape[:2], box):
+        for metric, values in maps.items():
+            pixels.setdefault(region, {}).setdefault(metric, []).append(values[rows, cols].ravel())
+
+    raw: Dict[str, Dict[str, float]] = {}
+    for region, metrics in pixels.items():
+        values = {metric: np.concatenate(parts) for metric, parts in metrics.items()}
+        raw[region] = {
+            "texture": float(np.sqrt(values["texture"].mean())),
+            "redness": float(values["redness"].mean()),
+            "pigmentation": float(values["pigmentation"].std()),
+            "shine": float(values["shine"].mean()),
+            "pores": float(values["pores"].mean()),
+        }
+    scores = {region: {metric: _score(metric, value) for metric, value in metrics.items()}
+              for region, metrics in raw.items()}
+    raw = {region: {metric: round(value, 4) for metric, value in metrics.items()} for region, metrics in raw.items()}
+    return SkinMetrics(raw, scores, box is not None, time.perf_counter() - start)
+
+
+@lru_cache(maxsize=64)
+def metrics_for_blob(digest: str) -> Optional[SkinMetrics]:
+    """內容定址儲存中圖片的本地指標（雜湊即內容，結果可直接快取）；圖片不存在時回傳 None"""
+    image_bytes = get_blob_store().get(digest)
+    return compute_metrics(image_bytes) if image_bytes is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="+", help="照片路徑")
+    args = parser.parse_args()
+
+    for path in args.images:
+        with open(path, "rb") as f:
+            metrics = compute_metrics(f.read())
+        print(f"{path}: {metrics.seconds * 1000:.0f} ms")
+        print(json.dumps(metrics.to_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+import json
+import zlib
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from src.score_extractor import ScoreSheet, extract_scores
+from src.score_store import SCORED_TYPES, get_score_store
+from utils.helpers import response_content
+from config.settings import (
+    RESPONSES_DB, DB_POOL_SIZE, DB_BUSY_TIMEOUT,
+    RESPONSE_RETENTION_DAYS, RESPONSE_COMPACT_INTERVAL, RESPONSE_COMPRESSION_LEVEL,
+)
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZLIB = "zlib"
+MIGRATION_BATCH = 500
+
+
+def _compress_legacy_rows(conn: sqlite3.Connection) -> None:
+    """將舊版未壓縮的 response_data 轉為壓縮 payload"""
+    while True:
+        rows = conn.execute(
+            "SELECT id, response_data FROM api_responses "
+            "WHERE payload IS NULL AND response_data IS NOT NULL LIMIT ?", (MIGRATION_BATCH,)).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE api_responses SET payload = ?, codec = ?, payload_size = ?, response_data = NULL WHERE id = ?",
+            [(*_compress(text), len(text.encode('utf-8')), row_id) for row_id, text in rows])
+
+
+def _analyze(data: Any) -> Tuple[Optional[str], Optional[ScoreSheet]]:
+    """取得回應的模型名稱與結構化評分"""
+    model = data.get("model") if isinstance(data, dict) else None
+    content = response_content(data)
+    return model, extract_scores(content) if content else None
+
+
+def _overall_score(response_type: str, sheet: Optional[ScoreSheet]) -> Optional[float]:
+    """歷史查詢的評分欄位：只有評分類型（SCORED_TYPES）的回應有分數，報告中的數字不是臉部評分"""
+    score = sheet.overall_average() if sheet and response_type in SCORED_TYPES else None
+    return None if score is None else round(score, 2)
+
+
+def _summary(response_type: str, data: Any) -> Tuple[Optional[str], Optional[float]]:
+    """歷史查詢用的摘要欄位：(模型名稱, 整體平均分)"""
+    model, sheet = _analyze(data)
+    return model, _overall_score(response_type, sheet)
+
+
+def _backfill_summary(conn: sqlite3.Connection) -> None:
+    """為既有回應補上模型與評分摘要"""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, response_type, payload, codec, response_data FROM api_responses "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, MIGRATION_BATCH)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row_id, response_type, payload, codec, legacy in rows:
+            try:
+                data = json.loads(_decompress(payload, codec, legacy) or "null")
+            except ValueError:
+                data = None
+            updates.append((*_summary(response_type, data), row_id))
+        conn.executemany("UPDATE api_responses SET model = ?, score = ? WHERE id = ?", updates)
+        last_id = rows[-1][0]
+
+
+def _clear_unscored(conn: sqlite3.Connection) -> None:
+    """清除非評分類型回應的分數（先前的補值對所有類型都計算了分數）"""
+    conn.execute(f"UPDATE api_responses SET score = NULL WHERE score IS NOT NULL AND "
+                 f"response_type NOT IN ({','.join('?' for _ in SCORED_TYPES)})", SCORED_TYPES)
+
+
+def _create_blob_tables(conn: sqlite3.Connection) -> None:
+    """圖片儲存的中繼資料表；分析記錄以 image_hash 引用圖片，由觸發器維護參照數"""
+    # 觸發器本體含分號，逐句執行而不以分號切割
+    for statement in (
+        """CREATE TABLE IF NOT EXISTS blobs (
+               digest TEXT PRIMARY KEY,
+               size INTEGER NOT NULL,
+               refcount INTEGER NOT NULL DEFAULT 0,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               last_used TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+           ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_blobs_gc ON blobs (refcount, last_used)",
+        """CREATE TRIGGER IF NOT EXISTS blob_ref_insert AFTER INSERT ON api_responses
+           WHEN new.image_hash IS NOT NULL
+           BEGIN UPDATE blobs SET refcount = refcount + 1 WHERE digest = new.image_hash; END""",
+        """CREATE TRIGGER IF NOT EXISTS blob_ref_delete AFTER DELETE ON api_responses
+           WHEN old.image_hash IS NOT NULL
+           BEGIN UPDATE blobs SET refcount = refcount - 1 WHERE digest = old.image_hash; END""",
+    ):
+        conn.execute(statement)
+
+
+def _create_job_tables(conn: sqlite3.Connection) -> None:
+    """持久化的任務佇列（見 src/job_queue.py）；任務存在期間引用其圖片，避免排隊中的圖片被回收"""
+    for statement in (
+        # 時間欄位為 epoch 秒（租約到期以工作行程的時鐘比較）
+        """CREATE TABLE IF NOT EXISTS jobs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               kind TEXT NOT NULL,
+               dedup_key TEXT,
+               payload TEXT NOT NULL,
+               image_hash TEXT,
+               state TEXT NOT NULL DEFAULT 'queued',
+               attempts INTEGER NOT NULL DEFAULT 0,
+               max_attempts INTEGER NOT NULL,
+               available_at REAL NOT NULL,
+               lease_owner TEXT,
+               lease_until REAL,
+               progress INTEGER NOT NULL DEFAULT 0,
+               message TEXT,
+               result TEXT,
+               artifact BLOB,
+               error TEXT,
+               created_at REAL NOT NULL,
+               finished_at REAL
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (state, kind, available_at)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (state, lease_until)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (kind, dedup_key)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)",
+        """CREATE TRIGGER IF NOT EXISTS blob_ref_job_insert AFTER INSERT ON jobs
+           WHEN new.image_hash IS NOT NULL
+           BEGIN UPDATE blobs SET refcount = refcount + 1 WHERE digest = new.image_hash; END""",
+        """CREATE TRIGGER IF NOT EXISTS blob_ref_job_delete AFTER DELETE ON jobs
+           WHEN old.image_hash IS NOT NULL
+           BEGIN UPDATE blobs SET refcount = refcount - 1 WHERE digest = old.image_hash; END""",
+    ):
+        conn.execute(statement)
+
+
+# 依序套用的結構遷移（SQL 或接收連線的函式）；PRAGMA user_version 記錄已套用的版本
+MIGRATIONS = [
+    # 1: 原有的回應表
+    """
+    CREATE TABLE IF NOT EXISTS api_responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        response_type TEXT,
+        response_data TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 2: 依類型與時間查詢的索引
+    """
+    CREATE INDEX IF NOT EXISTS idx_api_responses_type_created
+        ON api_responses (response_type, created_at);
+    """,
+    # 3: 壓縮 payload 與圖片雜湊欄位（response_data 僅保留給舊資料）
+    """
+    ALTER TABLE api_responses ADD COLUMN payload BLOB;
+    ALTER TABLE api_responses ADD COLUMN codec TEXT;
+    ALTER TABLE api_responses ADD COLUMN payload_size INTEGER;
+    ALTER TABLE api_responses ADD COLUMN image_hash TEXT;
+    CREATE INDEX IF NOT EXISTS idx_api_responses_created ON api_responses (created_at);
+    CREATE INDEX IF NOT EXISTS idx_api_responses_image_hash ON api_responses (image_hash);
+    """,
+    # 4: 壓縮既有資料
+    _compress_legacy_rows,
+    # 5: 歷史查詢摘要欄位；以涵蓋索引取代單欄索引（依時間倒序的鍵集分頁不需回表）
+    """
+    ALTER TABLE api_responses ADD COLUMN model TEXT;
+    ALTER TABLE api_responses ADD COLUMN score REAL;
+    DROP INDEX IF EXISTS idx_api_responses_type_created;
+    DROP INDEX IF EXISTS idx_api_responses_created;
+    DROP INDEX IF EXISTS idx_api_responses_image_hash;
+    CREATE INDEX IF NOT EXISTS idx_history_created
+        ON api_responses (created_at, id, response_type, model, image_hash, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_type
+        ON api_responses (response_type, created_at, id, model, image_hash, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_model
+        ON api_responses (model, created_at, id, response_type, image_hash, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_image_hash
+        ON api_responses (image_hash, created_at, id, response_type, model, score, payload_size);
+    """,
+    # 6: 補上既有回應的摘要
+    _backfill_summary,
+    # 7: 客戶編號（回訪客戶的前後對比）；涵蓋索引加入客戶欄位
+    """
+    ALTER TABLE api_responses ADD COLUMN client_id TEXT;
+    DROP INDEX IF EXISTS idx_history_created;
+    DROP INDEX IF EXISTS idx_history_type;
+    DROP INDEX IF EXISTS idx_history_model;
+    DROP INDEX IF EXISTS idx_history_image_hash;
+    CREATE INDEX IF NOT EXISTS idx_history_created
+        ON api_responses (created_at, id, response_type, model, image_hash, client_id, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_type
+        ON api_responses (response_type, created_at, id, model, image_hash, client_id, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_model
+        ON api_responses (model, created_at, id, response_type, image_hash, client_id, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_image_hash
+        ON api_responses (image_hash, created_at, id, response_type, model, client_id, score, payload_size);
+    CREATE INDEX IF NOT EXISTS idx_history_client
+        ON api_responses (client_id, created_at, id, response_type, model, image_hash, score, payload_size);
+    """,
+    # 8: 內容定址圖片儲存的中繼資料與參照計數
+    _create_blob_tables,
+    # 9: 分析與報告任務佇列
+    _create_job_tables,
+    # 10: 跨行程的 single-flight 鎖與結果（見 src/single_flight.py）
+    """
+    CREATE TABLE IF NOT EXISTS flights (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        lease_until REAL NOT NULL,
+        result TEXT,
+        finished_at REAL
+    );
+    """,
+    # 11: 報告（DeepSeek）中的數字不是臉部評分，歷史查詢的分數只保留評分類型
+    _clear_unscored,
+]
+
+FETCH_SIZE = 256
+METADATA_COLUMNS = "id, response_type, created_at, image_hash, client_id, model, score, payload_size"
+
+
+def _compress(text: str) -> Tuple[bytes, str]:
+    return zlib.compress(text.encode('utf-8'), RESPONSE_COMPRESSION_LEVEL), CODEC_ZLIB
+
+
+def _decompress(payload: Optional[bytes], codec: Optional[str], legacy: Optional[str]) -> Optional[str]:
+    if payload is None:
+        return legacy
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    raise ValueError(f"Unknown payload codec: {codec}")
+
+
+def decode_payload(payload: Optional[bytes], codec: Optional[str], legacy: Optional[str]) -> Any:
+    """解壓並解析一筆回應（payload、codec、response_data 欄位）"""
+    text = _decompress(payload, codec, legacy)
+    return None if text is None else json.loads(text)
+
+
+class ResponseStore:
+    """API 回應的 SQLite 儲存：WAL 模式、執行緒安全的連線池、壓縮 payload 與批次寫入"""
+
+    def __init__(self, db_path: str = RESPONSES_DB, pool_size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        self._migrate()
+        self._compactor: Optional[threading.Thread] = None
+        self._stop_compaction = threading.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+                               isolation_level=None)
+        # WAL：讀寫互不阻塞；NORMAL 在 WAL 下只於檢查點同步，仍可保證資料庫一致
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """從連線池借出連線，用畢歸還"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """以 BEGIN IMMEDIATE 開始交易，成功時提交，例外時回滾"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _migrate(self) -> None:
+        """套用尚未執行的結構遷移（每個行程啟動時執行一次）"""
+        with self.connection() as conn:
+            # 增量 VACUUM 需在建表前設定；既有資料庫需以一次完整 VACUUM 轉換
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                logger.info(f"資料庫改用增量 VACUUM: {self.db_path}")
+
+        with self.transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for statement in filter(str.strip, migration.split(";")):
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={number}")
+                logger.info(f"資料庫遷移至版本 {number}: {self.db_path}")
+
+    @staticmethod
+    def _row(response_type: str, response_data: Any, image_hash: Optional[str] = None,
+             client_id: Optional[str] = None) -> Tuple[Tuple, Optional[ScoreSheet]]:
+        if isinstance(response_data, str):
+            text = response_data
+            try:
+                response_data = json.loads(text)
+            except ValueError:
+                pass
+        else:
+            text = json.dumps(response_data, ensure_ascii=False)
+        payload, codec = _compress(text)
+        model, sheet = _analyze(response_data)
+        row = (response_type, payload, codec, len(text.encode('utf-8')), image_hash, client_id, model,
+               _overall_score(response_type, sheet))
+        return row, sheet
+
+    _INSERT = ("INSERT INTO api_responses "
+               "(response_type, payload, codec, payload_size, image_hash, client_id, model, score) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id, created_at")
+
+    def save(self, response_type: str, response_data: Any, image_hash: Optional[str] = None,
+             client_id: Optional[str] = None) -> int:
+        """儲存一筆回應，回傳記錄 ID"""
+        return self.save_many([(response_type, response_data, image_hash, client_id)])[0]
+
+    def save_many(self, records: Iterable[Tuple]) -> List[int]:
+        """在單一交易中批次儲存多筆 (類型, 回應[, 圖片雜湊[, 客戶編號]])，回傳記錄 ID"""
+        rows = [self._row(*record) for record in records]
+        if not rows:
+            return []
+        with self.transaction() as conn:
+            inserted = [conn.execute(self._INSERT, row).fetchall()[0] for row, _ in rows]
+            # 有評分的分析同時附加到欄式評分儲存（以記錄 ID 為分析 ID）；在寫入交易內附加，
+            # 資料庫的寫入鎖使各行程依 ID 遞增順序附加，評分儲存才能以二分搜尋定位
+            scored = [(row_id, created_at, row[5], sheet)
+                      for (row_id, created_at), (row, sheet) in zip(inserted, rows)
+                      if row[0] in SCORED_TYPES and sheet and sheet.scores]
+            if scored:
+                try:
+                    get_score_store().append_many(scored)
+                except Exception as e:
+                    logger.error(f"寫入評分儲存失敗: {str(e)}")
+        return [row_id for row_id, _ in inserted]
+
+    def iter_responses(self, types: Optional[Sequence[str]] = None,
+                       fetch_size: int = FETCH_SIZE) -> Iterator[Tuple[int, str, str, Optional[str]]]:
+        """依 ID 順序逐批讀取 (ID, 類型, 回應 JSON, 圖片雜湊)"""
+        query = "SELECT id, response_type, payload, codec, response_data, image_hash FROM api_responses"
+        params: List[Any] = []
+        if types:
+            query += f" WHERE response_type IN ({','.join('?' for _ in types)})"
+            params.extend(types)
+        query += " ORDER BY id"
+        with self.connection() as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row_id, response_type, payload, codec, legacy, image_hash in rows:
+                    yield row_id, response_type, _decompress(payload, codec, legacy), image_hash
+
+    def list_responses(self, response_type: Optional[str] = None, since: Optional[str] = None,
+                       until: Optional[str] = None, image_hash: Optional[str] = None,
+                       limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """查詢回應的中繼資料（不讀取、不解壓 payload），依時間由新到舊"""
+        clauses, params = [], []
+        for column, op, value in (("response_type", "=", response_type), ("created_at", ">=", since),
+                                  ("created_at", "<", until), ("image_hash", "=", image_hash)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        query = f"SELECT {METADATA_COLUMNS} FROM api_responses"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        with self.connection() as conn:
+            cursor = conn.execute(query, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def get_response(self, response_id: int) -> Optional[Any]:
+        """讀取並解壓單筆回應"""
+        with self.connection() as conn:
+            row = conn.execute("SELECT payload, codec, response_data FROM api_responses WHERE id = ?",
+                               (response_id,)).fetchone()
+        if row is None:
+            return None
+        return decode_payload(*row)
+
+    def count(self) -> Dict[str, int]:
+        """各類型的回應筆數"""
+        with self.connection() as conn:
+            return dict(conn.execute(
+                "SELECT response_type, COUNT(*) FROM api_responses GROUP BY response_type").fetchall())
+
+    def purge_expired(self, retention_days: int = RESPONSE_RETENTION_DAYS) -> int:
+        """刪除超過保留天數的回應（分批刪除，避免長時間鎖住寫入），回傳刪除筆數"""
+        if retention_days <= 0:
+            return 0
+        deleted = 0
+        while True:
+            with self.transaction() as conn:
+                cursor = conn.execute(
+                    "DELETE FROM api_responses WHERE id IN (SELECT id FROM api_responses "
+                    "WHERE created_at < datetime('now', ?) LIMIT ?)",
+                    (f"-{retention_days} days", MIGRATION_BATCH))
+            deleted += cursor.rowcount
+            if cursor.rowcount < MIGRATION_BATCH:
+                break
+        return deleted
+
+    def compact(self, pages: int = 0) -> int:
+        """清除過期資料並以增量 VACUUM 釋放空頁（pages=0 表示全部），回傳刪除筆數"""
+        deleted = self.purge_expired()
+        with self.connection() as conn:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free_pages:
+                # incremental_vacuum 每執行一步只釋放一頁，以 executescript 執行到完成
+                conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});" if pages else "PRAGMA incremental_vacuum;")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            # 更新查詢規劃統計，讓歷史查詢持續選用合適的涵蓋索引
+            conn.execute("PRAGMA optimize")
+        if deleted or free_pages:
+            logger.info(f"資料庫壓縮完成: 刪除 {deleted} 筆, 釋放 {free_pages} 頁")
+        return deleted
+
+    def start_compaction(self, interval: float = RESPONSE_COMPACT_INTERVAL) -> None:
+        """啟動背景壓縮執行緒（每 interval 秒執行一次 compact）"""
+        if self._compactor is not None or interval <= 0:
+            return
+
+        def run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"資料庫壓縮失敗: {str(e)}")
+
+        self._compactor = threading.Thread(target=run, name="response-store-compaction", daemon=True)
+        self._compactor.start()
+
+    def close(self) -> None:
+        self._stop_compaction.set()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+_stores: Dict[str, ResponseStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_response_store(db_path: str = RESPONSES_DB) -> ResponseStore:
+    """取得（並快取）指定資料庫的儲存物件；結構遷移只在第一次取得時執行，並啟動背景壓縮"""
+    store = _stores.get(db_path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(db_path)
+            if store is None:
+                store = _stores[db_path] = ResponseStore(db_path)
+                store.start_compaction()
+    return store
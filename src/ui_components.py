@@ -1,6 +1,7 @@
 import streamlit as st
-from typing import Callable, Any
+from typing import Callable, Any, Tuple
 import logging
+from src.skin_metrics import METRIC_LABELS, SkinMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +53,34 @@ class UIComponents:
                 logger.error(f"Error processing uploaded file: {str(e)}")
                 st.error("處理照片時發生錯誤，請重試")
 
+    @staticmethod
+    def create_progress_reporter() -> Tuple[Callable[[int, str], None], Callable[[], None]]:
+        """建立進度條與狀態文字，回傳 (更新函式, 清除函式)；更新函式傳給 ImageAnalyzer 回報進度"""
+        placeholder = st.empty()
+        progress_bar = placeholder.progress(0)
+        status_text = st.empty()
+
+        def update(value: int, message: str):
+            progress_bar.progress(value)
+            status_text.text(message)
+
+        def clear():
+            placeholder.empty()
+            status_text.empty()
+
+        return update, clear
+
+    @staticmethod
+    def create_local_metrics_section(metrics: SkinMetrics):
+        """本地影像指標：不呼叫 API 的即時初步結果（AI 分析完成前先行顯示）"""
+        st.markdown("### 即時初步指標")
+        summary = metrics.summary()
+        for column, (metric, label) in zip(st.columns(len(METRIC_LABELS)), METRIC_LABELS.items()):
+            score = summary.get(metric)
+            column.metric(label, "-" if score is None else f"{score}/5")
+        note = "" if metrics.face_found else "；未偵測到人臉，以照片中央區域估計"
+        st.caption(f"本地影像統計（{metrics.seconds * 1000:.0f} ms），非 AI 分析，僅供參考{note}")
+
     @staticmethod
     def create_analysis_section(analysis_result: dict):
         st.header("AI 分析結果")
@@ -0,0 +1,188 @@
+import io
+import math
+import logging
+from typing import Sequence, Tuple
+from PIL import Image as PILImage
+from reportlab.lib import colors
+from reportlab.graphics.shapes import Drawing, Polygon, Line, String, Circle
+from reportlab.graphics.charts.barcharts import HorizontalBarChart
+
+logger = logging.getLogger(__name__)
+
+# 嵌入 PDF 的點陣圖統一以此解析度輸出（印刷尺寸 × DPI）
+PRINT_DPI = 150
+
+
+def radar_drawing(categories: Sequence[str], scores: Sequence[float], max_score: float = 5,
+                  size: float = 300, font_name: str = 'Helvetica') -> Drawing:
+    """以 reportlab 原生向量圖形繪製雷達圖"""
+    drawing = Drawing(size, size)
+    cx = cy = size / 2
+    radius = size / 2 - 45
+    count = len(categories)
+    if count < 3:
+        raise ValueError("Radar chart needs at least 3 categories")
+
+    angles = [math.pi / 2 - 2 * math.pi * i / count for i in range(count)]
+
+    def _point(angle: float, value: float) -> Tuple[float, float]:
+        r = radius * max(0.0, min(value, max_score)) / max_score
+        return cx + r * math.cos(angle), cy + r * math.sin(angle)
+
+    # 網格與刻度
+    for level in range(1, 6):
+        ring = []
+        for angle in angles:
+            ring.extend(_point(angle, max_score * level / 5))
+        drawing.add(Polygon(ring, fillColor=None, strokeColor=colors.lightgrey, strokeWidth=0.5))
+    for angle, label in zip(angles, categories):
+        x, y = _point(angle, max_score)
+        drawing.add(Line(cx, cy, x, y, strokeColor=colors.lightgrey, strokeWidth=0.5))
+        lx, ly = _point(angle, max_score * 1.12)
+        anchor = 'middle' if abs(lx - cx) < 1 else ('start' if lx > cx else 'end')
+        drawing.add(String(lx, ly - 4, label, fontName=font_name, fontSize=9, textAnchor=anchor,
+                           fillColor=colors.HexColor('#5E6472')))
+
+    # 理想值與目前評分
+    ideal = []
+    current = []
+    for angle, score in zip(angles, scores):
+        ideal.extend(_point(angle, max_score))
+        current.extend(_point(angle, score))
+    drawing.add(Polygon(ideal, fillColor=colors.HexColor('#D3E4F5'), fillOpacity=0.2,
+                        strokeColor=colors.HexColor('#D3E4F5'), strokeWidth=0.5))
+    drawing.add(Polygon(current, fillColor=colors.HexColor('#4A90E2'), fillOpacity=0.5,
+                        strokeColor=colors.black, strokeWidth=1))
+    for i in range(0, len(current), 2):
+        drawing.add(Circle(current[i], current[i + 1], 2, fillColor=colors.HexColor('#4A90E2'),
+                           strokeColor=None))
+    return drawing
+
+
+def priority_drawing(treatments: Sequence[str], priorities: Sequence[float], width: float = 450,
+                     font_name: str = 'Helvetica') -> Drawing:
+    """以 reportlab 原生向量圖形繪製治療方案優先級橫條圖"""
+    bar_height = 22
+    height = max(120, bar_height * len(treatments) + 50)
+    drawing = Drawing(width, height)
+
+    chart = HorizontalBarChart()
+    chart.x = 140
+    chart.y = 25
+    chart.width = width - chart.x - 20
+    chart.height = height - 40
+    # 由上至下按優先級排列
+    chart.data = [list(reversed(priorities))]
+    chart.categoryAxis.categoryNames = list(reversed(treatments))
+    chart.categoryAxis.labels.fontName = font_name
+    chart.categoryAxis.labels.fontSize = 9
+    chart.categoryAxis.labels.boxAnchor = 'e'
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.valueMax = max(5, max(priorities) if priorities else 5)
+    chart.valueAxis.valueStep = 1
+    chart.valueAxis.labels.fontName = font_name
+    chart.valueAxis.labels.fontSize = 8
+    chart.bars[0].fillColor = colors.HexColor('#4A90E2')
+    chart.bars[0].strokeColor = None
+    chart.barLabelFormat = '%d'
+    chart.barLabels.fontName = font_name
+    chart.barLabels.fontSize = 8
+    chart.barLabels.nudge = 8
+    drawing.add(chart)
+    return drawing
+
+
+def build_drawing(spec: dict, font_name: str = 'Helvetica') -> Drawing:
+    """根據圖表描述（dict）建立向量圖形"""
+    kind = spec.get('kind')
+    if kind == 'radar':
+        return radar_drawing(spec['categories'], spec['scores'], font_name=font_name)
+    if kind == 'priority':
+        return priority_drawing(spec['treatments'], spec['priorities'], font_name=font_name)
+    raise ValueError(f"Unknown chart kind: {kind}")
+
+
+def _fpdf_label(text: str, fallback: str) -> str:
+    """FPDF 內建字型僅支援 latin-1，無法編碼時改用替代標籤"""
+    try:
+        text.encode('latin-1')
+        return text
+    except UnicodeEncodeError:
+        return fallback
+
+
+def render_fpdf_chart(pdf, spec: dict, x: float, y: float, w: float) -> None:
+    """以 FPDF 原生向量指令繪製圖表（單位 mm）"""
+    kind = spec.get('kind')
+    pdf.set_font('Arial', '', 8)
+    pdf.set_text_color(94, 100, 114)
+    if kind == 'radar':
+        categories, scores = spec['categories'], spec['scores']
+        max_score = spec.get('max_score', 5)
+        cx, cy = x + w / 2, y + w / 2
+        radius = w / 2 - 25
+        count = len(categories)
+        angles = [math.pi / 2 - 2 * math.pi * i / count for i in range(count)]
+
+        def _point(angle, value):
+            r = radius * max(0.0, min(value, max_score)) / max_score
+            # FPDF 的 y 軸向下
+            return cx + r * math.cos(angle), cy - r * math.sin(angle)
+
+        pdf.set_draw_color(211, 211, 211)
+        pdf.set_line_width(0.2)
+        for level in range(1, 6):
+            pdf.polygon([_point(angle, max_score * level / 5) for angle in angles], style='D')
+        for angle, label in zip(angles, categories):
+            pdf.line(cx, cy, *_point(angle, max_score))
+            lx, ly = _point(angle, max_score * 1.15)
+            label = _fpdf_label(label, '')
+            pdf.text(lx - pdf.get_string_width(label) / 2, ly + 1, label)
+        pdf.set_fill_color(74, 144, 226)
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_line_width(0.4)
+        pdf.polygon([_point(angle, score) for angle, score in zip(angles, scores)], style='D')
+        with pdf.local_context(fill_opacity=0.5):
+            pdf.polygon([_point(angle, score) for angle, score in zip(angles, scores)], style='F')
+    elif kind == 'priority':
+        treatments, priorities = spec['treatments'], spec['priorities']
+        label_width = 50
+        bar_area = w - label_width - 10
+        value_max = max(5, max(priorities) if priorities else 5)
+        bar_height = 7
+        pdf.set_fill_color(74, 144, 226)
+        for i, (treatment, priority) in enumerate(zip(treatments, priorities)):
+            row_y = y + i * (bar_height + 3)
+            label = _fpdf_label(treatment, f"Treatment {i + 1}")
+            pdf.text(x, row_y + bar_height / 2 + 1, label)
+            bar_w = bar_area * priority / value_max
+            pdf.rect(x + label_width, row_y, bar_w, bar_height, style='F')
+            pdf.text(x + label_width + bar_w + 2, row_y + bar_height / 2 + 1, str(priority))
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+    pdf.set_text_color(0, 0, 0)
+
+
+def print_sized_image(image, width_pt: float, dpi: int = PRINT_DPI, quality: int = 85) -> Tuple[io.BytesIO, float, float]:
+    """將點陣圖縮小到印刷尺寸對應的像素，回傳 JPEG 緩衝區與印刷寬高（pt）"""
+    if isinstance(image, PILImage.Image):
+        img = image
+    else:
+        if hasattr(image, 'seek'):
+            image.seek(0)
+        img = PILImage.open(image)
+    img.load()
+
+    width_pt = min(width_pt, img.size[0])
+    height_pt = width_pt * img.size[1] / img.size[0]
+    target = (max(1, round(width_pt / 72 * dpi)), max(1, round(height_pt / 72 * dpi)))
+    if target[0] < img.size[0]:
+        img = img.resize(target, PILImage.LANCZOS)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    buffer.seek(0)
+    logger.debug(f"Downsampled image to {img.size} for {width_pt:.0f}pt print width")
+    return buffer, width_pt, height_pt
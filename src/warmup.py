@@ -0,0 +1,139 @@
+"""伺服器預熱：啟動時預先建立人臉偵測器、字型、API 客戶端與報告模板，並以樣本資料生成一份報告 PDF
+
+部署後的第一個請求不需負擔這些一次性的初始化成本；各項耗時記錄於 last_timings()，由健康檢查回報。
+
+用法（於專案根目錄）：
+    python -m src.warmup
+    python -m src.warmup --skip analysis   # 只預熱報告生成（報告工作行程）
+"""
+import io
+import time
+import logging
+import argparse
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from src.report_generator import REPORT_TITLE
+from utils.helpers import lazy_import
+
+np = lazy_import("numpy")
+openai = lazy_import("openai")
+report_engine = lazy_import("src.report_engine")
+font_registry = lazy_import("src.font_registry")
+image_analyzer = lazy_import("src.image_analyzer")
+skin_metrics = lazy_import("src.skin_metrics")
+
+logger = logging.getLogger(__name__)
+
+# 預熱項目群組：分析（人臉偵測、API 客戶端）與報告（字型、模板、PDF）
+ANALYSIS = "analysis"
+REPORT = "report"
+
+# 樣本報告內容：含評分與治療建議，使雷達圖與優先級圖都會繪製
+SAMPLE_ANALYSIS = "### 額頭\n皮膚狀況 4/5 皺紋 3/5\n### 下巴\n皮膚狀況 2/5 色斑 3/5 緊致度 3/5"
+SAMPLE_REPORT = "2. 推薦的醫美治療方案\n1. **玻尿酸填充**：眼周\n2. **肉毒素**：額頭\n3. 預期效果\n"
+
+WarmUpStep = Tuple[str, Callable[[], Any]]
+
+_timings: Dict[str, Optional[float]] = {}
+_timings_lock = threading.Lock()
+
+
+def sample_photo(size: Tuple[int, int] = (320, 400)) -> io.BytesIO:
+    """純色 JPEG 樣本照片（走與上傳照片相同的縮圖與壓縮流程）"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (224, 190, 170)).save(buffer, format="JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+def warm_face_detector() -> None:
+    # 載入 dlib 並執行一次偵測（偵測器依執行緒建立，其他執行緒第一次偵測時各自建立）
+    image_analyzer.get_face_detector()(np.zeros((64, 64), dtype=np.uint8))
+
+
+def warm_skin_metrics() -> None:
+    # 載入 OpenCV 並執行一次本地指標計算
+    skin_metrics.compute_metrics(sample_photo().getvalue())
+
+
+def warm_openai_client() -> None:
+    # 建立客戶端會載入 httpx 並建立 SSL context；不會發出請求
+    openai.OpenAI(api_key="warm-up", base_url="http://localhost")
+
+
+def render_sample_pdfs(title: str = REPORT_TITLE, layouts: Optional[Sequence[str]] = None) -> None:
+    """以樣本資料生成各版面的報告 PDF（向量圖表、照片壓縮與字型子集化）"""
+    for layout in layouts or list(report_engine.LAYOUTS):
+        data = report_engine.ReportData(SAMPLE_REPORT, analysis_text=SAMPLE_ANALYSIS, photo=sample_photo(),
+                                        title=title)
+        pdf_bytes, _ = report_engine.render_with_budget(layout, data)
+        if not pdf_bytes:
+            raise RuntimeError(f"{layout} 樣本報告生成失敗")
+
+
+def default_steps(groups: Sequence[str] = (ANALYSIS, REPORT), title: str = REPORT_TITLE,
+                  analyzer: Optional[Callable[[], Any]] = None) -> List[WarmUpStep]:
+    """預設的預熱項目；analyzer 為建立分析器的函式（例如 AnalysisService 的 analyzer 屬性）"""
+    steps: List[WarmUpStep] = []
+    if ANALYSIS in groups:
+        steps.append(("face_detector", warm_face_detector))
+        steps.append(("skin_metrics", warm_skin_metrics))
+        steps.append(("openai", warm_openai_client))
+        if analyzer is not None:
+            steps.append(("analyzer", analyzer))
+    if REPORT in groups:
+        steps.append(("fonts", font_registry.get_report_font))
+        steps.append(("report_template", lambda: report_engine.warm_up(title)))
+        steps.append(("sample_pdf", lambda: render_sample_pdfs(title)))
+    return steps
+
+
+def run_warm_up(steps: Optional[Sequence[WarmUpStep]] = None) -> Dict[str, Optional[float]]:
+    """依序執行預熱項目，回傳各項耗時（秒）；失敗的項目記錄錯誤後以 None 表示，不中斷其他項目"""
+    timings: Dict[str, Optional[float]] = {}
+    for name, step in default_steps() if steps is None else steps:
+        start = time.perf_counter()
+        try:
+            step()
+            timings[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            logger.error(f"預熱項目 {name} 失敗: {str(e)}", exc_info=True)
+            timings[name] = None
+        with _timings_lock:
+            _timings[name] = timings[name]
+
+    total = sum(seconds for seconds in timings.values() if seconds is not None)
+    summary = ", ".join(f"{name} {'失敗' if seconds is None else f'{seconds:.2f}s'}"
+                        for name, seconds in timings.items())
+    logger.info(f"預熱完成，共 {total:.2f} 秒: {summary}")
+    return timings
+
+
+def start_warm_up(steps: Optional[Sequence[WarmUpStep]] = None) -> threading.Thread:
+    """在背景執行緒預熱，不延遲伺服器開始接受請求"""
+    thread = threading.Thread(target=run_warm_up, args=(steps,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def last_timings() -> Dict[str, Optional[float]]:
+    """此行程已完成的預熱項目耗時（秒），供健康檢查回報"""
+    with _timings_lock:
+        return dict(_timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--skip", action="append", default=[], choices=(ANALYSIS, REPORT),
+                        help="略過的預熱群組（可重複指定）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    groups = [group for group in (ANALYSIS, REPORT) if group not in args.skip]
+    for name, seconds in run_warm_up(default_steps(groups)).items():
+        print(f"{name:<16} {'failed' if seconds is None else f'{seconds * 1000:8.1f} ms'}")
+
+
+if __name__ == "__main__":
+    main()
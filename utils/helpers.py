@@ -1,17 +1,48 @@
 import io
 import base64
 import logging
-from typing import Optional
+import importlib
+import threading
+from typing import Any, Callable, Optional
 from PIL import Image, ImageFile
-import json
-import os
 from datetime import datetime
+from src.segment_log import get_segment_log, format_locator
 
 # Allow Pillow to load truncated images
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 logger = logging.getLogger(__name__)
 
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name: str, on_load: Optional[Callable[[Any], None]] = None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    # 載入後的一次性設定（例如 matplotlib 字型）
+                    if self._on_load is not None:
+                        self._on_load(module)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}' ({'loaded' if self._module is not None else 'not loaded'})>"
+
+def lazy_import(name: str, on_load: Optional[Callable[[Any], None]] = None) -> Any:
+    """Defer a heavy import (dlib, cv2, matplotlib, reportlab, provider SDKs) until the module is first used."""
+    return LazyModule(name, on_load)
+
 def encode_image_to_base64(image_file: io.BytesIO) -> str:
     """Convert an image file to base64 string."""
     try:
@@ -20,33 +51,39 @@ def encode_image_to_base64(image_file: io.BytesIO) -> str:
         logger.error(f"Error encoding image to base64: {str(e)}")
         raise
 
-def save_api_response(response_type: str, response_data) -> Optional[str]:
-    """Save API response to corresponding folder."""
+def response_to_dict(response_data):
+    """Convert a provider response (pydantic model or plain object) to JSON-serializable data."""
+    # 處理不同類型的響應對象
+    if hasattr(response_data, 'model_dump'):
+        # Pydantic v2 方法
+        return response_data.model_dump()
+    if hasattr(response_data, 'dict'):
+        # Pydantic v1 方法
+        return response_data.dict()
+    # 普通字典或其他可序列化物件
+    return response_data
+
+def response_content(response_data) -> Optional[str]:
+    """Extract the model output text from a stored chat completion response."""
+    if isinstance(response_data, str):
+        return response_data
+    if isinstance(response_data, dict):
+        choices = response_data.get("choices") or []
+        if choices:
+            return (choices[0].get("message") or {}).get("content")
+        # 已整理過的分析結果（main.py 格式）
+        return response_data.get("result") or response_data.get("grok_analysis")
+    return None
+
+def save_api_response(response_type: str, response_data, created_at: Optional[datetime] = None,
+                      image_hash: Optional[str] = None) -> Optional[str]:
+    """Append API response to the segmented JSONL response log; returns its locator (segment path#record)."""
     try:
-        # Create directory if it doesn't exist
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        directory = f"temp/{response_type}"
-        os.makedirs(directory, exist_ok=True)
-        
-        # Save response
-        filename = f"{directory}/{timestamp}.json"
-        
-        # 處理不同類型的響應對象
-        if hasattr(response_data, 'model_dump'):
-            # Pydantic v2 方法
-            data_to_save = response_data.model_dump()
-        elif hasattr(response_data, 'dict'):
-            # Pydantic v1 方法
-            data_to_save = response_data.dict()
-        else:
-            # 普通字典或其他可序列化物件
-            data_to_save = response_data
-            
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, ensure_ascii=False, indent=2)
-            
-        logger.info(f"Saved {response_type} response to {filename}")
-        return filename
+        log = get_segment_log()
+        locator = log.append(response_type, response_to_dict(response_data), created_at, image_hash)
+        location = format_locator(log.directory, locator)
+        logger.info(f"Saved {response_type} response to {location}")
+        return location
     except Exception as e:
         logger.error(f"保存API响应失败: {str(e)}")
         return None